@@ -0,0 +1,476 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+
+"""
+Stand-in for the Swarm manager API used by the benchmarks.
+
+It emulates the endpoints exercised by the command classes with a
+generated cluster of configurable size, and can inject latency in
+every response to reproduce a remote manager. It also answers
+/v2/_catalog as a registry holding the images of the cluster, and
+can stand in for the engines of the nodes (--node-addr) to save
+and load images. Builds consume their context and answer steps of
+a made-up Dockerfile, execs echo their command over an upgraded
+connection.
+"""
+
+from __future__ import print_function
+import io
+import re
+import sys
+import json
+import time
+import random
+import base64
+import struct
+import tarfile
+import hashlib
+import argparse
+import threading
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import urlparse, parse_qs
+
+
+class Cluster(object):
+
+    def __init__(self, containers=1000, images=200, nodes=None, running_ratio=0.8, log_lines=1000, seed=0,
+                 node_addr=None, image_size=16 << 20):
+        rand = random.Random(seed)
+        self.node_addr = node_addr
+        self.image_size = image_size
+        self.nodes = ['node{n:04d}'.format(n=n) for n in range(nodes or max(1, containers // 50))]
+        self.images = []
+        for i in range(images):
+            image_id = 'sha256:' + hashlib.sha256(str(i).encode('utf8')).hexdigest()
+            self.images.append({
+                'Id': image_id,
+                'ParentId': '',
+                'RepoTags': ['registry.example.com/app{i}:{tag}'.format(i=i, tag=tag) for tag in ('latest', '1.0')],
+                'RepoDigests': None,
+                'Created': 1480000000 + i,
+                'Size': rand.randint(1 << 20, 1 << 30),
+                'VirtualSize': rand.randint(1 << 20, 1 << 30),
+                'Labels': {},
+            })
+        self.containers = []
+        self.by_ref = {}
+        now = int(time.time())
+        for i in range(containers):
+            node = self.nodes[i % len(self.nodes)]
+            image = self.images[i % len(self.images)]['RepoTags'][0]
+            running = rand.random() < running_ratio
+            container_id = hashlib.sha256('c{i}'.format(i=i).encode('utf8')).hexdigest()
+            name = 'svc{s}-{i}'.format(s=i % 97, i=i)
+            container = {
+                'Id': container_id,
+                'Names': ['/{node}/{name}'.format(node=node, name=name)],
+                'Image': image,
+                'ImageID': self.images[i % len(self.images)]['Id'],
+                'Command': '/docker-entrypoint.sh run --port 8080',
+                'Created': now - rand.randint(60, 86400 * 30),
+                'Ports': [],
+                'Labels': {'service': 'svc{s}'.format(s=i % 97)},
+                'State': 'running' if running else 'exited',
+                'Status': 'Up 2 days' if running else 'Exited (0) 3 hours ago',
+                'HostConfig': {'NetworkMode': 'default'},
+            }
+            self.containers.append(container)
+            self.by_ref[container_id] = container
+            self.by_ref[name] = container
+        self.log_lines = log_lines
+        # listings are serialized once, a real manager answers from its own cache too
+        self._listing = {
+            True: json.dumps(self.containers).encode('utf8'),
+            False: json.dumps([c for c in self.containers if c['State'] == 'running']).encode('utf8'),
+        }
+        self._images = json.dumps(self.images).encode('utf8')
+
+    def listing(self, show_all):
+        return self._listing[show_all]
+
+    def find(self, ref):
+        container = self.by_ref.get(ref)
+        if container is None and len(ref) >= 12:
+            for container_id, container in self.by_ref.items():
+                if container_id.startswith(ref):
+                    return container
+            return None
+        return container
+
+    def info(self):
+        systemstatus = [['Role', 'primary'], ['Strategy', 'spread'], ['Nodes', str(len(self.nodes))]]
+        for i, node in enumerate(self.nodes):
+            systemstatus.extend([
+                [' {node}'.format(node=node), self.node_addr or '10.0.{a}.{b}:2375'.format(a=i // 250, b=i % 250 + 1)],
+                [u'  └ Status', 'Healthy'],
+                [u'  └ Containers', '{n}'.format(n=len(self.containers) // len(self.nodes))],
+                [u'  └ Reserved CPUs', '0 / 8'],
+                [u'  └ Reserved Memory', '0 B / 16 GiB'],
+            ])
+        return {
+            'Containers': len(self.containers),
+            'Images': len(self.images),
+            'DriverStatus': None,
+            'SystemStatus': systemstatus,
+            'NCPU': 8 * len(self.nodes),
+            'MemTotal': (16 << 30) * len(self.nodes),
+            'Name': 'fakeswarm',
+        }
+
+
+class FakeSwarmHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, do not let them wait for a delayed ack
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, code, body=b'', content_type='application/json'):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf8')
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_chunked(self, chunks, content_type='application/json'):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for chunk in chunks:
+            self.wfile.write('{size:x}\r\n'.format(size=len(chunk)).encode('ascii') + chunk + b'\r\n')
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _read_body(self, keep=False):
+        """
+        Consume the request body, return its size and the body itself if keep
+        """
+        length = int(self.headers.get('Content-Length') or 0)
+        chunks = []
+        if self.headers.get('Transfer-Encoding') == 'chunked':
+            length = 0
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                chunk = self.rfile.read(size + 2)[:size]
+                if keep:
+                    chunks.append(chunk)
+                length += size
+                if size == 0:
+                    break
+        elif length:
+            chunks.append(self.rfile.read(length))
+        return length, b''.join(chunks) if keep else None
+
+    def _archive(self, container, method, path, body):
+        """
+        Files put into a container are kept in memory, other paths are directories of two files
+        """
+        files = self.server.files.setdefault(container['Id'], {})
+        path = '/' + path.strip('/')
+        if method == 'PUT':
+            with tarfile.open(fileobj=io.BytesIO(body)) as tar:
+                for member in tar:
+                    data = tar.extractfile(member).read() if member.isfile() else None
+                    files['{path}/{name}'.format(path=path.rstrip('/'), name=member.name)] = data
+            return self._send(200)
+        name = path.rsplit('/', 1)[-1] or '/'
+        children = dict((key, data) for key, data in files.items() if key.startswith(path + '/'))
+        is_dir = files[path] is None if path in files else ('.' not in name or bool(children))
+        # paths named missing* do not exist
+        if name.startswith('missing') and not children and path not in files:
+            return self._send(404, {'message': 'Could not find the file {path} in container'.format(path=path)})
+        stat = {'name': name, 'size': 0 if is_dir else len(files.get(path) or b''),
+                'mode': (1 << 31 | 0o755) if is_dir else 0o644, 'mtime': '2017-01-01T00:00:00Z', 'linkTarget': ''}
+        headers = {'X-Docker-Container-Path-Stat': base64.b64encode(json.dumps(stat).encode('utf8')).decode('ascii')}
+        if method == 'HEAD':
+            self.send_response(200)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode='w') as tar:
+            entries = children or ({path: files[path]} if path in files and not is_dir else
+                                   {path + '/a.txt': b'a\n', path + '/b.txt': b'b\n'} if is_dir else {path: b'data\n'})
+            if is_dir:
+                info = tarfile.TarInfo(name)
+                info.type, info.mode = tarfile.DIRTYPE, 0o755
+                tar.addfile(info)
+            for key, data in sorted(entries.items()):
+                info = tarfile.TarInfo(name + key[len(path):] if is_dir else name)
+                if data is None:
+                    info.type, info.mode = tarfile.DIRTYPE, 0o755
+                    tar.addfile(info)
+                else:
+                    info.size = len(data)
+                    tar.addfile(info, io.BytesIO(data))
+        body = buf.getvalue()
+        self.send_response(200)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Type', 'application/x-tar')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _image_archive(self, name):
+        # compressible like a real layer, without holding it in memory
+        block = hashlib.sha256(name.encode('utf8')).hexdigest().encode('ascii') * 1024
+        for offset in range(0, self.server.cluster.image_size, len(block)):
+            yield block[:self.server.cluster.image_size - offset]
+
+    def _progress(self, name, action):
+        layers = ['{layer:012x}'.format(layer=layer) for layer in range(5)]
+        for layer in layers:
+            for current in range(0, 101, 10):
+                yield json.dumps({
+                    'status': action,
+                    'id': layer,
+                    'progressDetail': {'current': current, 'total': 100},
+                    'progress': '[{bar:<50}] {current}B/100B'.format(bar='=' * (current // 2), current=current),
+                }).encode('utf8') + b'\r\n'
+        yield json.dumps({'status': '{name}: {action} complete'.format(name=name, action=action)}).encode('utf8') + b'\r\n'
+
+    def _build_output(self, tag, dockerfile):
+        """
+        Output of a build of 6 steps, the first ones cached, steps take up to 0.2s
+        Dockerfiles named *broken* fail at their last step
+        """
+        rand = random.Random(tag)
+        steps = 6
+        cached = rand.randint(0, 3)
+        layer = '{layer:012x}'.format(layer=rand.getrandbits(48))
+        for step in range(1, steps + 1):
+            yield json.dumps({'stream': 'Step {step}/{steps} : RUN make step{step}\n'.format(step=step, steps=steps)}).encode('utf8') + b'\r\n'
+            if step <= cached:
+                lines = [' ---> Using cache\n']
+            else:
+                lines = [' ---> Running in {container:012x}\n'.format(container=rand.getrandbits(48))]
+                time.sleep(rand.uniform(0, 0.2))
+                if step == steps and 'broken' in (dockerfile or ''):
+                    yield json.dumps({'stream': lines[0]}).encode('utf8') + b'\r\n'
+                    yield json.dumps({'errorDetail': {'code': 2, 'message': 'make: *** [step6] Error 2'},
+                                      'error': 'The command \'/bin/sh -c make step6\' returned a non-zero code: 2'}).encode('utf8') + b'\r\n'
+                    return
+            layer = '{layer:012x}'.format(layer=rand.getrandbits(48))
+            lines.append(' ---> {layer}\n'.format(layer=layer))
+            for line in lines:
+                yield json.dumps({'stream': line}).encode('utf8') + b'\r\n'
+        yield json.dumps({'stream': 'Successfully built {layer}\n'.format(layer=layer)}).encode('utf8') + b'\r\n'
+
+    def _send_etag(self, body, headers=()):
+        """
+        Answer 304 when the client already has body, as registries do with If-None-Match
+        """
+        body = json.dumps(body).encode('utf8')
+        etag = '"{digest}"'.format(digest=hashlib.sha1(body).hexdigest())
+        if self.headers.get('If-None-Match') == etag:
+            body, code = b'', 304
+        else:
+            code = 200
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        for key, value in headers:
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _catalog(self, query):
+        """
+        /v2/_catalog of a registry holding the images of the cluster, paginated by n and last
+        """
+        repositories = sorted(set((tag.split('/', 1)[1].split(':')[0] for image in self.server.cluster.images
+                                                                       for tag in image['RepoTags'])))
+        n = int(query.get('n', ['100'])[0])
+        last = query.get('last', [None])[0]
+        if last is not None:
+            repositories = [repository for repository in repositories if repository > last]
+        page, headers = repositories[:n], []
+        if len(repositories) > n:
+            headers.append(('Link', '</v2/_catalog?last={last}&n={n}>; rel="next"'.format(last=page[-1], n=n)))
+        return self._send_etag({'repositories': page}, headers)
+
+    def _logs(self, container):
+        frames = []
+        for line in range(self.server.cluster.log_lines):
+            data = '{name} line {line} lorem ipsum dolor sit amet\n'.format(name=container['Names'][0],
+                                                                             line=line).encode('utf8')
+            frames.append(struct.pack('>BxxxL', 1, len(data)) + data)
+        return b''.join(frames)
+
+    def _exec_start(self, exec_id):
+        """
+        Hijack the connection like an engine does, the first frame goes out in the same packet as the headers
+        """
+        container, command = self.server.execs[exec_id]
+        frames = []
+        for stream, data in ((1, '{name}: {command}\n'.format(name=container['Names'][0], command=' '.join(command))),
+                             (2, 'done\n')):
+            data = data.encode('utf8')
+            frames.append(struct.pack('>BxxxL', stream, len(data)) + data)
+        self.wfile.write(b'HTTP/1.1 101 UPGRADED\r\nContent-Type: application/vnd.docker.raw-stream\r\n'
+                         b'Connection: Upgrade\r\nUpgrade: tcp\r\n\r\n' + frames[0])
+        self.wfile.flush()
+        time.sleep(0.05)
+        for frame in frames[1:]:
+            self.wfile.write(frame)
+        self.close_connection = True
+
+    def _handle(self, method):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+        if server.latency:
+            time.sleep(server.latency + random.uniform(0, server.jitter))
+        url = urlparse(self.path)
+        path = re.sub(r'^/v[0-9.]+/', '/', url.path)
+        query = parse_qs(url.query)
+        cluster = server.cluster
+        body_size, body = 0, None
+        if method in ('POST', 'PUT'):
+            body_size, body = self._read_body(keep=path.endswith('/archive') or path.endswith('/exec'))
+        if server.error_rate and random.random() < server.error_rate:
+            return self._send(503, {'message': 'Unable to reach the swarm manager'})
+        if path == '/_ping':
+            return self._send(200, b'OK', 'text/plain')
+        if path == '/version':
+            return self._send(200, {'Version': 'swarm/1.2.5', 'ApiVersion': '1.22', 'GoVersion': 'go1.7.1',
+                                    'GitCommit': '27968ed', 'Os': 'linux', 'Arch': 'amd64', 'KernelVersion': '4.4.0'})
+        if path == '/info':
+            return self._send(200, cluster.info())
+        if path == '/containers/json':
+            return self._send(200, cluster.listing(query.get('all', ['0'])[0] not in ('0', 'False', 'false')))
+        if path == '/images/json':
+            return self._send(200, cluster._images)
+        if path == '/images/search':
+            term = query.get('term', [''])[0]
+            return self._send_etag([{'name': 'library/{term}{i}'.format(term=term, i=i),
+                                     'description': 'Image {i} matching {term}, built for the benchmarks'.format(i=i, term=term),
+                                     'star_count': 10 * i, 'is_official': i == 0, 'is_automated': i % 2 == 1}
+                                    for i in range(25)])
+        if url.path == '/v2/_catalog':
+            return self._catalog(query)
+        if path == '/images/create':
+            name = query.get('fromImage', [''])[0]
+            return self._send_chunked(self._progress(name, 'Pulling'))
+        if path == '/build':
+            return self._send_chunked(self._build_output(query.get('t', [''])[0], query.get('dockerfile', [''])[0]))
+        if path == '/images/load':
+            return self._send(200, {'stream': 'Loaded {size} bytes\n'.format(size=body_size)})
+        match = re.match(r'^/images/(.+)/get$', path)
+        if match:
+            return self._send_chunked(self._image_archive(match.group(1)), 'application/x-tar')
+        match = re.match(r'^/images/(.+)/push$', path)
+        if match:
+            return self._send_chunked(self._progress(match.group(1), 'Pushing'))
+        match = re.match(r'^/exec/([^/]+)/(start|json)$', path)
+        if match:
+            if match.group(1) not in server.execs:
+                return self._send(404, {'message': 'No such exec instance: {ref}'.format(ref=match.group(1))})
+            if match.group(2) == 'start':
+                return self._exec_start(match.group(1))
+            container, command = server.execs[match.group(1)]
+            return self._send(200, {'ID': match.group(1), 'Running': False, 'ExitCode': int('false' in command)})
+        match = re.match(r'^/containers/([^/]+)(?:/([a-z]+))?$', path)
+        if match:
+            container = cluster.find(match.group(1))
+            if container is None:
+                return self._send(404, {'message': 'No such container: {ref}'.format(ref=match.group(1))})
+            action = match.group(2)
+            if action == 'archive':
+                return self._archive(container, method, query.get('path', ['/'])[0], body)
+            if action == 'json':
+                return self._send(200, {'Id': container['Id'],
+                                        'Name': '/' + container['Names'][0].split('/')[-1],
+                                        'Config': {'Tty': False, 'Image': container['Image'], 'Labels': container['Labels']},
+                                        'State': {'Status': container['State'], 'Running': container['State'] == 'running'},
+                                        'RestartCount': 0})
+            if action == 'top':
+                ps_args = query.get('ps_args', ['-ef'])[0]
+                return self._send(200, {'Titles': ['UID', 'PID', '%CPU', 'CMD'],
+                                        'Processes': [['root', str(pid), '{cpu:.1f}'.format(cpu=pid / 10.0),
+                                                       'ps {ps_args}'.format(ps_args=ps_args)] for pid in (1, 7)]})
+            if action == 'exec' and method == 'POST':
+                with server.lock:
+                    exec_id = hashlib.sha256('e{n}'.format(n=len(server.execs)).encode('utf8')).hexdigest()
+                    server.execs[exec_id] = (container, json.loads(body.decode('utf8'))['Cmd'])
+                return self._send(201, {'Id': exec_id})
+            if action == 'logs':
+                return self._send(200, self._logs(container), 'application/vnd.docker.raw-stream')
+            if method == 'POST' and action in ('start', 'stop', 'restart', 'kill'):
+                return self._send(204)
+            if method == 'DELETE' and action is None:
+                return self._send(204)
+        return self._send(404, {'message': 'page not found'})
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_HEAD(self):
+        self._handle('HEAD')
+
+
+class FakeSwarmServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, address, cluster, latency=0, jitter=0, error_rate=0):
+        BaseHTTPServer.HTTPServer.__init__(self, address, FakeSwarmHandler)
+        self.cluster = cluster
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = 0
+        self.lock = threading.Lock()
+        # container id -> {path: content, None for directories} of files copied into containers
+        self.files = {}
+        # exec id -> (container, command) of execs created
+        self.execs = {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a fake Swarm API for benchmarks')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=23750)
+    parser.add_argument('--containers', type=int, default=1000, help='Number of containers (Default 1000)')
+    parser.add_argument('--images', type=int, default=200, help='Number of images (Default 200)')
+    parser.add_argument('--nodes', type=int, help='Number of nodes (Default one per 50 containers)')
+    parser.add_argument('--log-lines', type=int, default=1000, help='Lines returned by container logs (Default 1000)')
+    parser.add_argument('--latency', type=float, default=0, help='Seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0, help='Random seconds added on top of latency')
+    parser.add_argument('--error-rate', type=float, default=0, help='Fraction of requests answered with 503')
+    parser.add_argument('--node-addr', help='Address every node advertises in info, e.g. this server to emulate engines')
+    parser.add_argument('--image-size', type=int, default=16, help='MiB of an archive of `docker save` (Default 16)')
+    args = parser.parse_args()
+    cluster = Cluster(containers=args.containers, images=args.images, nodes=args.nodes, log_lines=args.log_lines,
+                      node_addr=args.node_addr, image_size=args.image_size << 20)
+    server = FakeSwarmServer((args.host, args.port), cluster, latency=args.latency, jitter=args.jitter,
+                             error_rate=args.error_rate)
+    print('Serving fake swarm api on tcp://{host}:{port}'.format(host=args.host, port=server.server_address[1]))
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
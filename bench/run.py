@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+
+"""
+Run the command classes against a fake Swarm API and record timings.
+
+    python bench/run.py --containers 1000 10000 --latency 0 0.02 -o results.json
+    python bench/run.py --containers 1000 --baseline results.json
+
+Every scenario runs against a fresh fake cluster served by bench/fakeswarm.py,
+with $HOME pointing to a temporary directory whose swarm config uses it.
+"""
+
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+from contextlib import contextmanager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lib'))
+
+import swarm
+from swarm.client import SwarmClient
+from swarm.trace import Tracer
+
+
+# (scenario name, command class, args, kwargs)
+SCENARIOS = (
+    ('containers', swarm.Containers, (), {'show_all': True}),
+    ('containers-running', swarm.Containers, (), {'show_all': False}),
+    ('images', swarm.Images, (), {'show_all': False}),
+    ('logs', swarm.Logs, ('svc0-0',), {'timestamps': False, 'tail': 'all', 'since': None, 'follow': False}),
+    ('push', swarm.Push, ('registry.example.com/app0',), {'tag': 'latest'}),
+    ('pull', swarm.Pull, ([('registry.example.com/app0', 'latest')],), {}),
+    ('start', swarm.StartContainer, (('svc1-*',),), {}),
+    ('stop', swarm.StopContainer, (('svc1-*',), 10), {}),
+)
+
+
+@contextmanager
+def fake_swarm(containers, latency, jitter, log_lines, error_rate=0):
+    """
+    Start bench/fakeswarm.py on a free port and point $HOME at a config using it
+    """
+    command = [sys.executable, os.path.join(ROOT, 'bench', 'fakeswarm.py'), '--port', '0',
+               '--containers', str(containers), '--latency', str(latency), '--jitter', str(jitter),
+               '--log-lines', str(log_lines), '--error-rate', str(error_rate)]
+    server = subprocess.Popen(command, stdout=subprocess.PIPE)
+    home = tempfile.mkdtemp(prefix='swarm-bench-')
+    environ = os.environ.get('HOME')
+    try:
+        # the server prints its address once it is listening
+        url = server.stdout.readline().decode('utf8').split()[-1]
+        os.mkdir(os.path.join(home, '.swarm'))
+        with open(os.path.join(home, '.swarm', 'config.json'), 'w') as fp:
+            fp.write(json.dumps({'apis': {'bench': url}, 'current': 'bench', 'version': '1.22'}, indent=4))
+        os.environ['HOME'] = home
+        yield url
+    finally:
+        if environ is not None:
+            os.environ['HOME'] = environ
+        server.terminate()
+        server.wait()
+        shutil.rmtree(home, ignore_errors=True)
+
+
+def measure(command_class, args, kwargs, repeat):
+    runs, requests, received = [], 0, 0
+    devnull = open(os.devnull, 'w')
+    for _ in range(repeat):
+        tracer = Tracer()
+        SwarmClient.tracer = tracer
+        # command objects keep state between calls, build a fresh one for every run
+        command = command_class()
+        stdout, sys.stdout = sys.stdout, devnull
+        start = time.time()
+        try:
+            command(*args, **kwargs)
+        finally:
+            sys.stdout = stdout
+            SwarmClient.tracer = None
+        runs.append(time.time() - start)
+        requests = len(tracer.requests)
+        received = sum((record['bytes'] or 0) for record in tracer.requests)
+    devnull.close()
+    runs.sort()
+    return {
+        'runs': runs,
+        'min': runs[0],
+        'median': runs[len(runs)//2],
+        'requests': requests,
+        'bytes': received,
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Print median ratio against baseline, return number of regressions
+    """
+    key = lambda result: (result['scenario'], result['containers'], result['latency'])
+    previous = dict((key(result), result) for result in baseline['results'])
+    regressions = 0
+    print('\n{0:<20}{1:>12}{2:>10}{3:>12}{4:>12}{5:>10}'.format('SCENARIO', 'CONTAINERS', 'LATENCY',
+                                                               'BASELINE', 'CURRENT', 'RATIO'))
+    for result in results:
+        old = previous.get(key(result))
+        if old is None:
+            continue
+        ratio = result['median'] / old['median'] if old['median'] else float('inf')
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        elif ratio < 1 - threshold:
+            flag = '  improved'
+        print('{0:<20}{1:>12}{2:>10}{3:>11.1f}ms{4:>10.1f}ms{5:>10.2f}{6}'.format(result['scenario'],
+                                                                               result['containers'],
+                                                                               result['latency'],
+                                                                               old['median']*1000,
+                                                                               result['median']*1000,
+                                                                               ratio, flag))
+    return regressions
+
+
+def main():
+    names = [scenario[0] for scenario in SCENARIOS]
+    parser = argparse.ArgumentParser(description='Benchmark swarm-python against a fake Swarm API')
+    parser.add_argument('-c', '--containers', type=int, nargs='+', default=[1000],
+                        help='Cluster sizes to run every scenario against (Default 1000)')
+    parser.add_argument('-l', '--latency', type=float, nargs='+', default=[0.0],
+                        help='Seconds injected in every response (Default 0)')
+    parser.add_argument('--jitter', type=float, default=0, help='Random seconds added on top of latency')
+    parser.add_argument('--error-rate', type=float, default=0, help='Fraction of requests answered with 503 (Default 0)')
+    parser.add_argument('--log-lines', type=int, default=10000, help='Lines returned by container logs (Default 10000)')
+    parser.add_argument('-n', '--repeat', type=int, default=5, help='Runs per scenario (Default 5)')
+    parser.add_argument('-s', '--scenario', nargs='+', choices=names, default=names, help='Scenarios to run (Default all)')
+    parser.add_argument('-o', '--output', help='Write results to file as JSON')
+    parser.add_argument('-b', '--baseline', help='Compare medians against results of a previous run')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Ratio above which a slower median is reported as regression (Default 0.2)')
+    args = parser.parse_args()
+
+    scenarios = [scenario for scenario in SCENARIOS if scenario[0] in args.scenario]
+    results = []
+    print('{0:<20}{1:>12}{2:>10}{3:>12}{4:>12}{5:>10}{6:>14}'.format('SCENARIO', 'CONTAINERS', 'LATENCY',
+                                                                     'MIN', 'MEDIAN', 'REQUESTS', 'BYTES'))
+    for containers in args.containers:
+        for latency in args.latency:
+            with fake_swarm(containers, latency, args.jitter, args.log_lines, args.error_rate):
+                for name, command_class, call_args, call_kwargs in scenarios:
+                    result = measure(command_class, call_args, call_kwargs, args.repeat)
+                    result.update({'scenario': name, 'containers': containers, 'latency': latency})
+                    results.append(result)
+                    print('{0:<20}{1:>12}{2:>10}{3:>10.1f}ms{4:>10.1f}ms{5:>10}{6:>14}'.format(name, containers, latency,
+                                                                                              result['min']*1000,
+                                                                                              result['median']*1000,
+                                                                                              result['requests'],
+                                                                                              result['bytes']))
+                    sys.stdout.flush()
+    report = {
+        'meta': {
+            'time': time.time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+            'jitter': args.jitter,
+            'error_rate': args.error_rate,
+            'log_lines': args.log_lines,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as fp:
+            fp.write(json.dumps(report, indent=4))
+    if args.baseline:
+        with open(args.baseline, 'r') as fp:
+            baseline = json.load(fp)
+        if compare(results, baseline, args.threshold):
+            exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,10 +4,17 @@ from swarm.command import SwarmCommand
 from swarm.daemon import Version, Info, Login
 from swarm.container import Containers, StartContainer, StopContainer, RestartContainer,\
                             RemoveContainer, CreateContainer, InspectContainer, Top, Exec,\
-                            Kill, Rename, Logs
-from swarm.image import Images, RemoveImage, Tag, InspectImage, Pull, Push, Build, Search
+                            Kill, Rename, Logs, RollingRestart, ExecAll, Stats, Copy
+from swarm.image import Images, RemoveImage, Tag, InspectImage, Pull, Push, CopyImage, Build, Search
+from swarm.deploy import Apply
+from swarm.exporter import Exporter
+from swarm.batch import Batch
+from swarm.serve import Serve
+from swarm.inventory import Snapshot, Diff
 
 
 __all__ = ('SwarmApi', 'SwarmCommand', 'SwarmArgumentParser', 'Version', 'Info', 'Login', 'Containers', 'StartContainer',\
            'StopContainer', 'RestartContainer', 'RemoveContainer', 'CreateContainer', 'InspectContainer', 'Top', 'Exec',\
-           'Kill', 'Rename', 'Images', 'Logs', 'RemoveImage', 'Tag', 'InspectImage', 'Pull', 'Push', 'Build', 'Search')
\ No newline at end of file
+           'Kill', 'Rename', 'Images', 'Logs', 'RemoveImage', 'Tag', 'InspectImage', 'Pull', 'Push', 'CopyImage', 'Build', 'Search',\
+           'Apply', 'RollingRestart', 'ExecAll', 'Stats', 'Copy',\
+           'Exporter', 'Batch', 'Serve', 'Snapshot', 'Diff')
\ No newline at end of file
@@ -0,0 +1,492 @@
+# -*- coding: utf8 -*-
+
+"""
+Asyncio counterpart of SwarmClient, requires Python >= 3.7
+
+It speaks HTTP/1.1 to the Docker Remote API on a single event loop,
+keeping idle connections alive between requests.
+"""
+
+import ssl
+import sys
+import json
+import time
+import struct
+import asyncio
+import requests
+from urllib.parse import urlparse, urlencode, quote
+from docker import errors
+from swarm.client import SwarmClient
+from swarm.resilience import RETRY_STATUS, CircuitBreaker, ConnectError, is_idempotent, is_unsent
+from swarm.snapshot import ContainerSnapshot
+from swarm.utils import pyprint
+
+
+class AsyncResponse(object):
+    """
+    Response of AsyncSwarmClient.request, the body is read on demand.
+    status_code, reason and content mirror requests.Response so that
+    docker.errors.APIError can be built from it.
+    """
+
+    def __init__(self, connection, status_code, reason, headers, release):
+        self._connection = connection
+        self._release = release
+        self._buffer = b''
+        self._done = False
+        self.status_code = status_code
+        self.reason = reason
+        # header names are lower-cased
+        self.headers = headers
+        self.content = b''
+        self._chunked = headers.get('transfer-encoding', '').lower() == 'chunked'
+        length = headers.get('content-length')
+        self._remaining = int(length) if length is not None and not self._chunked else None
+        if status_code in (204, 304):
+            self._remaining = 0
+        if self._remaining == 0:
+            self._finish()
+
+    def _finish(self, reuse=True):
+        if not self._done:
+            self._done = True
+            # a body delimited by the end of the connection leaves nothing to reuse
+            delimited = self._chunked or self._remaining is not None
+            keep_alive = self.headers.get('connection', '').lower() != 'close'
+            self._release(self._connection, reuse and delimited and keep_alive)
+
+    async def read_chunk(self):
+        """
+        Return the next piece of the body as it arrives, b'' once the body is read
+        """
+        if self._buffer:
+            data, self._buffer = self._buffer, b''
+            return data
+        return await self._read()
+
+    async def _read(self):
+        if self._done:
+            return b''
+        reader = self._connection[0]
+        try:
+            if self._chunked:
+                size = int((await reader.readline()).split(b';')[0].strip() or b'0', 16)
+                if size == 0:
+                    # skip trailers
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    self._finish()
+                    return b''
+                data = await reader.readexactly(size)
+                await reader.readexactly(2)
+                return data
+            if self._remaining is not None:
+                data = await reader.read(min(self._remaining, 65536))
+                if not data:
+                    raise ConnectionResetError('connection closed before the end of the body')
+                self._remaining -= len(data)
+                if self._remaining == 0:
+                    self._finish()
+                return data
+            # body delimited by the end of the connection
+            data = await reader.read(65536)
+            if not data:
+                self._finish(reuse=False)
+            return data
+        except (OSError, asyncio.IncompleteReadError):
+            self._finish(reuse=False)
+            raise
+
+    async def iter_chunks(self):
+        while True:
+            data = await self.read_chunk()
+            if not data:
+                break
+            yield data
+
+    async def readexactly(self, size):
+        """
+        Return size bytes of the body, or less if the body ends first
+        """
+        while len(self._buffer) < size:
+            data = await self._read()
+            if not data:
+                break
+            self._buffer += data
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    async def iter_lines(self):
+        pending = b''
+        async for data in self.iter_chunks():
+            lines = (pending + data).split(b'\n')
+            pending = lines.pop()
+            for line in lines:
+                if line.strip():
+                    yield line
+        if pending.strip():
+            yield pending
+
+    async def iter_json(self):
+        async for line in self.iter_lines():
+            yield json.loads(line.decode('utf8'))
+
+    async def iter_frames(self):
+        """
+        Yield (stream, data) of a multiplexed stdout/stderr stream, stream is 1 for stdout and 2 for stderr
+        """
+        while True:
+            header = await self.readexactly(8)
+            if len(header) < 8:
+                break
+            stream, size = struct.unpack('>BxxxL', header)
+            yield stream, await self.readexactly(size)
+
+    async def read(self):
+        chunks = []
+        async for data in self.iter_chunks():
+            chunks.append(data)
+        self.content = b''.join(chunks)
+        return self.content
+
+    async def json(self):
+        return json.loads((await self.read()).decode('utf8'))
+
+    def close(self):
+        """
+        Drop the connection unless the body has been fully read
+        """
+        self._finish(reuse=False)
+
+
+class AsyncSwarmClient(SwarmClient):
+    """
+    Client of the current swarm api running on asyncio.
+    At most `limit` requests are in flight at once, a streamed response
+    holds its slot until its body is read or it is closed.
+    """
+
+    def __init__(self, limit=100, timeout=600):
+        super(AsyncSwarmClient, self).__init__()
+        self.limit = limit
+        self.timeout = timeout
+        self._base_url = None
+        self._address = None
+        self._host = None
+        self._ssl = None
+        self._api_version = None
+        self._semaphore = None
+        self._idle = []
+
+    def _get_ssl(self, name=None):
+        tlsconfig = self._get_tlsconfig(name)
+        if tlsconfig is None:
+            return None
+        if tlsconfig.get('tlsverify') == '1':
+            context = ssl.create_default_context(cafile=tlsconfig.get('tlscacert'))
+        else:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        if tlsconfig.get('tlscert') and tlsconfig.get('tlskey'):
+            context.load_cert_chain(tlsconfig['tlscert'], tlsconfig['tlskey'])
+        return context
+
+    async def connect(self):
+        """
+        Ping the current api, or the next configured one if it is not accessible
+        Return False if no api is available
+        """
+        endpoints = self._get_endpoints()
+        if not endpoints:
+            print('No available swarm api')
+            return False
+        self._api_version = self.version
+        self._semaphore = asyncio.Semaphore(self.limit)
+        error = None
+        for name, base_url in endpoints:
+            url = urlparse(base_url)
+            self._base_url = base_url
+            self._ssl = self._get_ssl(name)
+            if url.scheme in ('unix', 'http+unix'):
+                self._address = ('unix', url.path)
+                self._host = 'localhost'
+            else:
+                port = url.port or (2376 if self._ssl is not None else 2375)
+                self._address = ('tcp', url.hostname, port)
+                self._host = '{host}:{port}'.format(host=url.hostname, port=port)
+            self.close()
+            try:
+                if await self.ping(timeout=3) != 'OK':
+                    return False
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = e
+                continue
+            except errors.APIError as e:
+                if not e.is_server_error():
+                    raise
+                error = requests.exceptions.ConnectionError(e)
+                continue
+            if name != endpoints[0][0]:
+                print('Swarm API {current} is not accessible, using {name}'.format(current=endpoints[0][0],
+                                                                                    name=name), file=sys.stderr)
+            return True
+        raise error
+
+    async def _open(self):
+        if self._address[0] == 'unix':
+            return await asyncio.open_unix_connection(self._address[1])
+        return await asyncio.open_connection(self._address[1], self._address[2], ssl=self._ssl)
+
+    def _release(self, connection, reuse):
+        if reuse:
+            self._idle.append(connection)
+        else:
+            connection[1].close()
+        self._semaphore.release()
+
+    def close(self):
+        while self._idle:
+            self._idle.pop()[1].close()
+
+    def _url(self, path, params=None):
+        if self._api_version:
+            path = '/v{version}{path}'.format(version=self._api_version, path=path)
+        if params:
+            params = dict((k, ('1' if v else '0') if isinstance(v, bool) else v)
+                          for k, v in params.items() if v is not None)
+            path += '?' + urlencode(params)
+        return path
+
+    async def _send(self, connection, method, url, body, headers):
+        reader, writer = connection
+        lines = ['{method} {url} HTTP/1.1'.format(method=method, url=url),
+                 'Host: {host}'.format(host=self._host),
+                 'Content-Length: {length}'.format(length=len(body))]
+        lines.extend(('{k}: {v}'.format(k=k, v=v) for k, v in headers.items()))
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+        status = await reader.readline()
+        if not status:
+            raise ConnectionResetError('connection closed by the server')
+        _, status_code, reason = status.decode('latin-1').rstrip('\r\n').split(' ', 2)
+        response_headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+        return int(status_code), reason, response_headers
+
+    async def _request_once(self, method, url, body, headers, timeout):
+        start = time.time()
+        await self._semaphore.acquire()
+        try:
+            while True:
+                reused = bool(self._idle)
+                connection = None
+                try:
+                    connection = self._idle.pop() if reused else await self._open()
+                    status_code, reason, response_headers = await asyncio.wait_for(
+                        self._send(connection, method, url, body, headers), timeout or self.timeout)
+                    break
+                except (OSError, asyncio.IncompleteReadError) as e:
+                    if connection is None:
+                        raise ConnectError(e)
+                    connection[1].close()
+                    # the server may have closed an idle connection, try again with another one
+                    if not reused:
+                        raise requests.exceptions.ConnectionError(e)
+                except asyncio.TimeoutError:
+                    if connection is not None:
+                        connection[1].close()
+                    raise requests.exceptions.Timeout('Read timed out after {timeout}s'.format(
+                        timeout=timeout or self.timeout))
+        except BaseException as e:
+            self._semaphore.release()
+            if self.tracer is not None:
+                self.tracer.record(method, url, start, error=str(e))
+            raise
+        if self.tracer is not None:
+            length = response_headers.get('content-length')
+            # the body is read later by the caller, only its announced length is known
+            self.tracer.record(method, url, start, status=status_code,
+                               size=int(length) if length is not None else None,
+                               stream=length is None, first_byte=time.time()-start)
+        return AsyncResponse(connection, status_code, reason, response_headers, self._release)
+
+    async def request(self, method, path, params=None, data=None, headers=None, timeout=None, retry=True):
+        """
+        Send a request and return an AsyncResponse once its headers are read
+        Idempotent requests are retried on transient failures as configured by SwarmClient.retry
+        Raise docker.errors.NotFound or docker.errors.APIError on error status
+        :param data(bytes, dict or list): Request body, dict and list are sent as JSON
+        :param timeout(float): Seconds to wait for the response headers
+        :param retry(bool): Retry on transient failures
+        """
+        headers = dict(headers or {})
+        body = b''
+        if isinstance(data, (dict, list)):
+            body = json.dumps(data).encode('utf8')
+            headers['Content-Type'] = 'application/json'
+        elif data is not None:
+            body = data
+        url = self._url(path, params)
+        breaker = CircuitBreaker.get(self._base_url)
+        retries = self.retry.retries if retry else 0
+        attempt = 0
+        while True:
+            breaker.check()
+            try:
+                response = await self._request_once(method, url, body, headers, timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                breaker.failure()
+                if attempt >= retries or not (is_idempotent(method, url) or is_unsent(e)):
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUS:
+                    breaker.success()
+                    break
+                breaker.failure()
+                if attempt >= retries or not is_idempotent(method, url):
+                    break
+                response.close()
+            await asyncio.sleep(self.retry.delay(attempt))
+            attempt += 1
+        if response.status_code >= 400:
+            await response.read()
+            explanation = response.content.decode('utf8', 'replace').strip()
+            try:
+                explanation = json.loads(explanation).get('message', explanation)
+            except (ValueError, AttributeError):
+                pass
+            error = errors.NotFound if response.status_code == 404 else errors.APIError
+            raise error('{code} {reason}'.format(code=response.status_code, reason=response.reason), response,
+                        explanation=explanation)
+        return response
+
+    async def _result(self, method, path, params=None, data=None, timeout=None):
+        response = await self.request(method, path, params=params, data=data, timeout=timeout)
+        content = (await response.read()).decode('utf8')
+        if content and response.headers.get('content-type', '').startswith('application/json'):
+            return json.loads(content)
+        return content
+
+    async def ping(self, timeout=None):
+        response = await self.request('GET', '/_ping', timeout=timeout)
+        return (await response.read()).decode('utf8')
+
+    async def info(self):
+        return await self._result('GET', '/info')
+
+    async def containers(self, all=False, filters=None):
+        params = {'all': all, 'filters': json.dumps(filters) if filters else None}
+        return await self._result('GET', '/containers/json', params=params)
+
+    async def inspect_container(self, container):
+        return await self._result('GET', '/containers/{id}/json'.format(id=quote(container)))
+
+    async def start(self, container):
+        await self._result('POST', '/containers/{id}/start'.format(id=quote(container)))
+
+    async def stop(self, container, timeout=10):
+        await self._result('POST', '/containers/{id}/stop'.format(id=quote(container)), params={'t': timeout},
+                           timeout=self.timeout + timeout)
+
+    async def restart(self, container, timeout=10):
+        await self._result('POST', '/containers/{id}/restart'.format(id=quote(container)), params={'t': timeout},
+                           timeout=self.timeout + timeout)
+
+    async def kill(self, container, signal=None):
+        await self._result('POST', '/containers/{id}/kill'.format(id=quote(container)), params={'signal': signal})
+
+    async def remove_container(self, container, v=False, link=False, force=False):
+        await self._result('DELETE', '/containers/{id}'.format(id=quote(container)),
+                           params={'v': v, 'link': link, 'force': force})
+
+    async def logs(self, container, stdout=True, stderr=True, timestamps=False, tail='all', since=None, follow=False):
+        """
+        Async generator of (stream, data) frames of the container logs
+        """
+        params = {'stdout': stdout, 'stderr': stderr, 'timestamps': timestamps, 'tail': tail,
+                  'since': since, 'follow': follow}
+        response = await self.request('GET', '/containers/{id}/logs'.format(id=quote(container)), params=params)
+        try:
+            async for frame in response.iter_frames():
+                yield frame
+        finally:
+            response.close()
+
+    async def events(self, since=None, until=None, filters=None):
+        """
+        Async generator of decoded events
+        """
+        params = {'since': since, 'until': until, 'filters': json.dumps(filters) if filters else None}
+        response = await self.request('GET', '/events', params=params)
+        try:
+            async for event in response.iter_json():
+                yield event
+        finally:
+            response.close()
+
+    async def pull(self, repository, tag=None, auth_header=None):
+        """
+        Async generator of decoded progress messages
+        :param auth_header(str): Value of the X-Registry-Auth header
+        """
+        headers = {'X-Registry-Auth': auth_header} if auth_header else None
+        response = await self.request('POST', '/images/create', params={'fromImage': repository, 'tag': tag or 'latest'},
+                                      headers=headers)
+        try:
+            async for message in response.iter_json():
+                yield message
+        finally:
+            response.close()
+
+    async def resolve(self, container_list, show_all=True):
+        """
+        Expand wildcard names of container_list using a single listing
+        """
+        if not [container for container in container_list if container.count('*') > 0]:
+            return list(container_list)
+        return ContainerSnapshot(await self.containers(all=show_all)).resolve(container_list)
+
+    async def handle_containers(self, command, container_list, **kwargs):
+        """
+        Run command against every container concurrently
+        Return list of (container, error explanation or None) in the order of container_list
+        :param command(str): must be one of ['start', 'stop', 'restart', 'remove', 'kill']
+        """
+        handlers = {
+            'start': self.start,
+            'stop': self.stop,
+            'restart': self.restart,
+            'remove': self.remove_container,
+            'kill': self.kill
+        }
+
+        async def handle(container):
+            try:
+                await handlers[command](container, **kwargs)
+                return container, None
+            except (errors.NotFound, errors.APIError, errors.DockerException) as e:
+                return container, e.explanation
+        containers = await self.resolve(container_list)
+        return await asyncio.gather(*[handle(container) for container in containers])
+
+    def run(self, func, *args, **kwargs):
+        """
+        Connect and run coroutine function func to completion on a new event loop
+        Return its result, or None if no api is available
+        """
+        async def main():
+            try:
+                if await self.connect():
+                    return await func(*args, **kwargs)
+            finally:
+                self.close()
+        try:
+            return asyncio.run(main())
+        except errors.DockerException as e:
+            pyprint(e)
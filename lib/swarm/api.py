@@ -3,6 +3,18 @@
 from __future__ import print_function
 import os
 import json
+import time
+import tempfile
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError:
+    # no advisory locking on Windows
+    fcntl = None
+
+
+# seconds the ranking of `swarm api probe` is used by `swarm api use auto` before probing again
+PROBE_TTL = 300
 
 
 class SwarmApi(object):
@@ -11,7 +23,12 @@ class SwarmApi(object):
         # config: $HOME/.swarm/config.json
         self._config = os.path.join(os.environ['HOME'], '.swarm', 'config.json')
         if not os.path.exists(os.path.dirname(self._config)):
-            os.mkdir(os.path.dirname(self._config))
+            try:
+                os.mkdir(os.path.dirname(self._config))
+            except OSError:
+                # created meanwhile by a concurrent invocation
+                if not os.path.isdir(os.path.dirname(self._config)):
+                    raise
 
     def _has_config(self, warning=True):
         if not os.path.exists(self._config):
@@ -23,6 +40,14 @@ class SwarmApi(object):
     @property
     def config(self):
         return self._config
+
+    @property
+    def current(self):
+        try:
+            with open(self._config, 'r') as fp:
+                return json.load(fp).get('current')
+        except IOError:
+            return
     
     def list_api(self):
         if self._has_config():
@@ -30,50 +55,84 @@ class SwarmApi(object):
                 with open(self._config, 'r') as fp:
                     data = json.load(fp)
                     if data['apis']:
+                        current = data.get('current', '')
+                        if current == 'auto':
+                            # the fastest healthy api of the last probe is in use
+                            ranking = (data.get('probe') or {}).get('ranking') or []
+                            current = ranking[0]['name'] if ranking and ranking[0]['healthy'] else ''
                         for name in data['apis']:
-                            tag = ' \033[32m*\033[0m' if name == data.get('current', '') else ''
+                            tag = ' \033[32m*\033[0m' if name == current else ''
+                            if tag and data['current'] == 'auto':
+                                tag += ' (auto)'
                             print('{name}: {api}{tag}'.format(name=name, api=data['apis'][name], tag=tag))
             except IOError as e:
                 print(e)
             except OSError:
                 raise
 
-    def add_api(self, name, api):
-        if self._has_config(warning=False):
+    @contextmanager
+    def _update(self):
+        """
+        Read-modify-write of config under an exclusive lock, yield the config dict to modify in place
+        The file is replaced atomically and only if the dict has changed
+        """
+        with open(self._config + '.lock', 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
             try:
-                with open(self._config, 'r') as fp:
-                    data = json.load(fp)
-                    data['apis'][name] = api
-                with open(self.config, 'w') as fp:
-                    fp.write(json.dumps(data, indent=4))
-            except OSError as e:
-                print(e)
-        else:
-            data = {'apis': {}}
-            data['apis'][name] = api
-            with open(self._config, 'w') as fp:
-                fp.write(json.dumps(data, indent=4))
+                if os.path.exists(self._config):
+                    with open(self._config, 'r') as fp:
+                        data = json.load(fp)
+                else:
+                    data = {'apis': {}}
+                before = json.dumps(data, sort_keys=True)
+                yield data
+                if json.dumps(data, sort_keys=True) != before:
+                    fd, path = tempfile.mkstemp(prefix='.config.', dir=os.path.dirname(self._config))
+                    try:
+                        with os.fdopen(fd, 'w') as fp:
+                            fp.write(json.dumps(data, indent=4))
+                            fp.flush()
+                            os.fsync(fp.fileno())
+                        # os.rename does not overwrite on Windows
+                        getattr(os, 'replace', os.rename)(path, self._config)
+                    except BaseException:
+                        os.unlink(path)
+                        raise
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    def add_apis(self, apis):
+        """
+        :param apis(dict): Map of api name to url, added with a single write
+        """
+        try:
+            with self._update() as data:
+                data.setdefault('apis', {}).update(apis)
+        except (IOError, OSError) as e:
+            print(e)
+
+    def add_api(self, name, api):
+        self.add_apis({name: api})
 
     def unset_api(self, name):
         if self._has_config():
             try:
-                with open(self._config, 'r') as fp:
-                    data = json.load(fp)
+                with self._update() as data:
                     if name in data['apis']:
                         data['apis'].pop(name)
                         if name == data.get('current', ''):
                             data['current'] = ''
                     elif name == 'all':
-                        data = {
+                        data.clear()
+                        data.update({
                             'current': '',
                             'apis': {}
-                        }
+                        })
                     else:
-                        args = ', '.join(data['apis'].keys() + ['all'])
+                        args = ', '.join(list(data['apis'].keys()) + ['all'])
                         print('Error: `{name}` is unset. Available arguments: {args}'.format(name=name, args=args))
-                        return
-                with open(self._config, 'w') as fp:
-                    fp.write(json.dumps(data, indent=4))
             except IOError as e:
                 print(e)
             except OSError:
@@ -82,19 +141,31 @@ class SwarmApi(object):
     def set_api(self, name):
         if self._has_config():
             try:
-                with open(self._config, 'r') as fp:
-                    data = json.load(fp)
-                if name in data['apis']:
-                    data['current'] = name
-                else:
-                    if data['apis'].keys():
+                with self._update() as data:
+                    if name in data['apis'] or name == 'auto' and data['apis']:
+                        data['current'] = name
+                    elif data['apis'].keys():
                         args = ','.join(data['apis'].keys())
                         print('Error: `{name}` is not available. Available arguments: {args}'.format(name=name, args=args))
                     else:
                         print('No available swarm api')
-                    return
-                with open(self._config, 'w') as fp:
-                    fp.write(json.dumps(data, indent=4))
+            except IOError as e:
+                print(e)
+            except OSError:
+                raise
+
+    def set_probe(self, ranking, ttl=None):
+        """
+        Cache ranking of `swarm api probe` for ttl seconds, the previous ttl is kept if ttl is None
+        """
+        if self._has_config():
+            try:
+                with self._update() as data:
+                    data['probe'] = {
+                        'time': time.time(),
+                        'ttl': ttl if ttl is not None else (data.get('probe') or {}).get('ttl', PROBE_TTL),
+                        'ranking': ranking
+                    }
             except IOError as e:
                 print(e)
             except OSError:
@@ -104,11 +175,8 @@ class SwarmApi(object):
         if self._has_config():
             try:
                 if version == 'auto' or float(version) >= 1.10:
-                    with open(self._config, 'r') as fp:
-                        data = json.load(fp)
-                    data['version'] = version
-                    with open(self._config, 'w') as fp:
-                        fp.write(json.dumps(data, indent=4))
+                    with self._update() as data:
+                        data['version'] = version
                 else:
                     print('Error: {version} is not numeric or less than 1.10'.format(version=version))
             except ValueError:
@@ -118,101 +186,53 @@ class SwarmApi(object):
             except OSError:
                 raise
 
-    def set_tls(self, value):
+    def _set_tlsflag(self, key, value):
         if self._has_config():
             try:
                 if value in ('0', '1'):
-                    with open(self._config, 'r') as fp:
-                        data = json.load(fp)
-                    current = data['current']
-                    tlsconfig =  data.get('tlsconfig', {}).get(current, {})
-                    if tlsconfig.get('tlscert') and tlsconfig.get('tlskey'):
-                        tlsconfig['tls'] = value
-                        with open(self._config, 'w') as fp:
-                            fp.write(json.dumps(data, indent=4))
-                    else:
-                        print('Error: no specified tlscert/tlskey') 
+                    with self._update() as data:
+                        current = data['current']
+                        tlsconfig = data.get('tlsconfig', {}).get(current, {})
+                        if tlsconfig.get('tlscert') and tlsconfig.get('tlskey'):
+                            tlsconfig[key] = value
+                        else:
+                            print('Error: no specified tlscert/tlskey')
                 else:
-                    print('Error: tls must be set either 0 or 1')
+                    print('Error: {key} must be set either 0 or 1'.format(key=key))
             except IOError as e:
                 print(e)
             except OSError:
                 raise
 
+    def set_tls(self, value):
+        self._set_tlsflag('tls', value)
+
     def set_tlsverify(self, value):
+        self._set_tlsflag('tlsverify', value)
+
+    def _set_tlsfile(self, key, path):
         if self._has_config():
             try:
-                if value in ('0', '1'):
-                    with open(self._config, 'r') as fp:
-                        data = json.load(fp)
-                    current = data['current']
-                    tlsconfig =  data.get('tlsconfig', {}).get(current, {})
-                    if tlsconfig.get('tlscert') and tlsconfig.get('tlskey'):
-                        tlsconfig['tlsverify'] = value
-                        with open(self._config, 'w') as fp:
-                            fp.write(json.dumps(data, indent=4))
-                    else:
-                        print('Error: no specified tlscert/tlskey')
+                if os.path.exists(path):
+                    with self._update() as data:
+                        current = data['current']
+                        tlsconfig = data.setdefault('tlsconfig', {}).setdefault(current, {})
+                        tlsconfig[key] = path
                 else:
-                    print('Error: tlsverify must be set either 0 or 1')
+                    print('Specified {key} is not found.'.format(key=key))
             except IOError as e:
                 print(e)
             except OSError:
                 raise
 
     def set_tlscacert(self, tlscacert):
-        if self._has_config():
-            try:
-                if os.path.exists(tlscacert):
-                    with open(self._config, 'r') as fp:
-                        data = json.load(fp)
-                    current = data['current']
-                    tlsconfig = data.setdefault('tlsconfig', {}).setdefault(current, {})
-                    tlsconfig['tlscacert'] = tlscacert
-                    with open(self._config, 'w') as fp:
-                        fp.write(json.dumps(data, indent=4))
-                else:
-                    print('Specified tlscacert is not found.')
-            except IOError as e:
-                print(e)
-            except OSError:
-                raise
+        self._set_tlsfile('tlscacert', tlscacert)
 
     def set_tlscert(self, tlscert):
-        if self._has_config():
-            try:
-                if os.path.exists(tlscert):
-                    with open(self._config, 'r') as fp:
-                        data = json.load(fp)
-                    current = data['current']
-                    tlsconfig = data.setdefault('tlsconfig', {}).setdefault(current, {})
-                    tlsconfig['tlscert'] = tlscert
-                    with open(self._config, 'w') as fp:
-                        fp.write(json.dumps(data, indent=4))
-                else:
-                    print('Specified tlscert is not found.')
-            except IOError as e:
-                print(e)
-            except OSError:
-                raise
+        self._set_tlsfile('tlscert', tlscert)
 
     def set_tlskey(self, tlskey):
-        if self._has_config():
-            try:
-                if os.path.exists(tlskey):
-                    with open(self._config, 'r') as fp:
-                        data = json.load(fp)
-                    current = data['current']
-                    tlsconfig = data.setdefault('tlsconfig', {}).setdefault(current, {})
-                    tlsconfig['tlskey'] = tlskey
-                    with open(self._config, 'w') as fp:
-                        fp.write(json.dumps(data, indent=4))
-                else:
-                    print('Specified tlskey is not found.')
-            except IOError as e:
-                print(e)
-            except OSError:
-                raise
+        self._set_tlsfile('tlskey', tlskey)
 
     def get_tlsconfig(self):
         if self._has_config():
@@ -0,0 +1,155 @@
+# -*- coding: utf8 -*-
+
+from __future__ import print_function
+import sys
+import json
+import time
+import shlex
+import threading
+from fnmatch import fnmatchcase
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from swarm.client import SwarmClient
+from swarm.command import SwarmCommand
+from swarm.utils import ThreadOutput
+
+
+# commands which never return or read the terminal, they can not run in a batch
+BATCH_UNSUPPORTED = ('batch', 'exporter', 'serve')
+
+
+class Batch(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
+    def _read(self, path):
+        """
+        Return stages of operations (line number, line), a line `wait` ends a stage
+        Blank lines and lines starting with # are skipped
+        """
+        if path == '-':
+            lines = sys.stdin.read().splitlines()
+        else:
+            with open(path, 'r') as fp:
+                lines = fp.read().splitlines()
+        stages = [[]]
+        for lineno, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line == 'wait':
+                stages.append([])
+            else:
+                stages[-1].append((lineno, line))
+        return [stage for stage in stages if stage]
+
+    def _names(self, line):
+        """
+        Return arguments of an operation after the command, options and their values included
+        """
+        try:
+            args = [arg for arg in shlex.split(line) if not arg.startswith('-')]
+        except ValueError:
+            return []
+        return args[1:]
+
+    def _chains(self, stage):
+        """
+        Split a stage into chains of operations which run in file order, one after another
+        Operations naming the same container, or a pattern matching it, end up in one chain
+        and chains run concurrently, an option value is taken as a name too
+        """
+        names = [self._names(line) for lineno, line in stage]
+        chains = []
+        for i in range(len(stage)):
+            joined = [chain for chain in chains
+                      if any(fnmatchcase(a, b) or fnmatchcase(b, a) for j in chain for a in names[i] for b in names[j])]
+            chains = [chain for chain in chains if chain not in joined]
+            chains.append(sorted(sum(joined, []) + [i]))
+        return [[stage[i] for i in chain] for chain in chains]
+
+    def _run_chain(self, parser, chain):
+        return [self._run(parser, lineno, line) for lineno, line in chain]
+
+    def _run(self, parser, lineno, line):
+        """
+        Parse and run one operation, capturing what it prints
+        """
+        stdout, stderr = sys.stdout, sys.stderr
+        stdout.capture()
+        stderr.capture()
+        start = time.time()
+        exit_code = 0
+        error = None
+        try:
+            args = shlex.split(line)
+            cmd = [arg for arg in args if not arg.startswith('-')][:1]
+            if cmd and cmd[0] in BATCH_UNSUPPORTED:
+                raise ValueError('`swarm {cmd}` can not run in a batch'.format(cmd=cmd[0]))
+            SwarmCommand(parser, args)()
+        except SystemExit as e:
+            # argparse errors and commands calling exit()
+            exit_code = e.code if isinstance(e.code, int) else int(e.code is not None)
+        except Exception as e:
+            exit_code = 1
+            error = '{name}: {error}'.format(name=type(e).__name__, error=e)
+        return {
+            'line': lineno,
+            'command': line,
+            'exit_code': exit_code,
+            'error': error,
+            'stdout': stdout.release(),
+            'stderr': stderr.release(),
+            'duration': round(time.time() - start, 6),
+        }
+
+    def _emit(self, out, result):
+        with self.lock:
+            out.write(json.dumps(result) + '\n')
+            out.flush()
+
+    def __call__(self, parser, path='-', workers=10, sequential=False):
+        """
+        :param parser(SwarmArgumentParser): Parser operations are parsed with
+        :param path(str): File with one operation per line, '-' reads from stdin
+        :param workers(int): Number of operations running concurrently
+        :param sequential(bool): Run operations one by one in file order, without concurrency
+        """
+        try:
+            stages = self._read(path)
+        except IOError as e:
+            print(e)
+            exit(1)
+        if not stages:
+            return
+        # every operation is served by one pool of connections, without a ping per command
+        if SwarmClient.share(maxsize=workers) is None:
+            return
+        out = sys.stdout
+        sys.stdout, sys.stderr = ThreadOutput(sys.stdout), ThreadOutput(sys.stderr)
+        failed = 0
+        try:
+            for stage in stages:
+                if sequential or workers <= 1:
+                    results = (self._run(parser, lineno, line) for lineno, line in stage)
+                    for result in results:
+                        self._emit(out, result)
+                        failed += result['exit_code'] != 0
+                    continue
+                # results are printed in file order, as soon as those of the lines above are
+                chains = self._chains(stage)
+                done, pending = {}, [lineno for lineno, line in stage]
+                with ThreadPoolExecutor(max_workers=min(workers, len(chains))) as executor:
+                    futures = [executor.submit(self._run_chain, parser, chain) for chain in chains]
+                    for future in as_completed(futures):
+                        for result in future.result():
+                            done[result['line']] = result
+                        while pending and pending[0] in done:
+                            result = done.pop(pending.pop(0))
+                            self._emit(out, result)
+                            failed += result['exit_code'] != 0
+        finally:
+            sys.stdout, sys.stderr = sys.stdout.stream, sys.stderr.stream
+            SwarmClient.unshare()
+        if failed:
+            exit(1)
@@ -0,0 +1,149 @@
+# -*- coding: utf8 -*-
+
+from __future__ import print_function
+import re
+import sys
+import time
+
+
+# `Step 3/7 : RUN make`, engines before 1.13 print `Step 3 : RUN make`
+_STEP = re.compile(r'^Step (\d+)(?:/(\d+))? : (.*)$')
+_RUNNING = re.compile(r'^ ---> Running in ([0-9a-f]+)$')
+_LAYER = re.compile(r'^ ---> ([0-9a-f]{12,})$')
+_BUILT = re.compile(r'^Successfully built ([0-9a-f]+)$')
+
+
+class BuildReport(object):
+    """
+    Steps of a build parsed from its output stream, a step lasts from its `Step N/M` line to the next one
+    The time until the first line is the time taken to pack and send the context
+    """
+
+    def __init__(self, start=None):
+        self.start = time.time() if start is None else start
+        self.end = None
+        self.upload = None
+        self.steps = []
+        self.image = None
+        self.error = None
+        self._buffer = ''
+
+    def feed(self, stream, now=None):
+        """
+        Parse output of the build, stream may hold several lines or part of one
+        """
+        now = time.time() if now is None else now
+        if self.upload is None:
+            self.upload = now - self.start
+        lines = (self._buffer + stream).split('\n')
+        self._buffer = lines.pop()
+        for line in lines:
+            self._parse(line.rstrip('\r'), now)
+
+    def _parse(self, line, now):
+        match = _STEP.match(line)
+        if match:
+            self._close(now)
+            self.steps.append({
+                'step': int(match.group(1)),
+                'total': int(match.group(2)) if match.group(2) else None,
+                'instruction': match.group(3),
+                'cached': False,
+                'container': None,
+                'layer': None,
+                'start': now - self.start,
+                'duration': None,
+            })
+            return
+        match = _BUILT.match(line)
+        if match:
+            self.image = match.group(1)
+            return
+        if not self.steps:
+            return
+        step = self.steps[-1]
+        if line == ' ---> Using cache':
+            step['cached'] = True
+            return
+        match = _RUNNING.match(line)
+        if match:
+            step['container'] = match.group(1)
+            return
+        match = _LAYER.match(line)
+        if match:
+            step['layer'] = match.group(1)
+
+    def _close(self, now):
+        if self.steps and self.steps[-1]['duration'] is None:
+            self.steps[-1]['duration'] = now - self.start - self.steps[-1]['start']
+
+    def fail(self, error, now=None):
+        self.error = error
+        self.finish(now)
+
+    def finish(self, now=None):
+        now = time.time() if now is None else now
+        if self._buffer:
+            self._parse(self._buffer.rstrip('\r'), now)
+            self._buffer = ''
+        self._close(now)
+        if self.end is None:
+            self.end = now - self.start
+        return self
+
+    def slowest(self, count=3):
+        """
+        Return the steps which were not cached, the slowest first
+        """
+        steps = [step for step in self.steps if not step['cached'] and step['duration'] is not None]
+        return sorted(steps, key=lambda step: -step['duration'])[:count]
+
+    @property
+    def cache_hits(self):
+        return len([step for step in self.steps if step['cached']])
+
+    @property
+    def cache_ratio(self):
+        return float(self.cache_hits) / len(self.steps) if self.steps else 0.0
+
+    def to_dict(self):
+        return {
+            'image': self.image,
+            'error': self.error,
+            'duration': self.end,
+            'upload': self.upload,
+            'cache_hits': self.cache_hits,
+            'cache_ratio': self.cache_ratio,
+            'slowest': [step['step'] for step in self.slowest()],
+            'steps': self.steps,
+        }
+
+    def print_report(self, fp=None):
+        fp = fp or sys.stdout
+        titles = ('STEP', 'INSTRUCTION', 'CACHE', 'LAYER', 'DURATION')
+        rows = []
+        for step in self.steps:
+            instruction = step['instruction'] if len(step['instruction']) <= 50 else step['instruction'][:47] + '...'
+            rows.append(('{step}/{total}'.format(step=step['step'], total=step['total'] or '?'), instruction,
+                         'yes' if step['cached'] else 'no', (step['layer'] or '-')[:12],
+                         '{duration:.1f}s'.format(duration=step['duration'] or 0)))
+        if rows:
+            length = [len(title) for title in titles]
+            for row in rows:
+                for i, value in enumerate(row):
+                    if len(value) > length[i]:
+                        length[i] = len(value)
+            string = ''
+            for row in [titles] + rows:
+                line = ''
+                for i, value in enumerate(row):
+                    line += value + ' ' * (length[i]-len(value)+4)
+                string += line.rstrip() + '\n'
+            print(string.rstrip(), file=fp)
+        print('Context upload: {upload:.1f}s, cache hits: {hits}/{steps} ({ratio:.0%}), total: {end:.1f}s'.format(
+            upload=self.upload or 0, hits=self.cache_hits, steps=len(self.steps), ratio=self.cache_ratio,
+            end=self.end or 0), file=fp)
+        slowest = self.slowest()
+        if slowest:
+            print('Slowest steps: ' + ', '.join(('{step} ({duration:.1f}s)'.format(**step) for step in slowest)),
+                  file=fp)
@@ -0,0 +1,58 @@
+# -*- coding: utf8 -*-
+
+from __future__ import print_function
+import os
+import json
+import time
+import hashlib
+import tempfile
+from swarm.api import SwarmApi
+
+
+class DiskCache(object):
+    """
+    JSON documents cached in $HOME/.swarm/cache/NAMESPACE, one file per key
+    Every entry keeps the time it was stored at and the ETag of the response it came from
+    """
+
+    def __init__(self, namespace):
+        self.path = os.path.join(os.path.dirname(SwarmApi().config), 'cache', namespace)
+
+    def _file(self, key):
+        return os.path.join(self.path, hashlib.sha1(key.encode('utf8')).hexdigest() + '.json')
+
+    def get(self, key):
+        """
+        Return {time, etag, data} stored for key, None if there is none
+        """
+        try:
+            with open(self._file(key), 'r') as fp:
+                entry = json.load(fp)
+        except (IOError, OSError, ValueError):
+            return None
+        return entry if entry.get('key') == key else None
+
+    def fresh(self, entry, ttl):
+        return entry is not None and time.time() - entry['time'] < ttl
+
+    def set(self, key, data, etag=None):
+        """
+        Store data for key, the file is replaced atomically so that concurrent readers never see half of it
+        """
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+        except OSError:
+            # created meanwhile by a concurrent invocation
+            if not os.path.isdir(self.path):
+                return
+        fd, path = tempfile.mkstemp(prefix='.cache.', dir=self.path)
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                fp.write(json.dumps({'key': key, 'time': time.time(), 'etag': etag, 'data': data}))
+            # os.rename does not overwrite on Windows
+            getattr(os, 'replace', os.rename)(path, self._file(key))
+        except (IOError, OSError):
+            # a cache which can not be written is only slower
+            if os.path.exists(path):
+                os.unlink(path)
@@ -1,34 +1,56 @@
 # -*- coding: utf8 -*-
 
 from __future__ import print_function
+import sys
 import json
+import time
+import requests
 from docker import Client, errors
 from docker.tls import TLSConfig
-from swarm.api import SwarmApi
-from swarm.utils import pyprint
+from swarm.api import SwarmApi, PROBE_TTL
+from swarm.resilience import RetryPolicy
+from swarm.utils import pyprint, concurrent_map
+
+
+class PooledClient(Client):
+    """
+    Client shared by concurrent workers, close() is a no-op so that
+    one worker can not tear down the connection pool of the others
+    """
+
+    def close(self):
+        pass
+
+    def release(self):
+        super(PooledClient, self).close()
+
+
+class SharedClient(PooledClient):
+    """
+    PooledClient shared by every command of a batch, release() is a no-op as well
+    and the connection pool is only torn down by shutdown() once the batch is done
+    """
+
+    def release(self):
+        pass
+
+    def shutdown(self):
+        super(SharedClient, self).release()
 
 
 class SwarmClient(object):
 
+    # swarm.trace.Tracer instrumenting every client created, if tracing is enabled
+    tracer = None
+    # retries of idempotent requests on transient failures of the manager
+    retry = RetryPolicy()
+    # SharedClient returned by every SwarmClient while a batch is running
+    shared = None
+
     def __init__(self):
         self._config = SwarmApi().config
         self.count = 0
-
-    def _get_base_url(self):
-        try:
-            with open(self._config, 'r') as fp:
-                data = json.load(fp)
-            try:
-                if data['current']:
-                    return data['apis'][data['current']]
-                return
-            except KeyError:
-                return
-        except IOError:
-            print('No available swarm api')
-            exit(1)
-        except OSError:
-            raise
+        self._pooled = None
 
     def _get_version(self):
         try:
@@ -46,11 +68,44 @@ class SwarmClient(object):
         except OSError:
             raise
 
-    def _get_tlsconfig(self):
+    def _get_endpoints(self):
+        """
+        Return list of (name, base_url), the current api first then the other apis to fail over to
+        When the current api is `auto`, apis are ordered by the probe ranking, probed again once it expires
+        """
         try:
             with open(self._config, 'r') as fp:
                 data = json.load(fp)
-            current = data['current']
+        except IOError:
+            print('No available swarm api')
+            exit(1)
+        except OSError:
+            raise
+        apis = data.get('apis') or {}
+        current = data.get('current')
+        if current == 'auto' and apis:
+            probe = data.get('probe') or {}
+            ranking = probe.get('ranking') or []
+            ttl = probe.get('ttl', PROBE_TTL)
+            if time.time() - probe.get('time', 0) > ttl or \
+               sorted((rank['name'], rank['api']) for rank in ranking) != sorted(apis.items()):
+                ranking = self.probe()
+                SwarmApi().set_probe(ranking, ttl)
+            healthy = [rank['name'] for rank in ranking if rank['healthy']]
+            return [(name, apis[name]) for name in healthy] + \
+                   sorted(((name, apis[name]) for name in apis if name not in healthy))
+        if not current or current not in apis:
+            return []
+        return [(current, apis[current])] + sorted(((name, apis[name]) for name in apis if name != current))
+
+    def _get_tlsconfig(self, name=None):
+        """
+        :param name(str): Name of the api, the current one by default
+        """
+        try:
+            with open(self._config, 'r') as fp:
+                data = json.load(fp)
+            current = name or data['current']
             tlsconfig = data.get('tlsconfig', {}).get(current, {})
             return tlsconfig if tlsconfig else None
         except IOError as e:
@@ -59,30 +114,139 @@ class SwarmClient(object):
         except OSError:
             raise
 
+    def _get_tls(self, name=None):
+        tls = False
+        _tlsconfig = self._get_tlsconfig(name)
+        if _tlsconfig is not None:
+            client_cert = (_tlsconfig.get('tlscert'), _tlsconfig.get('tlskey'))
+            ca_cert = _tlsconfig.get('tlscacert')
+            verify = True if  _tlsconfig.get('tlsverify') == '1' else False
+            tls = TLSConfig(client_cert=client_cert, ca_cert=ca_cert, verify=verify)
+        return tls
+
+    def _ping(self, name, base_url, count=3):
+        """
+        Ping base_url count times over one connection, latency is the median round trip
+        """
+        latencies = []
+        try:
+            cli = Client(base_url, version=self.version, timeout=3, tls=self._get_tls(name))
+            try:
+                for _ in range(count):
+                    start = time.time()
+                    if cli.ping() != 'OK':
+                        break
+                    latencies.append(time.time() - start)
+            finally:
+                cli.close()
+        except (requests.exceptions.RequestException, errors.DockerException):
+            pass
+        healthy = len(latencies) == count
+        return {
+            'name': name,
+            'api': base_url,
+            'latency': sorted(latencies)[count//2] if healthy else None,
+            'healthy': healthy
+        }
+
+    def probe(self):
+        """
+        Ping every configured api concurrently
+        Return list of {name, api, latency, healthy}, healthy apis first by ascending latency
+        """
+        try:
+            with open(self._config, 'r') as fp:
+                apis = json.load(fp).get('apis') or {}
+        except IOError:
+            return []
+        ranking = concurrent_map(lambda item: self._ping(*item), sorted(apis.items()), workers=max(len(apis), 1))
+        return sorted(ranking, key=lambda rank: (not rank['healthy'], rank['latency'] or 0, rank['name']))
+
+    @classmethod
+    def share(cls, maxsize=10):
+        """
+        Connect once and serve every subsequent client and pooled client with the same SharedClient,
+        until unshare() is called
+        """
+        cls.shared = cls()._connect(SharedClient, maxsize)
+        return cls.shared
+
+    @classmethod
+    def unshare(cls):
+        shared, cls.shared = cls.shared, None
+        if shared is not None:
+            shared.shutdown()
+
     @property
     def client(self):
-        base_url = self._get_base_url()
-        if base_url is not None:
+        if self.shared is not None:
+            return self.shared
+        return self._connect(Client)
+
+    def pooled(self, maxsize=10):
+        """
+        Return a PooledClient which keeps up to maxsize connections alive per host.
+        It is created once and reused by subsequent calls.
+        """
+        if self.shared is not None:
+            return self.shared
+        if self._pooled is None:
+            self._pooled = self._connect(PooledClient, maxsize)
+        return self._pooled
+
+    def node(self, addr):
+        """
+        Return a Client connected to the docker engine of a node, addr as listed by info (e.g. 192.168.1.1:2375)
+        Nodes are reached with the TLS settings of the current api
+        """
+        return self._instrument(Client('tcp://{addr}'.format(addr=addr), version=self.version, timeout=600,
+                                       tls=self._get_tls()))
+
+    def _instrument(self, cli):
+        if self.tracer is not None:
+            self.tracer.instrument(cli)
+        return cli
+
+    def _connect(self, client_class, maxsize=None):
+        endpoints = self._get_endpoints()
+        if not endpoints:
+            print('No available swarm api')
+            return
+        error = None
+        for name, base_url in endpoints:
             try:
-                tls = False
-                _tlsconfig = self._get_tlsconfig()
-                if _tlsconfig is not None:
-                    client_cert = (_tlsconfig.get('tlscert'), _tlsconfig.get('tlskey'))
-                    ca_cert = _tlsconfig.get('tlscacert')
-                    verify = True if  _tlsconfig.get('tlsverify') == '1' else False
-                    tls = TLSConfig(client_cert=client_cert, ca_cert=ca_cert, verify=verify)
-                cli = Client(base_url, version=self.version, timeout=3, tls=tls)
+                tls = self._get_tls(name)
+                cli = self.retry.instrument(self._instrument(Client(base_url, version=self.version, timeout=3, tls=tls)),
+                                            base_url)
                 # Hits the /_ping endpoint of the remote API and returns the result. 
                 # An exception will be raised if the endpoint isn't responding.
-                if cli.ping() == 'OK':
+                try:
+                    ping = cli.ping()
+                finally:
                     cli.close()
-                    return Client(base_url, version=self.version, timeout=600, tls=tls)
-                return
             except errors.DockerException as e:
                 pyprint(e)
                 return
-        print('No available swarm api')
-        return
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                # try the next api, the error is raised if none is accessible
+                error = e
+                continue
+            except errors.APIError as e:
+                if not e.is_server_error():
+                    raise
+                error = requests.exceptions.ConnectionError(e)
+                continue
+            if ping != 'OK':
+                return
+            if name != endpoints[0][0]:
+                print('Swarm API {current} is not accessible, using {name}'.format(current=endpoints[0][0],
+                                                                                    name=name), file=sys.stderr)
+            cli = client_class(base_url, version=self.version, timeout=600, tls=tls)
+            if maxsize is not None:
+                for adapter in cli.adapters.values():
+                    adapter.init_poolmanager(adapter._pool_connections, maxsize)
+            return self.retry.instrument(self._instrument(cli), base_url)
+        raise error
     
     @property
     def version(self):
@@ -1,23 +1,45 @@
 # -*- coding: utf8 -*-
 
 from __future__ import print_function
-import os
+import sys
+import time
 import requests
-import json
-import base64
 from docker import Client, errors
-from docker.auth import load_config
 from swarm.api import SwarmApi
-from swarm.utils import is_api_inuse, detect_range, expand_hostname_range
+from swarm.client import SwarmClient
+from swarm.credentials import CredentialResolver
+from swarm.resilience import RetryPolicy
+from swarm.serve import LOCAL_COMMANDS, READ_ONLY_COMMANDS, socket_path, forward, invalidate
+from swarm.trace import Tracer
+from swarm.utils import is_api_inuse, HostMatcher, load_spec, parse_duration,\
+                        parse_pairs, parse_links, parse_ports, parse_volumes, JsonWriter
 #from pprint import pprint
 from getpass import getpass
 
 
 class SwarmCommand(object):
 
-    def __init__(self, parser):
+    def __init__(self, parser, args=None):
+        """
+        :param parser(SwarmArgumentParser): Parser of the command line
+        :param args(list): Arguments of a command run by batch, sys.argv by default
+        """
         self._config = SwarmApi().config
-        self._args = parser.parse_args()
+        self._parser = parser
+        start = time.time()
+        self._args = parser.parse_args(args)
+        self._forward = args is None
+        if args is None:
+            if self._args.trace or self._args.trace_json:
+                SwarmClient.tracer = Tracer()
+                SwarmClient.tracer.phase('parse', start, time.time())
+            SwarmClient.retry = RetryPolicy(retries=self._args.retries)
+        else:
+            # command objects are parser defaults keeping state between calls,
+            # every command of a batch gets its own
+            for key in ('func', 'exec_all'):
+                if hasattr(self._args, key):
+                    setattr(self._args, key, type(getattr(self._args, key))())
         self._commands = {
             'api': self._swarm_api,
             'version': self._swarm_version,
@@ -35,16 +57,38 @@ class SwarmCommand(object):
             'inspect': self._swarm_inspect,
             'rename': self._swarm_rename,
             'logs': self._swarm_logs,
+            'cp': self._swarm_cp,
             'images': self._swarm_images,
             'rmi': self._swarm_rmi,
             'tag': self._swarm_tag,
             'pull': self._swarm_pull,
             'push': self._swarm_push,
+            'image': self._swarm_image,
             'build': self._swarm_build,
             'search': self._swarm_search,
+            'apply': self._swarm_apply,
+            'rolling-restart': self._swarm_rolling_restart,
+            'stats': self._swarm_stats,
+            'exporter': self._swarm_exporter,
+            'batch': self._swarm_batch,
+            'serve': self._swarm_serve,
+            'snapshot': self._swarm_snapshot,
+            'diff': self._swarm_diff,
         }
 
+    @property
+    def cmd(self):
+        return self._args.cmd
+
     def __call__(self):
+        # hand the command line over to `swarm serve` if it is running, which holds connections open
+        if self._forward and self._args.cmd not in LOCAL_COMMANDS and SwarmClient.tracer is None:
+            exit_code = forward(socket_path(), sys.argv[1:])
+            if exit_code:
+                exit(exit_code)
+            if exit_code is not None:
+                return
+        start = time.time()
         try:
             self._commands[self._args.cmd]()
         except KeyError:
@@ -59,6 +103,17 @@ class SwarmCommand(object):
             print('Connection Timeout to Swarm API.')
         except KeyboardInterrupt:
             print('Terminated.')
+        finally:
+            if self._forward and self._args.cmd not in READ_ONLY_COMMANDS:
+                # run here rather than by `swarm serve`, whose cached listing is out of date now
+                invalidate(socket_path())
+            tracer = SwarmClient.tracer
+            if tracer is not None:
+                tracer.phase('command', start, time.time())
+                if self._args.trace:
+                    tracer.summary()
+                if self._args.trace_json:
+                    tracer.dump(self._args.trace_json)
 
     def _swarm_api(self):
         notice = '[Notice] No swarm api in use'
@@ -67,13 +122,13 @@ class SwarmCommand(object):
             if self._args.command == 'set':
                 if not is_api_inuse(self._config):
                     print('\033[33m{notice}\033[0m'.format(notice=notice))
-                for item in self._args.argument:
-                    if item.count('=') == 1:
-                        name, api = item.split('=')
-                        self._args.func.add_api(name, api)
-                    else:
-                        print('bad format for api (expected name=value)')
-                        exit(1)
+                try:
+                    apis = parse_pairs(self._args.argument, 'api')
+                except ValueError as e:
+                    print(e)
+                    exit(1)
+                # all apis are written at once
+                self._args.func.add_apis(apis)
             elif self._args.command == 'unset':
                 if not is_api_inuse(self._config):
                     print('\033[33m{notice}\033[0m'.format(notice=notice))
@@ -83,10 +138,22 @@ class SwarmCommand(object):
                 self._args.func.set_version(self._args.argument[0])
             elif self._args.command == 'use':
                 self._args.func.set_api(self._args.argument[0])
+                if self._args.argument[0] == 'auto' and self._args.func.current == 'auto':
+                    self._swarm_api_probe()
+            elif self._args.command == 'probe':
+                try:
+                    ttl = parse_duration(self._args.argument[0])
+                except ValueError:
+                    print('Error: invalid TTL `{ttl}` (expected 30s, 5m, 1h or seconds)'.format(ttl=self._args.argument[0]))
+                    exit(1)
+                self._swarm_api_probe(ttl)
             elif self._args.command in ('tls', 'tlscacert', 'tlscert', 'tlskey', 'tlsverify'):
                 if not is_api_inuse(self._config):
                     print('\033[31m{error}\033[0m'.format(error=error))
                     return
+                if self._args.func.current == 'auto':
+                    print('\033[31m[ERROR] tls settings belong to a named api, issue `swarm api use NAME` first\033[0m')
+                    return
                 if self._args.command == 'tls':
                     self._args.func.set_tls(self._args.argument[0])
                 elif self._args.command == 'tlscacert':
@@ -107,21 +174,47 @@ class SwarmCommand(object):
                     print('\033[31m{error}\033[0m'.format(error=error))
                     return
                 self._args.func.get_tlsconfig()
+            elif self._args.command == 'probe':
+                self._swarm_api_probe()
             else:
                 print('Issue `swarm api -h` for help.')
                 exit(1)
 
+    def _swarm_api_probe(self, ttl=None):
+        """
+        Rank configured apis by ping latency, cache the ranking for `swarm api use auto`
+        """
+        ranking = SwarmClient().probe()
+        if not ranking:
+            print('No available swarm api')
+            return
+        self._args.func.set_probe(ranking, ttl)
+        length = max(len(rank['name']) for rank in ranking + [{'name': 'NAME'}])
+        api_length = max(len(rank['api']) for rank in ranking + [{'api': 'API'}])
+        print('{name:<{length}}    {api:<{api_length}}    {latency:<10}STATUS'.format(name='NAME', length=length,
+                                                                                     api='API', api_length=api_length,
+                                                                                     latency='LATENCY'))
+        for rank in ranking:
+            latency = '{ms:.1f}ms'.format(ms=rank['latency']*1000) if rank['latency'] is not None else '-'
+            status = 'healthy' if rank['healthy'] else 'unreachable'
+            print('{name:<{length}}    {api:<{api_length}}    {latency:<10}{status}'.format(name=rank['name'],
+                                                                                           length=length,
+                                                                                           api=rank['api'],
+                                                                                           api_length=api_length,
+                                                                                           latency=latency,
+                                                                                           status=status))
+
     def _swarm_version(self):
-        self._args.func()
+        self._args.func(output=self._args.output, fields=self._args.fields)
 
     def _swarm_info(self):
-        self._args.func()
+        self._args.func(output=self._args.output, fields=self._args.fields)
 
     def _swarm_login(self):
-        config_file = os.path.join(os.environ['HOME'], '.docker', 'config.json')
         registry = self._args.SERVER
+        credentials = CredentialResolver.get()
         try:
-            conf = load_config(config_file)
+            conf = credentials.config['auths']
         except errors.InvalidConfigFile as e:
             print(e)
             exit(1)
@@ -171,24 +264,8 @@ class SwarmCommand(object):
         if ret is not None:
             if ret.get('Status') == 'Login Succeeded':
                 try:
-                    if os.path.exists(config_file):
-                        with open(config_file) as f:
-                            data = json.load(f)
-                    else:
-                        data = { 'auths': {} }
-                    auth = base64.b64encode('{user}:{passwd}'.format(user=username_input,passwd=password_input)).decode('ascii')
-                    data['auths'][registry] = {
-                        'auth': auth,
-                        'email': email_input
-                    }
-                    try:
-                        os.mkdir(os.path.join(os.environ['HOME'], '.docker'))
-                    except OSError as e:
-                        if e.errno != os.errno.EEXIST:
-                            raise
-                    with open(config_file, 'w') as f:
-                        f.write(json.dumps(data, indent=4))
-                except IOError as e:
+                    config_file = credentials.save(registry, username_input, password_input, email_input)
+                except (IOError, OSError) as e:
                     print (e)
                     exit(1)                
                 print('WARNING: login credentials saved in {config_file}'.format(config_file=config_file))
@@ -207,16 +284,16 @@ class SwarmCommand(object):
                     print('bad format of filter (expected name=value)')
                     exit(1)
         if self._args.limit is not None:
-            limit = []
-            for node in self._args.limit:
-                if detect_range(node):
-                    limit.extend(expand_hostname_range(node))
-                else:
-                    limit.append(node)
-            limit = tuple(limit)
+            try:
+                limit = HostMatcher(self._args.limit)
+            except ValueError as e:
+                print('Error: {error}'.format(error=e))
+                exit(1)
         else:
             limit = None
-        self._args.func(show_all=self._args.all,filters=filters,limit=limit)
+        self._args.func(show_all=self._args.all,filters=filters,limit=limit,
+                        output=self._args.output,fields=self._args.fields,
+                        group_by=self._args.group_by if self._args.summary else None)
 
     def _swarm_run(self):
         labels = None
@@ -225,81 +302,33 @@ class SwarmCommand(object):
         port_bindings = None
         volumes = None
         dns = self._args.dns if self._args.dns is not None else []
-        # handle container lables
-        if self._args.label is not None:
-            labels = {}
-            for item in self._args.label:
-                if item.count('=') == 1:
-                    name, value = item.split('=')
-                    labels[name] = value
-                else:
-                    print('bad format of label (expected name=value)')
-                    exit(1)
-        # handle container link
-        if self._args.link is not None:
-            links = {}
-            for item in self._args.link:
-                if item.count(':') == 0:
-                    name = alias = item
-                elif item.count(':') == 1:
-                    name, alias = item.split(':')
-                else:
-                    print('bad format for link (expected name:alias)')
-                    exit(1)
-                links[name] = alias
-        # handle log-driver options
-        log_driver = self._args.log_driver
-        logs = 1  # keep backwards compatibility for dockerpty
-        if log_driver == 'none':
-            logs = 0
-        log_config = {
-            'type': log_driver,
-            'config': {}
-        }
-        if self._args.log_opt is not None:
-            for opt in self._args.log_opt:
-                if opt.count('=') == 1:
-                    name, value = opt.split('=')
-                    log_config['config'][name] = value
-                else:
-                    print('bad format for log-opt (expected name=value)')
-                    exit(1)
-        # handle published ports
-        if self._args.publish is not None:
-            ports = []
-            port_bindings = {}
-            for item in self._args.publish:
-                # expected format: ip:hostPort:containerPort | ip::containerPort | hostPort:containerPort | containerPort
-                if item.count(':') == 0:
-                    containerPort = item
-                    port_bindings[containerPort] = None
-                elif item.count(':') == 1:
-                    hostPort, containerPort = item.split(':')
-                    port_bindings[containerPort] = hostPort
-                elif item.count(':') == 2:
-                    hostIp, hostPort, containerPort = item.split(':')
-                    port_bindings[containerPort] = (hostIp, hostPort) if hostPort else (hostIp,)
-                else:
-                    print('bad format for publish (expected ip:hostPort:containerPort | ip::containerPort | hostPort:containerPort | containerPort)')
-                    exit(1)
-                if containerPort.find('/udp') > 0:
-                    containerPort, protocol = containerPort.split('/')
-                    ports.append((containerPort, protocol))
-                else:
-                    ports.append(containerPort)
-        # handler container volumes
-        if self._args.volume is not None:
-            volumes = []
-            for item in self._args.volume:
-                # expected format: containerPath | hostPath:containerPath | hostPath:containerPath:[ro|rw]
-                if item.count(':') == 0:
-                    volumes.append(item)
-                elif item.count(':') == 1:
-                    volumes.append(item.split(':')[1])
-                elif item.count(':') == 2:
-                    volumes.append(item.split(':')[1])
-                else:
-                    print('bad format of volume (expected containerPath | hostPath:containerPath | hostPath:containerPath:[ro|rw])')
+        try:
+            # handle container lables
+            if self._args.label is not None:
+                labels = parse_pairs(self._args.label, 'label')
+            # handle container link
+            if self._args.link is not None:
+                links = parse_links(self._args.link)
+            # handle log-driver options
+            log_driver = self._args.log_driver
+            logs = 1  # keep backwards compatibility for dockerpty
+            if log_driver == 'none':
+                logs = 0
+            log_config = {
+                'type': log_driver,
+                'config': {}
+            }
+            if self._args.log_opt is not None:
+                log_config['config'] = parse_pairs(self._args.log_opt, 'log-opt')
+            # handle published ports
+            if self._args.publish is not None:
+                ports, port_bindings = parse_ports(self._args.publish)
+            # handler container volumes
+            if self._args.volume is not None:
+                volumes = parse_volumes(self._args.volume)
+        except ValueError as e:
+            print(e)
+            exit(1)
         # handle command
         _command = []
         if self._args.COMMAND is not None:
@@ -378,10 +407,16 @@ class SwarmCommand(object):
             command.append(self._args.COMMAND)
         if self._args.ARG is not None:
             command.extend(self._args.ARG)
-        self._args.func(self._args.CONTAINER, command, self._args.detach, self._args.interactive, self._args.tty, self._args.user)
+        if self._args.all:
+            self._args.exec_all((self._args.CONTAINER,), command, self._args.user, timeout=self._args.timeout,
+                                workers=self._args.workers, prefix=self._args.prefix)
+        else:
+            self._args.func(self._args.CONTAINER, command, self._args.detach, self._args.interactive, self._args.tty, self._args.user)
 
     def _swarm_top(self):
-        self._args.func(self._args.CONTAINER, self._args.ps_args)
+        self._args.func(tuple(self._args.CONTAINER), ps_args=self._args.ps_args, sort=self._args.sort,
+                        top=self._args.top, workers=self._args.workers, output=self._args.output,
+                        fields=self._args.fields)
 
     def _swarm_kill(self):
         signal = self._args.signal if self._args.signal is not None else 'SIGKILL'
@@ -394,16 +429,17 @@ class SwarmCommand(object):
                 ret = self._args.inspect_container(self._args.OBJECT)
             elif self._args.type == 'image':
                 ret = self._args.inspect_image(self._args.OBJECT)
-            if ret is not None:
-                print(ret)
         else:
         # print both otherwise
             ret = []
             for data in (self._args.inspect_container(self._args.OBJECT), self._args.inspect_image(self._args.OBJECT)):
                 if data is not None:
                     ret.extend(data)
-            if ret:
-                print(ret)
+        if ret:
+            writer = JsonWriter(self._args.output or 'json', self._args.fields, indent=4)
+            for data in ret:
+                writer.write(data)
+            writer.close()
 
     def _swarm_rename(self):
         self._args.func(self._args.CONTAINER, self._args.NAME)
@@ -418,6 +454,29 @@ class SwarmCommand(object):
         self._args.func(self._args.CONTAINER, timestamps=self._args.timestamp,
                         tail=tail, since=self._args.since, follow=self._args.follow)
 
+    def _split_container_path(self, arg):
+        """
+        Return (container, path) of CONTAINER:PATH, container is None for a local path
+        Local paths containing a colon have to start with / or .
+        """
+        if arg == '-' or arg.startswith(('/', '.')) or ':' not in arg:
+            return None, arg
+        return tuple(arg.split(':', 1))
+
+    def _swarm_cp(self):
+        src_container, src = self._split_container_path(self._args.SRC)
+        dst_container, dst = self._split_container_path(self._args.DST)
+        if (src_container is None) == (dst_container is None):
+            print('Error: copying between containers or between local paths is not supported')
+            exit(1)
+        if src_container is not None:
+            if src_container.count('*') > 0:
+                print('Error: copying from several containers is not supported')
+                exit(1)
+            self._args.func.get(src_container, src, dst)
+        else:
+            self._args.func.put(src, [dst_container], dst, workers=self._args.workers)
+
     def _swarm_images(self):
         filters = {}
         if self._args.filter:
@@ -428,7 +487,8 @@ class SwarmCommand(object):
                 else:
                     print('bad format for filter (expected name=value)')
                     exit(1)
-        self._args.func(name=self._args.REPOSITORY,show_all=self._args.all,filters=filters)
+        self._args.func(name=self._args.REPOSITORY,show_all=self._args.all,filters=filters,
+                        output=self._args.output,fields=self._args.fields)
 
     def _swarm_rmi(self):
         images = set()
@@ -448,12 +508,11 @@ class SwarmCommand(object):
 
     def _swarm_pull(self):
         auth_config = None
-        repo_name = self._args.REPOTAG.split(':', 1)
-        if len(repo_name) == 1:
-            repo = repo_name[0]
-            tag = None
-        else:
-            repo, tag = repo_name
+        images = []
+        for repotag in self._args.REPOTAG:
+            # the tag is after the last colon unless it belongs to the registry host, e.g. localhost:5000/app
+            repo, _, tag = repotag.rpartition(':') if ':' in repotag.rsplit('/', 1)[-1] else (repotag, None, None)
+            images.append((repo, tag))
         if self._args.auth is not None:
             if self._args.auth.count(':') == 1:
                 username, password = self._args.auth.split(':')
@@ -464,7 +523,8 @@ class SwarmCommand(object):
                 'username': username,
                 'password': password
             }
-        self._args.func(repo, tag=tag, insecure_registry=self._args.insecure, auth_config=auth_config)
+        self._args.func(images, insecure_registry=self._args.insecure, auth_config=auth_config,
+                        workers=self._args.workers)
 
     def _swarm_push(self):
         repo_name = self._args.REPOTAG.split(':', 1)
@@ -475,7 +535,22 @@ class SwarmCommand(object):
             repo, tag = repo_name
         self._args.func(repo, tag=tag, insecure_registry=self._args.insecure)
 
+    def _swarm_image(self):
+        try:
+            targets = HostMatcher(self._args.to)
+        except ValueError as e:
+            print('Error: {error}'.format(error=e))
+            exit(1)
+        self._args.func(self._args.IMAGE, targets, source=self._args.source, compress=self._args.compress)
+
     def _swarm_build(self):
+        if self._args.matrix is not None:
+            self._args.func.matrix(self._args.matrix, log_dir=self._args.log_dir, workers=self._args.workers,
+                                   build_report=self._args.build_report)
+            return
+        if self._args.PATH is None:
+            print('Error: PATH is required unless --matrix is given')
+            exit(2)
         container_limits = {}
         buildargs = None
         # produce container_limits
@@ -508,7 +583,50 @@ class SwarmCommand(object):
         self._args.func(path=self._args.PATH, tag=self._args.tag, quiet=self._args.quiet,
                         nocache=self._args.no_cache, rm=self._args.rm, pull=self._args.pull,
                         forcerm=self._args.force_rm, dockerfile=self._args.file,
-                        container_limits=container_limits, decode=True, buildargs=buildargs)
+                        container_limits=container_limits, decode=True, buildargs=buildargs,
+                        build_report=self._args.build_report)
 
     def _swarm_search(self):
-        self._args.func(self._args.TERM, automated=self._args.automated, no_trunc=self._args.no_trunc, stars=self._args.stars)
+        self._args.func(self._args.TERM, registries=self._args.registry, automated=self._args.automated,
+                        no_trunc=self._args.no_trunc, stars=self._args.stars, cache_ttl=self._args.cache_ttl,
+                        workers=self._args.workers, output=self._args.output, fields=self._args.fields,
+                        registry_ca=self._args.registry_ca, insecure=self._args.insecure)
+
+    def _swarm_apply(self):
+        try:
+            spec = load_spec(self._args.file)
+        except (IOError, ValueError) as e:
+            print(e)
+            exit(1)
+        self._args.func(spec, dry_run=self._args.dry_run, prune=self._args.prune,
+                        workers=self._args.workers, timeout=self._args.time)
+
+    def _swarm_rolling_restart(self):
+        self._args.func(tuple(self._args.CONTAINER), batch=self._args.batch, wait_healthy=self._args.wait_healthy,
+                        interval=self._args.interval, max_failure_ratio=self._args.max_failure_ratio,
+                        timeout=self._args.time)
+
+    def _swarm_stats(self):
+        output = 'json' if self._args.json else None
+        self._args.func(tuple(self._args.CONTAINER), no_stream=self._args.no_stream, output=output,
+                        interval=self._args.interval)
+
+    def _swarm_exporter(self):
+        self._args.func(listen=self._args.listen, interval=self._args.interval, events=not self._args.no_events)
+
+    def _swarm_batch(self):
+        self._args.func(self._parser, self._args.file, workers=self._args.workers, sequential=self._args.sequential)
+
+    def _swarm_serve(self):
+        self._args.func(self._parser, SwarmCommand, self._args.socket, workers=self._args.workers,
+                        cache_ttl=self._args.cache_ttl)
+
+    def _swarm_snapshot(self):
+        self._args.func(self._args.FILE, inspect=self._args.inspect, workers=self._args.workers)
+
+    def _swarm_diff(self):
+        if (self._args.NEW is None) == (not self._args.live):
+            print('Error: expected either a second snapshot or --live')
+            exit(2)
+        self._args.func(self._args.OLD, self._args.NEW, output=self._args.output, fields=self._args.fields,
+                        workers=self._args.workers)
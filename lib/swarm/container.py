@@ -1,13 +1,29 @@
 # -*- coding: utf8 -*-
 
 from __future__ import print_function
+import os
+import sys
 import six
+import json
+import time
+import socket
+import struct
+import tarfile
+import tempfile
+import threading
 import dockerpty
 from docker import errors
+from docker.utils import decode_json_header
 from datetime import datetime
-from fnmatch import fnmatch
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from swarm.client import SwarmClient
-from swarm.utils import timeformat, pyprint
+from swarm.snapshot import ContainerSnapshot, CONTAINER_STATES
+from swarm.utils import timeformat, byteformat, pyprint, concurrent_map, textformat, parse_system_status, iter_shared,\
+                        JsonWriter
+if sys.version_info >= (3, 7):
+    from swarm.aio import AsyncSwarmClient
+else:
+    AsyncSwarmClient = None
 
 
 class ContainerBase(object):
@@ -23,40 +39,52 @@ class ContainerBase(object):
         self.max_command_length = 20
         self.max_id_length = 12
 
-    def _handle_wildcard(self, pattern):
-        names = []
-        cli = self.swarm.client
-        if cli is not None:
-            containers = cli.containers(all=True)
-            containers_name = tuple((name.split('/')[2] for container in containers
-                                                        for name in container['Names']
-                                                        if name.count('/') == 2))
-            for name in containers_name:
-                if fnmatch(name, pattern):
-                    names.append(name)
-        return names
+    def _resolve_containers(self, cli, container_list, show_all=True):
+        """
+        Expand wildcard names of container_list using a single listing
+        """
+        if not [container for container in container_list if container.count('*') > 0]:
+            return list(container_list)
+        return ContainerSnapshot(cli.containers(all=show_all)).resolve(container_list)
 
-    def _handle_containers(self, command, container, **kwargs):
+    def _handle_bulk(self, command, container_list, workers=100, **kwargs):
         """
+        Run command against every container of container_list concurrently, wildcard names are expanded
+        Print errors and container names in the order of container_list
         :param command(str): must be one of ['start', 'stop', 'restart', 'remove', 'kill']
-        :param container_list(list): list containes container ids or names
-        :param kwargs: optional keyword arguments
+        :param workers(int): Number of requests in flight at once
         """
-        cli = self.swarm.client
-        if cli is not None:
-            handlers = {
-                'start': cli.start,
-                'stop': cli.stop,
-                'restart': cli.restart,
-                'remove': cli.remove_container,
-                'kill': cli.kill
-            }
-            try:
-                handlers[command](container, **kwargs)
-            except (errors.NotFound, errors.APIError, errors.DockerException) as e:
-                pyprint(e.explanation)
-            finally:
-                cli.close()
+        ret = None
+        # a batch already runs commands concurrently over its shared client
+        if AsyncSwarmClient is not None and SwarmClient.shared is None:
+            cli = AsyncSwarmClient(limit=workers)
+            ret = cli.run(cli.handle_containers, command, container_list, **kwargs)
+        else:
+            cli = self.swarm.pooled(maxsize=workers)
+            if cli is not None:
+                handlers = {
+                    'start': cli.start,
+                    'stop': cli.stop,
+                    'restart': cli.restart,
+                    'remove': cli.remove_container,
+                    'kill': cli.kill
+                }
+
+                def handle(container):
+                    try:
+                        handlers[command](container, **kwargs)
+                        return container, None
+                    except (errors.NotFound, errors.APIError, errors.DockerException) as e:
+                        return container, e.explanation
+                try:
+                    ret = concurrent_map(handle, self._resolve_containers(cli, container_list), workers)
+                except (errors.NotFound, errors.APIError, errors.DockerException) as e:
+                    pyprint(e.explanation)
+                cli.release()
+        for container, error in ret or []:
+            if error is not None:
+                pyprint(error)
+            print(container)
 
 
 class Containers(ContainerBase):
@@ -64,58 +92,131 @@ class Containers(ContainerBase):
     def __init__(self):
         super(Containers, self).__init__()
 
-    def _get_containers(self, show_all=False, filters={}, limit=None, latest=None, since=None):
+    def _check_limit(self, cli, limit):
+        """
+        Warn about node patterns of limit which match no node of the cluster
+        """
+        info = cli.info()
+        # DriverStatus is deprecated since api v1.23
+        nodes = parse_system_status(info['SystemStatus'] if info.get('DriverStatus') is None else info['DriverStatus'])
+        for pattern in limit.unmatched((node['name'] for node in nodes)):
+            print('No node matches `{pattern}`'.format(pattern=pattern), file=sys.stderr)
+
+    def _get_containers(self, show_all=False, filters={}, limit=None, latest=None, since=None, writer=None):
         """
         :param show_all(bool): Show all containers. Only running containers are shown by default
         :param filters(dict): Filters to be processed on the image list
-        :parma limit(tuple or list): Filter containers by node name or node pattern
+        :parma limit(HostMatcher): Filter containers by node name or node pattern
         :param latest(bool): Show only the latest created container, include non-running ones
         :param since(str): Show only containers created since Id or Name, include non-running containers
+        :param writer(JsonWriter): Write the records of the API to writer instead of collecting rows to print
         """
         cli = self.swarm.client
         if cli is not None:
             try:
                 ret = cli.containers(all=show_all, filters=filters, latest=latest, since=since)
+                if limit is not None:
+                    self._check_limit(cli, limit)
             except (errors.NotFound, errors.APIError, errors.DockerException) as e:
                 pyprint(e.explanation)
                 return
             finally:
                 cli.close()
-            if ret:
-                for container in ret:
-                    # if limit is provide, then get containers against it
-                    node = container['Names'][0].split('/', 2)[1]
-                    if limit is not None:
-                        if not node in limit:
-                            continue
-                    # 'Names' includes self container name as well as names of linked containers
-                    # Filter name by checking '/'
-                    for names in container['Names']:
-                        if names.count('/') == 2:
-                            name = names.split('/')[2]
-                            break
-                    # convert created timestamp to human-readable string
-                    created_delta = datetime.now() - datetime.fromtimestamp(container['Created'])
-                    if created_delta.days > 1:
-                        created = '{day} days ago'.format(day=created_delta.days)
-                    else:
-                        created = timeformat(created_delta.seconds + created_delta.days * 86400)
-                    # get the longest node/created/status field length for pretty print
-                    self.node_length = len(node) if len(node) > self.node_length else self.node_length
-                    self.image_length = len(container['Image']) if len(container['Image']) > self.image_length\
-                                                                else self.image_length
-                    if len(container['Command']) < self.command_length:
-                        command = container['Command']
-                    else:
-                        command = container['Command'] if len(container['Command']) < self.max_command_length\
-                                                       else container['Command'][:self.max_command_length]
-                        self.command_length = len(container['Command']) if len(container['Command']) < self.max_command_length\
-                                                                        else self.max_command_length
-                    self.created_length = len(created) if len(created) > self.created_length else self.created_length
-                    self.status_length = len(container['Status']) if len(container['Status']) > self.status_length else self.status_length
-                     # (Id, Node, Image, Command, Created, Status, Names)
-                    data = (container['Id'], node, container['Image'], command, created, container['Status'], name)
-                    self.containers.setdefault(node, []).append(data)
+            snapshot = ContainerSnapshot(ret or ())
+            rows = snapshot.rows(limit)
+            if writer is not None:
+                # a row is the position of its record in the listing
+                for row in sorted(rows):
+                    writer.write(ret[row])
+                return
+            now = datetime.now()
+            created = []
+            for row in rows:
+                # convert created timestamp to human-readable string
+                created_delta = now - datetime.fromtimestamp(snapshot.created[row])
+                if created_delta.days > 1:
+                    created.append('{day} days ago'.format(day=created_delta.days))
+                else:
+                    created.append(timeformat(created_delta.seconds + created_delta.days * 86400))
+            # get the longest node/image/command/created/status field length for pretty print
+            self.node_length = max([self.node_length] + [len(node) for node in snapshot.by_node if limit is None or node in limit])
+            self.image_length = max([self.image_length] + [len(snapshot.images[row]) for row in rows])
+            self.command_length = max([self.command_length] + [min(len(snapshot.commands[row]), self.max_command_length) for row in rows])
+            self.created_length = max([self.created_length] + [len(value) for value in created])
+            self.status_length = max([self.status_length] + [len(snapshot.statuses[row]) for row in rows])
+            if rows:
+                self.containers = (snapshot, list(zip(rows, created)))
+
+    def _summarize(self, group_by='node', filters={}, limit=None):
+        """
+        Fold the listing of all containers into counters per group and state in one pass
+        :param group_by(str): 'node', 'image', 'status' or 'label:KEY'
+        Return {group: {state: count}}, None on error
+        """
+        cli = self.swarm.client
+        if cli is None:
+            return None
+        try:
+            ret = cli.containers(all=True, filters=filters)
+            if limit is not None:
+                self._check_limit(cli, limit)
+        except (errors.NotFound, errors.APIError, errors.DockerException) as e:
+            pyprint(e.explanation)
+            return None
+        finally:
+            cli.close()
+        snapshot = ContainerSnapshot(ret or ())
+        label = group_by[len('label:'):] if group_by.startswith('label:') else None
+        groups = {}
+        for row in (snapshot.rows(limit) if limit is not None else range(len(snapshot))):
+            state = snapshot.states[row]
+            if label is not None:
+                key = snapshot.labels[row].get(label, '<none>')
+            elif group_by == 'node':
+                key = snapshot.nodes[row]
+            elif group_by == 'image':
+                key = snapshot.images[row]
+            else:
+                key = snapshot.state_names[state]
+            counters = groups.get(key)
+            if counters is None:
+                counters = groups[key] = {}
+            counters[state] = counters.get(state, 0) + 1
+        # states are counted by their index in the snapshot
+        return dict((key, dict((snapshot.state_names[state], count) for state, count in counters.items()))
+                    for key, counters in groups.items())
+
+    def _print_summary(self, groups, group_by, output=None, fields=None):
+        states = [state for state in CONTAINER_STATES if [1 for counters in groups.values() if state in counters]] +\
+                 sorted(set(state for counters in groups.values() for state in counters) - set(CONTAINER_STATES))
+        column = 'label' if group_by.startswith('label:') else group_by
+        records = []
+        for key in sorted(groups):
+            record = {column: key, 'total': sum(groups[key].values())}
+            record.update((state, groups[key].get(state, 0)) for state in states)
+            records.append(record)
+        totals = dict((state, sum(record[state] for record in records)) for state in ['total'] + states)
+        if output is not None:
+            writer = JsonWriter(output, fields)
+            for record in records:
+                writer.write(record)
+            writer.close()
+            return
+        titles = [group_by.upper()] + [state.upper() for state in ['total'] + states]
+        rows = [[record[column]] + [str(record[state]) for state in ['total'] + states] for record in records]
+        rows.append(['TOTAL'] + [str(totals[state]) for state in ['total'] + states])
+        length = [len(title) for title in titles]
+        for row in rows:
+            for i, value in enumerate(row):
+                if len(value) > length[i]:
+                    length[i] = len(value)
+        string = ''
+        for row in [titles] + rows:
+            line = ''
+            for i, value in enumerate(row):
+                line += value + ' ' * (length[i]-len(value)+4)
+            string += line.rstrip() + '\n'
+        print(string.rstrip())
 
     def _pretty_print(self):
         if self.containers:
@@ -136,16 +237,18 @@ CONTAINER ID{s1}NODE{s2}IMAGE{s3}COMMAND{s4}CREATED{s5}STATUS{s6}NAMES'.format(s
                                                                                s6=s6)
             # pretty-print string defined by title
             string = ''
-            for node in sorted(self.containers):
-                for data in self.containers[node]:
-                    cid, node, image, command, created, status, names = data
-                    s1 = ' ' * blank
-                    s2 = ' ' * (self.node_length+blank-len(node))
-                    s3 = ' ' * (self.image_length+blank-len(image))
-                    s4 = ' ' * (self.command_length+blank-len(command))
-                    s5 = ' ' * (self.created_length+blank-len(created))
-                    s6 = ' ' * (self.status_length+blank-len(status))
-                    string += '\
+            snapshot, rows = self.containers
+            for row, created in rows:
+                cid, node, image, status, names = snapshot.ids[row], snapshot.nodes[row], snapshot.images[row],\
+                                                  snapshot.statuses[row], snapshot.names[row]
+                command = snapshot.commands[row][:self.max_command_length]
+                s1 = ' ' * blank
+                s2 = ' ' * (self.node_length+blank-len(node))
+                s3 = ' ' * (self.image_length+blank-len(image))
+                s4 = ' ' * (self.command_length+blank-len(command))
+                s5 = ' ' * (self.created_length+blank-len(created))
+                s6 = ' ' * (self.status_length+blank-len(status))
+                string += '\
 {id}{s1}{node}{s2}{image}{s3}"{command}"{s4}{created}{s5}{status}{s6}{names}\n'.format(id=cid[:self.max_id_length],
                                                                                        s1=s1,
                                                                                        node=node,
@@ -162,7 +265,23 @@ CONTAINER ID{s1}NODE{s2}IMAGE{s3}COMMAND{s4}CREATED{s5}STATUS{s6}NAMES'.format(s
             # print pretty-print string
             print('{title}\n{string}'.format(title=title,string=string.rstrip()))
 
-    def __call__(self, **kwargs):
+    def __call__(self, output=None, fields=None, group_by=None, **kwargs):
+        """
+        :param output(str): 'json' or 'ndjson' prints the records of the API instead of a table
+        :param fields(list): With output, only keep these fields of every record
+        :param group_by(str): Print counts of containers per state grouped by 'node', 'image', 'status' \
+or 'label:KEY' instead of the containers
+        """
+        if group_by is not None:
+            groups = self._summarize(group_by, filters=kwargs.get('filters', {}), limit=kwargs.get('limit'))
+            if groups is not None:
+                self._print_summary(groups, group_by, output, fields)
+            return
+        if output is not None:
+            writer = JsonWriter(output, fields)
+            self._get_containers(writer=writer, **kwargs)
+            writer.close()
+            return
         self._get_containers(**kwargs)
         self._pretty_print()
 
@@ -172,19 +291,12 @@ class StartContainer(ContainerBase):
     def __init__(self):
         super(StartContainer, self).__init__()
 
-    def __call__(self, container_list):
+    def __call__(self, container_list, workers=100):
         """
         :param container_list(list): List of container id or name
+        :param workers(int): Number of containers handled concurrently
         """
-        for container in container_list:
-            if container.count('*') > 0: # wildcard name
-                containers = self._handle_wildcard(container)
-                for _container in containers:
-                    self._handle_containers('start', _container)
-                    print(_container)
-            else:
-                self._handle_containers('start', container)
-                print(container)
+        self._handle_bulk('start', container_list, workers=workers)
 
 
 class StopContainer(ContainerBase):
@@ -192,20 +304,13 @@ class StopContainer(ContainerBase):
     def __init__(self):
         super(StopContainer, self).__init__()
 
-    def __call__(self, container_list, timeout):
+    def __call__(self, container_list, timeout, workers=100):
         """
         :param container_list(list): List of container id or name
         :param timeout(int): Timeout in seconds to wait for the container to stop before sending a SIGKIL
+        :param workers(int): Number of containers handled concurrently
         """
-        for container in container_list:
-            if container.count('*') > 0: # wildcard name
-                containers = self._handle_wildcard(container)
-                for _container in containers:
-                    self._handle_containers('stop', _container, timeout=timeout)
-                    print(_container)
-            else:
-                self._handle_containers('stop', container, timeout=timeout)
-                print(container)
+        self._handle_bulk('stop', container_list, workers=workers, timeout=timeout)
 
 
 class RestartContainer(ContainerBase):
@@ -213,20 +318,106 @@ class RestartContainer(ContainerBase):
     def __init__(self):
         super(RestartContainer, self).__init__()
 
-    def __call__(self, container_list, timeout=10):
+    def __call__(self, container_list, timeout=10, workers=100):
         """
         :param container_list(list): List of container id or name
         :param timeout(int): Timeout in seconds to wait for the container to stop before sending a SIGKIL
+        :param workers(int): Number of containers handled concurrently
         """
-        for container in container_list:
-            if container.count('*') > 0: # wildcard name
-                containers = self._handle_wildcard(container)
-                for _container in containers:
-                    self._handle_containers('restart', _container, timeout=timeout)
-                    print(_container)
-            else:
-                self._handle_containers('restart', container, timeout=timeout)
-                print(container)
+        self._handle_bulk('restart', container_list, workers=workers, timeout=timeout)
+
+
+class RollingRestart(ContainerBase):
+
+    def __init__(self):
+        super(RollingRestart, self).__init__()
+
+    def _restart(self, cli, container, timeout):
+        try:
+            cli.restart(container, timeout=timeout)
+            return True
+        except (errors.NotFound, errors.APIError, errors.DockerException) as e:
+            pyprint('{container}: {error}'.format(container=container, error=textformat(e.explanation)))
+            return False
+
+    def _health(self, cli, container):
+        """
+        Return 'healthy', 'unhealthy' or 'starting' from the container state.
+        Containers without HEALTHCHECK are healthy once running.
+        """
+        try:
+            state = cli.inspect_container(container)['State']
+        except (errors.NotFound, errors.APIError, errors.DockerException) as e:
+            pyprint('{container}: {error}'.format(container=container, error=textformat(e.explanation)))
+            return 'unhealthy'
+        if state.get('Health') is not None:
+            return state['Health']['Status']
+        if state.get('Running') and not state.get('Restarting'):
+            return 'healthy'
+        if state.get('Status') in ('exited', 'dead'):
+            return 'unhealthy'
+        return 'starting'
+
+    def _wait_healthy(self, cli, containers, wait, interval, workers):
+        """
+        Poll the state of containers once per interval until all of them
+        are healthy or wait seconds elapse, return the unhealthy ones
+        """
+        deadline = time.time() + wait
+        pending = list(containers)
+        unhealthy = []
+        while pending:
+            states = concurrent_map(lambda container: self._health(cli, container), pending, workers)
+            unhealthy.extend((container for container, state in zip(pending, states) if state == 'unhealthy'))
+            pending = [container for container, state in zip(pending, states) if state == 'starting']
+            if pending:
+                if time.time() + interval > deadline:
+                    unhealthy.extend(pending)
+                    break
+                time.sleep(interval)
+        for container in unhealthy:
+            print('{container}: not healthy'.format(container=container))
+        return unhealthy
+
+    def __call__(self, container_list, batch=1, wait_healthy=0, interval=1, max_failure_ratio=0, timeout=10):
+        """
+        :param container_list(list): List of container id or name
+        :param batch(int): Number of containers restarted at the same time
+        :param wait_healthy(float): Seconds to wait for a batch to become healthy, 0 skips health check
+        :param interval(float): Seconds between two health checks
+        :param max_failure_ratio(float): Abort once failed containers / processed containers exceeds it
+        :param timeout(int): Timeout in seconds to wait for the container to stop before sending a SIGKIL
+        """
+        cli = self.swarm.pooled(maxsize=batch)
+        if cli is not None:
+            try:
+                try:
+                    containers = self._resolve_containers(cli, container_list)
+                except (errors.NotFound, errors.APIError, errors.DockerException) as e:
+                    pyprint(e.explanation)
+                    return
+                batches = [containers[i:i+batch] for i in range(0, len(containers), batch)]
+                processed, failed = 0, 0
+                for index, targets in enumerate(batches, 1):
+                    start = time.time()
+                    ret = concurrent_map(lambda container: self._restart(cli, container, timeout), targets, batch)
+                    restarted = [container for container, ok in zip(targets, ret) if ok]
+                    for container in restarted:
+                        print(container)
+                    unhealthy = []
+                    if wait_healthy > 0 and restarted:
+                        unhealthy = self._wait_healthy(cli, restarted, wait_healthy, interval, batch)
+                    processed += len(targets)
+                    failed += len(targets) - len(restarted) + len(unhealthy)
+                    print('batch {index}/{total}: {ok} ok, {failed} failed in {latency:.2f}s'.format(
+                        index=index, total=len(batches), ok=len(restarted)-len(unhealthy),
+                        failed=len(targets)-len(restarted)+len(unhealthy), latency=time.time()-start))
+                    if failed > processed * max_failure_ratio:
+                        print('Aborted: {failed}/{processed} containers failed'.format(failed=failed,
+                                                                                       processed=processed))
+                        break
+            finally:
+                cli.release()
 
 
 class RemoveContainer(ContainerBase):
@@ -234,22 +425,15 @@ class RemoveContainer(ContainerBase):
     def __init__(self):
         super(RemoveContainer, self).__init__()
 
-    def __call__(self, container_list, **kwargs):
+    def __call__(self, container_list, workers=100, **kwargs):
         """
         :param container_list(list): List of container ids
+        :param workers(int): Number of containers handled concurrently
         :param v(bool): Remove the volumes associated with the container
         :param force(bool): Force the removal of a running container (uses SIGKILL)
         :param: link(bool): Remove the specified link and not the underlying container
         """
-        for container in container_list:
-            if container.count('*') > 0: # wildcard name
-                containers = self._handle_wildcard(container)
-                for _container in containers:
-                    self._handle_containers('remove', _container, **kwargs)
-                    print(_container)
-            else:
-                self._handle_containers('remove', container, **kwargs)
-                print(container)
+        self._handle_bulk('remove', container_list, workers=workers, **kwargs)
 
 
 class CreateContainer(ContainerBase):
@@ -310,42 +494,286 @@ class Top(ContainerBase):
 
     def __init__(self):
         super(Top, self).__init__()
+        self.titles = []
+        self.processes = []
+
+    def _get_targets(self, snapshot, container_list):
+        """
+        Resolve container ids, names and wildcards into (name, node)
+        using a single listing of running containers
+        """
+        targets = []
+        for container in container_list:
+            if container.count('*') > 0: # wildcard name
+                targets.extend(((snapshot.names[row], snapshot.nodes[row]) for row in snapshot.match(container)))
+                continue
+            row = snapshot.find(container)
+            # unknown containers are passed through to let the API report the error
+            targets.append((snapshot.names[row], snapshot.nodes[row]) if row is not None else (container, ''))
+        return targets
+
+    def _top(self, cli, container, ps_args):
+        try:
+            return cli.top(container, ps_args)
+        except (errors.NotFound, errors.APIError, errors.DockerException) as e:
+            pyprint('{container}: {error}'.format(container=container, error=textformat(e.explanation)))
+
+    def _sort_key(self, value):
+        # numeric columns such as %CPU or RSS sort in descending order
+        try:
+            return (0, -float(value))
+        except ValueError:
+            return (1, value)
 
     def _pretty_print(self):
-        string = ''
-        length = []
-        for title in self.ret['Titles']:
-            length.append(len(title))
-        for process in self.ret['Processes']:
-            for value in process:
-                i = process.index(value)
+        if self.processes:
+            length = [len(title) for title in self.titles]
+            for process in self.processes:
+                for i, value in enumerate(process):
+                    if len(value) > length[i]:
+                        length[i] = len(value)
+            string = ''
+            for i, title in enumerate(self.titles):
+                string += title + ' ' * (length[i]-len(title)+4)
+            string = string.rstrip() + '\n'
+            for process in self.processes:
+                line = ''
+                for i, value in enumerate(process):
+                    line += value + ' ' * (length[i]-len(value)+4)
+                string += line.rstrip() + '\n'
+            print(string.strip())
+
+    def __call__(self, container_list, ps_args=None, sort=None, top=None, workers=20, output=None, fields=None):
+        """
+        :param container_list(list): List of container id or name, wildcard is supported
+        :param ps_args(str): An optional arguments passed to ps (e.g., aux), \
+the last item of container_list when it is no container and ps_args is None
+        :param sort(str): Column to sort processes by, e.g., %CPU or RSS
+        :param top(int): Only show the first top processes
+        :param workers(int): Number of concurrent requests
+        :param output(str): 'json' or 'ndjson' prints one record per process, keyed by column, instead of a table
+        :param fields(list): With output, only keep these columns
+        """
+        cli = self.swarm.pooled(maxsize=workers)
+        if cli is not None:
+            try:
+                try:
+                    snapshot = ContainerSnapshot(cli.containers())
+                except (errors.NotFound, errors.APIError, errors.DockerException) as e:
+                    pyprint(e.explanation)
+                    return
+                container_list = list(container_list)
+                last = container_list[-1] if len(container_list) > 1 else None
+                if ps_args is None and last is not None and last.count('*') == 0 and snapshot.find(last) is None:
+                    # `swarm top CONTAINER [ps OPTIONS]`: a last argument which is no container goes to ps
+                    container_list, ps_args = container_list[:-1], last
+                targets = self._get_targets(snapshot, container_list)
+                ret = concurrent_map(lambda target: self._top(cli, target[0], ps_args), targets, workers)
+            finally:
+                cli.release()
+            for (name, node), result in zip(targets, ret):
+                if result is None:
+                    continue
+                if not self.titles:
+                    self.titles = ['CONTAINER', 'NODE'] + result['Titles']
+                for process in result['Processes'] or []:
+                    self.processes.append([name, node] + process)
+            if sort is not None:
+                if sort not in self.titles:
+                    if self.titles:
+                        print('Error: no column `{sort}`. Available columns: {titles}'.format(sort=sort,
+                                                                                             titles=', '.join(self.titles)))
+                    return
+                i = self.titles.index(sort)
+                self.processes.sort(key=lambda process: self._sort_key(process[i]))
+            if top is not None:
+                self.processes = self.processes[:top]
+            if output is not None:
+                writer = JsonWriter(output, fields)
+                for process in self.processes:
+                    writer.write(dict(zip(self.titles, process)))
+                writer.close()
+                return
+            self._pretty_print()
+
+
+class Stats(ContainerBase):
+
+    def __init__(self):
+        super(Stats, self).__init__()
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def _get_targets(self, cli, patterns):
+        """
+        Return [(name, node)] of running containers matching patterns, all running containers by default
+        """
+        snapshot = ContainerSnapshot(cli.containers())
+        if not patterns:
+            rows = range(len(snapshot))
+        else:
+            rows = set(row for pattern in patterns for row in snapshot.match(pattern))
+            rows.update(row for pattern in patterns for row, cid in enumerate(snapshot.ids) if cid.startswith(pattern))
+        return sorted(((snapshot.names[row], snapshot.nodes[row]) for row in rows))
+
+    def _counters(self, stats, now):
+        """
+        Extract cumulative counters from a stats sample
+        """
+        cpu_stats = stats.get('cpu_stats') or {}
+        memory_stats = stats.get('memory_stats') or {}
+        # networks replaced network since API v1.21
+        networks = stats.get('networks') or {'eth0': stats.get('network') or {}}
+        blkio = (stats.get('blkio_stats') or {}).get('io_service_bytes_recursive') or []
+        return {
+            'time': now,
+            'cpu': cpu_stats.get('cpu_usage', {}).get('total_usage', 0),
+            'system': cpu_stats.get('system_cpu_usage', 0),
+            'ncpu': len(cpu_stats.get('cpu_usage', {}).get('percpu_usage') or []) or cpu_stats.get('online_cpus', 1),
+            'memory': memory_stats.get('usage', 0) - (memory_stats.get('stats') or {}).get('cache', 0),
+            'limit': memory_stats.get('limit', 0),
+            'rx': sum((network.get('rx_bytes', 0) for network in networks.values())),
+            'tx': sum((network.get('tx_bytes', 0) for network in networks.values())),
+            'read': sum((item['value'] for item in blkio if item.get('op') == 'Read')),
+            'write': sum((item['value'] for item in blkio if item.get('op') == 'Write')),
+        }
+
+    def _compute(self, name, node, counters, previous):
+        """
+        Compute CPU percentage and I/O rates from two successive samples
+        """
+        sample = {
+            'container': name,
+            'node': node,
+            'cpu_percent': 0.0,
+            'memory_usage': counters['memory'],
+            'memory_limit': counters['limit'],
+            'memory_percent': counters['memory'] * 100.0 / counters['limit'] if counters['limit'] else 0.0,
+            'net_rx': counters['rx'],
+            'net_tx': counters['tx'],
+            'block_read': counters['read'],
+            'block_write': counters['write'],
+        }
+        for key in ('rx', 'tx', 'read', 'write'):
+            sample['{prefix}_{key}_rate'.format(prefix='net' if key in ('rx', 'tx') else 'block', key=key)] = 0.0
+        if previous is not None:
+            cpu_delta = counters['cpu'] - previous['cpu']
+            system_delta = counters['system'] - previous['system']
+            if system_delta > 0 and cpu_delta >= 0:
+                sample['cpu_percent'] = cpu_delta * 100.0 * counters['ncpu'] / system_delta
+            elapsed = counters['time'] - previous['time']
+            if elapsed > 0:
+                sample['net_rx_rate'] = (counters['rx'] - previous['rx']) / elapsed
+                sample['net_tx_rate'] = (counters['tx'] - previous['tx']) / elapsed
+                sample['block_read_rate'] = (counters['read'] - previous['read']) / elapsed
+                sample['block_write_rate'] = (counters['write'] - previous['write']) / elapsed
+        return sample
+
+    def _follow(self, cli, name, node, count=None):
+        """
+        Read the stats stream of a container and keep its latest sample, stop after count samples if provided
+        """
+        previous = None
+        try:
+            for n, stats in enumerate(cli.stats(name, decode=True, stream=True), 1):
+                counters = self._counters(stats, time.time())
+                if previous is None and (stats.get('precpu_stats') or {}).get('system_cpu_usage'):
+                    # the first sample carries the previous CPU reading, I/O rates start from the next one
+                    precpu = self._counters({'cpu_stats': stats['precpu_stats']}, counters['time'])
+                    previous = dict(counters, cpu=precpu['cpu'], system=precpu['system'])
+                sample = self._compute(name, node, counters, previous)
+                previous = counters
+                with self.lock:
+                    self.samples[name] = sample
+                if count is not None and n >= count:
+                    break
+        except (errors.NotFound, errors.APIError, errors.DockerException) as e:
+            pyprint('{container}: {error}'.format(container=name, error=textformat(e.explanation)), file=sys.stderr)
+        finally:
+            if count is None:
+                # the container has stopped, drop it from the table
+                with self.lock:
+                    self.samples.pop(name, None)
+
+    def _pretty_print(self, samples, clear):
+        titles = ('CONTAINER', 'NODE', 'CPU %', 'MEM USAGE / LIMIT', 'MEM %', 'NET I/O', 'BLOCK I/O')
+        rows = []
+        for sample in samples:
+            rows.append((sample['container'],
+                         sample['node'],
+                         '{cpu:.2f}%'.format(cpu=sample['cpu_percent']),
+                         '{usage} / {limit}'.format(usage=byteformat(sample['memory_usage']),
+                                                    limit=byteformat(sample['memory_limit'])),
+                         '{mem:.2f}%'.format(mem=sample['memory_percent']),
+                         '{rx}/s / {tx}/s'.format(rx=byteformat(sample['net_rx_rate']),
+                                                  tx=byteformat(sample['net_tx_rate'])),
+                         '{read}/s / {write}/s'.format(read=byteformat(sample['block_read_rate']),
+                                                       write=byteformat(sample['block_write_rate']))))
+        length = [len(title) for title in titles]
+        for row in rows:
+            for i, value in enumerate(row):
                 if len(value) > length[i]:
                     length[i] = len(value)
-        for title in self.ret['Titles']:
-            i = self.ret['Titles'].index(title)
-            string += title + ' ' * (length[i]-len(title)+4)
-        string += '\n'
-        for process in self.ret['Processes']:
-            for value in process:
-                i = process.index(value)
-                string += value + ' ' * (length[i]-len(value)+4)
-            string += '\n'
-        print(string.strip())
-
-    def __call__(self, container, ps_args):
-        """
-        :param container(str): The container to inspect
-        :param ps_args(str): An optional arguments passed to ps (e.g., aux)
+        string = ''
+        for row in [titles] + rows:
+            line = ''
+            for i, value in enumerate(row):
+                line += value + ' ' * (length[i]-len(value)+4)
+            string += line.rstrip() + '\n'
+        if clear:
+            # <ESC>[2J = clear screen, <ESC>[H = move cursor to top left
+            print('{esc:c}[2J{esc:c}[H'.format(esc=27), end='')
+        print(string.rstrip())
+        sys.stdout.flush()
+
+    def __call__(self, patterns=(), no_stream=False, output=None, interval=1):
+        """
+        :param patterns(list): List of container id, name or wildcard, all running containers by default
+        :param no_stream(bool): Print one result and exit
+        :param output(str): 'json' prints one JSON line per container instead of a table
+        :param interval(float): Seconds between two refreshes
         """
         cli = self.swarm.client
         if cli is not None:
             try:
-                self.ret = cli.top(container, ps_args)
+                targets = self._get_targets(cli, patterns)
             except (errors.NotFound, errors.APIError, errors.DockerException) as e:
                 pyprint(e.explanation)
+                return
             finally:
                 cli.close()
-            self._pretty_print()
+            if not targets:
+                return
+            # every stream holds one connection, size the pool accordingly
+            cli = self.swarm.pooled(maxsize=len(targets))
+            count = 2 if no_stream else None
+            threads = []
+            printed = {}
+            for name, node in targets:
+                thread = threading.Thread(target=self._follow, args=(cli, name, node, count))
+                thread.daemon = True
+                thread.start()
+                threads.append(thread)
+            while True:
+                if no_stream:
+                    for thread in threads:
+                        thread.join()
+                else:
+                    time.sleep(interval)
+                with self.lock:
+                    samples = [self.samples[name] for name in sorted(self.samples)]
+                if output == 'json':
+                    # only print samples received since the last refresh
+                    for sample in samples:
+                        if printed.get(sample['container']) is not sample:
+                            printed[sample['container']] = sample
+                            print(json.dumps(sample, sort_keys=True))
+                    sys.stdout.flush()
+                else:
+                    self._pretty_print(samples, clear=not no_stream)
+                if no_stream or not [thread for thread in threads if thread.is_alive()]:
+                    break
+            cli.release()
 
 
 class Exec(ContainerBase):
@@ -379,19 +807,122 @@ class Exec(ContainerBase):
                 cli.close()
 
 
+class ExecAll(ContainerBase):
+
+    def __init__(self):
+        super(ExecAll, self).__init__()
+
+    def _demux(self, sock, deadline):
+        """
+        Read multiplexed frames of the exec output until EOF
+        Return (stdout, stderr), raise socket.timeout once deadline passes
+        """
+        # The engine answers `101 UPGRADED`, a response without body to http clients,
+        # so frames are read from the buffered file of the connection beneath it:
+        # some may already sit in its buffer, read together with the headers
+        reader = sock._response.raw._fp.fp
+        sockets = [s for s in (sock, getattr(sock, '_sock', None)) if hasattr(s, 'settimeout')]
+        output = {1: [], 2: []}
+        while True:
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise socket.timeout()
+                for s in sockets:
+                    s.settimeout(remaining)
+            header = reader.read(8)
+            if len(header) < 8:
+                break
+            stream, length = struct.unpack('>BxxxL', header)
+            output.setdefault(stream, []).append(reader.read(length))
+        return six.binary_type().join(output[1]), six.binary_type().join(output[2])
+
+    def _exec(self, cli, container, command, user, timeout):
+        ret = {
+            'container': container,
+            'stdout': six.binary_type(),
+            'stderr': six.binary_type(),
+            'exit_code': None,
+            'error': None
+        }
+        deadline = time.time() + timeout if timeout else None
+        try:
+            exec_id = cli.exec_create(container, command, user=user)['Id']
+            sock = cli.exec_start(exec_id, socket=True)
+            try:
+                ret['stdout'], ret['stderr'] = self._demux(sock, deadline)
+            finally:
+                sock._response.close()
+            ret['exit_code'] = cli.exec_inspect(exec_id)['ExitCode']
+        except socket.timeout:
+            ret['error'] = 'timed out after {timeout:.0f}s'.format(timeout=timeout)
+        except (errors.NotFound, errors.APIError, errors.DockerException) as e:
+            ret['error'] = textformat(e.explanation)
+        return ret
+
+    def _display(self, ret, prefix):
+        status = ret['error'] if ret['error'] is not None else 'exit {code}'.format(code=ret['exit_code'])
+        stdout = textformat(ret['stdout'])
+        stderr = textformat(ret['stderr'])
+        if prefix:
+            for line in stdout.splitlines():
+                print('{container}: {line}'.format(container=ret['container'], line=line))
+            for line in stderr.splitlines():
+                print('{container}: {line}'.format(container=ret['container'], line=line), file=sys.stderr)
+            if ret['exit_code'] != 0:
+                print('{container}: [{status}]'.format(container=ret['container'], status=status))
+        else:
+            print('==> {container} [{status}] <=='.format(container=ret['container'], status=status))
+            if stdout:
+                print(stdout, end='' if stdout.endswith('\n') else '\n')
+            if stderr:
+                print(stderr, end='' if stderr.endswith('\n') else '\n', file=sys.stderr)
+        sys.stdout.flush()
+
+    def __call__(self, container_list, command, user, timeout=None, workers=20, prefix=False):
+        """
+        :param container_list(list): List of running container id or name, wildcard is supported
+        :param command(str or list): Command to be executed
+        :param user(str): User to execute command as
+        :param timeout(float): Seconds to wait for each exec to finish
+        :param workers(int): Number of execs running concurrently
+        :param prefix(bool): Prefix each output line with container name instead of grouping output
+        """
+        cli = self.swarm.pooled(maxsize=workers)
+        if cli is not None:
+            try:
+                containers = self._resolve_containers(cli, container_list, show_all=False)
+            except (errors.NotFound, errors.APIError, errors.DockerException) as e:
+                pyprint(e.explanation)
+                return
+            succeeded, failed = 0, 0
+            if containers:
+                with ThreadPoolExecutor(max_workers=min(workers, len(containers))) as executor:
+                    futures = [executor.submit(self._exec, cli, container, command, user, timeout)
+                               for container in containers]
+                    for future in as_completed(futures):
+                        ret = future.result()
+                        self._display(ret, prefix)
+                        if ret['exit_code'] == 0:
+                            succeeded += 1
+                        else:
+                            failed += 1
+            cli.release()
+            print('{succeeded} succeeded, {failed} failed'.format(succeeded=succeeded, failed=failed), file=sys.stderr)
+
+
 class Kill(ContainerBase):
 
     def __init__(self):
         super(Kill, self).__init__()
 
-    def __call__(self, container_list, signal):
+    def __call__(self, container_list, signal, workers=100):
         """
-        :param container(str): The container id to kill
+        :param container_list(list): List of container id or name
         :param signal(str or int):  The signal to send. Defaults to SIGKILL
+        :param workers(int): Number of containers handled concurrently
         """
-        containers_killed = self._handle_containers('kill', container_list, signal=signal)
-        if containers_killed:
-            print('\n'.join(containers_killed))
+        self._handle_bulk('kill', container_list, workers=workers, signal=signal)
 
 
 class Rename(ContainerBase):
@@ -414,6 +945,171 @@ class Rename(ContainerBase):
                 cli.close()
 
 
+class Copy(ContainerBase):
+
+    # archives of up to this size are kept in memory, bigger ones are spooled to disk
+    SPOOL_SIZE = 32 << 20
+
+    def __init__(self):
+        super(Copy, self).__init__()
+        self.lock = threading.Lock()
+
+    def _stat(self, cli, container, path):
+        """
+        Return the stat of path in container, None if it does not exist
+        """
+        res = cli.head(cli._url('/containers/{0}/archive', container), params={'path': path})
+        if res.status_code == 404:
+            return None
+        cli._raise_for_status(res)
+        encoded_stat = res.headers.get('x-docker-container-path-stat')
+        return decode_json_header(encoded_stat) if encoded_stat else None
+
+    def _build(self, src, arcname):
+        """
+        Return a file holding the tar of the local path src with its root named arcname, '-' reads a tar from stdin
+        """
+        archive = tempfile.SpooledTemporaryFile(max_size=self.SPOOL_SIZE)
+        if src == '-':
+            stdin = getattr(sys.stdin, 'buffer', sys.stdin)
+            for chunk in iter(lambda: stdin.read(1 << 20), b''):
+                archive.write(chunk)
+        else:
+            with tarfile.open(fileobj=archive, mode='w|') as tar:
+                tar.add(src, arcname=arcname)
+        return archive
+
+    def _put(self, cli, container, path, archive):
+        try:
+            cli.put_archive(container, path, iter_shared(archive, self.lock))
+            return container, None
+        except (errors.NotFound, errors.APIError) as e:
+            return container, e.explanation
+        except (errors.DockerException, IOError) as e:
+            return container, str(e)
+
+    def _inside(self, path, top):
+        path = os.path.normpath(path)
+        return not os.path.isabs(path) and (path == top or path.startswith(top + '/'))
+
+    def _safe(self, member, top):
+        """
+        Whether member stays in top once extracted, symbolic links included
+        """
+        if not self._inside(member.name, top):
+            return False
+        if member.islnk():
+            return self._inside(member.linkname, top)
+        if member.issym():
+            # resolved from the directory of the link, absolute targets point out of top on this host
+            return not os.path.isabs(member.linkname) and\
+                   self._inside(os.path.join(os.path.dirname(member.name), member.linkname), top)
+        return True
+
+    def _extract(self, stream, root, dst):
+        """
+        Extract the tar stream, renaming its root directory from root to basename of dst
+        Members escaping dst are skipped: paths out of root, links to outside of it and absolute symlinks,
+        the `data` extraction filter of tarfile checks members against the filesystem as well where it exists
+        """
+        parent, name = os.path.split(os.path.abspath(dst))
+        data_filter = getattr(tarfile, 'data_filter', None)
+        with tarfile.open(fileobj=stream, mode='r|') as tar:
+            for member in tar:
+                original = member.name
+                for attr in ('name', 'linkname') if member.islnk() else ('name',):
+                    value = getattr(member, attr)
+                    if value == root or value.startswith(root + '/'):
+                        setattr(member, attr, name + value[len(root):])
+                if not self._safe(member, name):
+                    print('Skipping {name}: outside of {dst}'.format(name=original, dst=dst), file=sys.stderr)
+                    continue
+                if data_filter is None:
+                    tar.extract(member, parent)
+                    continue
+                try:
+                    tar.extract(member, parent, filter='data')
+                except tarfile.FilterError as e:
+                    print('Skipping {name}: {error}'.format(name=original, error=e), file=sys.stderr)
+
+    def get(self, container, src, dst):
+        """
+        :param container(str): Container to copy from
+        :param src(str): Path in the container
+        :param dst(str): Local path, '-' writes the tar to stdout
+        """
+        cli = self.swarm.client
+        if cli is not None:
+            try:
+                stream, stat = cli.get_archive(container, src)
+                if dst == '-':
+                    stdout = getattr(sys.stdout, 'buffer', sys.stdout)
+                    for chunk in iter(lambda: stream.read(1 << 20), b''):
+                        stdout.write(chunk)
+                    stdout.flush()
+                    return
+                # docker cp semantics: into an existing directory, otherwise as the destination name
+                if os.path.isdir(dst):
+                    dst = os.path.join(dst, stat['name'])
+                self._extract(stream, stat['name'], dst)
+            except (errors.NotFound, errors.APIError) as e:
+                pyprint(e.explanation)
+                exit(1)
+            except (tarfile.TarError, IOError, OSError) as e:
+                print(e)
+                exit(1)
+            finally:
+                cli.close()
+
+    def put(self, src, container_list, dst, workers=10):
+        """
+        :param src(str): Local path, '-' reads a tar from stdin
+        :param container_list(list): Containers to copy to, wildcard names are expanded
+        :param dst(str): Path in the containers
+        :param workers(int): Number of containers copied to concurrently
+        """
+        if src != '-' and not os.path.exists(src):
+            print('{src}: no such file or directory'.format(src=src))
+            exit(1)
+        cli = self.swarm.pooled(maxsize=workers)
+        if cli is None:
+            return
+        try:
+            containers = self._resolve_containers(cli, container_list)
+            if not containers:
+                print('No container matches {containers}'.format(containers=' '.join(container_list)))
+                exit(1)
+            path, arcname = dst, os.path.basename(os.path.normpath(src))
+            if not dst.endswith('/') and src != '-':
+                # docker cp semantics: into an existing directory, otherwise as the destination name
+                stat = self._stat(cli, containers[0], dst)
+                if stat is None or not stat['mode'] & (1 << 31):
+                    path, arcname = os.path.dirname(dst.rstrip('/')) or '/', os.path.basename(dst.rstrip('/'))
+        except (errors.NotFound, errors.APIError) as e:
+            pyprint(e.explanation)
+            cli.release()
+            exit(1)
+        try:
+            # the archive is built once and streamed to every container
+            archive = self._build(src, arcname)
+        except (tarfile.TarError, IOError, OSError) as e:
+            print(e)
+            cli.release()
+            exit(1)
+        try:
+            ret = concurrent_map(lambda container: self._put(cli, container, path, archive), containers, workers)
+        finally:
+            archive.close()
+            cli.release()
+        for container, error in ret:
+            if error is not None:
+                pyprint('{container}: {error}'.format(container=container, error=textformat(error)))
+            elif len(containers) > 1:
+                print(container)
+        if [error for _, error in ret if error is not None]:
+            exit(1)
+
+
 class Logs(ContainerBase):
 
     def __init__(self):
@@ -0,0 +1,165 @@
+# -*- coding: utf8 -*-
+
+from __future__ import print_function
+import os
+import json
+import base64
+import tempfile
+import threading
+import dockerpycreds
+from docker import errors
+from docker.auth import auth
+
+
+class CredentialResolver(object):
+    """
+    Registry credentials of the docker config, loaded once per process and shared by login, pull and push
+    Credential helpers (credsStore, credHelpers) are run once per registry and their answer kept in memory,
+    so that concurrent pulls from the same registry do not resolve credentials again for every image
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self, config_path=None):
+        self.config_path = config_path
+        self.lock = threading.Lock()
+        self._config = None
+        # registry hostname -> auth config or None, resolved at most once
+        self._resolved = {}
+        self._pending = {}
+
+    @classmethod
+    def get(cls):
+        """
+        Return the resolver of the process
+        """
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    @property
+    def path(self):
+        return auth.find_config_file(self.config_path) or\
+               os.path.join(os.environ['HOME'], auth.DOCKER_CONFIG_FILENAME)
+
+    @property
+    def config(self):
+        """
+        {auths, credsStore, credHelpers} of the docker config, auths are decoded into username and password
+        Raise errors.InvalidConfigFile on a malformed auths section
+        """
+        with self.lock:
+            if self._config is None:
+                self._config = self._load()
+            return self._config
+
+    def _load(self):
+        try:
+            with open(self.path) as fp:
+                data = json.load(fp)
+        except (IOError, OSError, ValueError):
+            # missing file or legacy ~/.dockercfg format
+            auths = auth.load_config(self.config_path)
+            return {'auths': dict((k, v) for k, v in auths.items() if isinstance(v, dict)),
+                    'credsStore': auths.get('credsStore'), 'credHelpers': {}}
+        return {
+            'auths': auth.parse_auth(data.get('auths') or {}, raise_on_error=True),
+            'credsStore': data.get('credsStore'),
+            'credHelpers': data.get('credHelpers') or {},
+        }
+
+    def _from_store(self, store, registry):
+        if registry == auth.INDEX_NAME:
+            # the hub is known by its full url to credential helpers
+            registry = auth.INDEX_URL
+        try:
+            data = dockerpycreds.Store(store).get(registry)
+        except dockerpycreds.CredentialsNotFound:
+            return None
+        except dockerpycreds.StoreError as e:
+            raise errors.DockerException('Credentials store error: {error!r}'.format(error=e))
+        if data['Username'] == auth.TOKEN_USERNAME:
+            return {'ServerAddress': registry, 'IdentityToken': data['Secret']}
+        return {'ServerAddress': registry, 'Username': data['Username'], 'Password': data['Secret']}
+
+    def _lookup(self, registry):
+        config = self.config
+        helper = config['credHelpers'].get(registry) or config['credsStore']
+        if helper:
+            return self._from_store(helper, registry)
+        for key, value in config['auths'].items():
+            if auth.resolve_index_name(key) == registry:
+                return value or None
+        return None
+
+    def resolve(self, registry=None):
+        """
+        Return the auth config of registry (hostname or url, the hub by default), None if there is none
+        Concurrent callers asking for the same registry wait for a single lookup
+        """
+        registry = auth.resolve_index_name(registry) if registry else auth.INDEX_NAME
+        with self.lock:
+            if registry in self._resolved:
+                return self._resolved[registry]
+            event = self._pending.get(registry)
+            owner = event is None
+            if owner:
+                event = self._pending[registry] = threading.Event()
+        if not owner:
+            event.wait()
+            with self.lock:
+                if registry in self._resolved:
+                    return self._resolved[registry]
+            # the lookup of the owner failed, try on our own
+            return self._lookup(registry)
+        try:
+            ret = self._lookup(registry)
+            with self.lock:
+                self._resolved[registry] = ret
+            return ret
+        finally:
+            with self.lock:
+                self._pending.pop(registry, None)
+            event.set()
+
+    def for_image(self, repository):
+        """
+        Return the auth config of the registry repository lives in
+        """
+        registry, _ = auth.resolve_repository_name(repository)
+        return self.resolve(registry)
+
+    def save(self, registry, username, password, email=None):
+        """
+        Store credentials of registry in the docker config and in memory
+        The config is rewritten atomically, entries of other registries are kept
+        """
+        registry = registry or auth.INDEX_URL
+        path = self.path
+        try:
+            with open(path) as fp:
+                data = json.load(fp)
+        except (IOError, OSError, ValueError):
+            data = {}
+        token = base64.b64encode('{user}:{passwd}'.format(user=username, passwd=password).encode('utf8'))
+        data.setdefault('auths', {})[registry] = {'auth': token.decode('ascii'), 'email': email}
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        fd, tmp = tempfile.mkstemp(prefix='.config.', dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                fp.write(json.dumps(data, indent=4))
+            os.chmod(tmp, 0o600)
+            # os.rename does not overwrite on Windows
+            getattr(os, 'replace', os.rename)(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        with self.lock:
+            if self._config is not None:
+                self._config['auths'][registry] = {'username': username, 'password': password,
+                                                   'email': email, 'serveraddress': registry}
+            self._resolved.pop(auth.resolve_index_name(registry), None)
+        return path
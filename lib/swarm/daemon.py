@@ -3,7 +3,7 @@
 from __future__ import print_function
 from docker import errors
 from swarm.client import SwarmClient
-from swarm.utils import byteformat
+from swarm.utils import byteformat, print_json
 
 
 class Version(object):
@@ -11,12 +11,19 @@ class Version(object):
     def __init__(self):
         self.swarm = SwarmClient()
 
-    def __call__(self):
+    def __call__(self, output=None, fields=None):
+        """
+        :param output(str): 'json' or 'ndjson' prints the record of the API instead of text
+        :param fields(list): With output, only keep these fields
+        """
         cli = self.swarm.client
         if cli is not None:
             string = ''     
             ret = cli.version()
             cli.close()
+            if output is not None:
+                print_json(ret, output, fields)
+                return
             if self.swarm.version is not None:
                 apiversion = ret['ApiVersion'] if self.swarm.version == 'auto'\
                                                else self.swarm.version
@@ -48,11 +55,18 @@ class Info(object):
     def __init__(self):
         self.swarm = SwarmClient()
 
-    def __call__(self):
+    def __call__(self, output=None, fields=None):
+        """
+        :param output(str): 'json' or 'ndjson' prints the record of the API instead of text
+        :param fields(list): With output, only keep these fields
+        """
         cli = self.swarm.client
         if cli is not None:
             ret = cli.info()
             cli.close()
+            if output is not None:
+                print_json(ret, output, fields)
+                return
             # DriverStatus is deprecated since api v1.23
             # Use SystemStatus instead
             if ret['DriverStatus'] is None:
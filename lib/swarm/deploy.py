@@ -0,0 +1,230 @@
+# -*- coding: utf8 -*-
+
+from __future__ import print_function
+import json
+import hashlib
+from docker import errors
+from swarm.container import ContainerBase
+from swarm.utils import concurrent_map, parse_pairs, parse_links, parse_ports, parse_volumes, pyprint,\
+                        textformat
+
+
+# Labels put on containers created by `swarm apply`
+# The spec hash lets the listing alone tell whether a container is up to date
+LABEL_SERVICE = 'com.swarm-python.service'
+LABEL_REPLICA = 'com.swarm-python.replica'
+LABEL_HASH = 'com.swarm-python.spec-hash'
+
+
+class Apply(ContainerBase):
+
+    def __init__(self):
+        super(Apply, self).__init__()
+
+    def _validate(self, spec):
+        if not isinstance(spec, dict) or not isinstance(spec.get('services'), dict):
+            raise ValueError('spec must contain a `services` mapping')
+        for service, options in spec['services'].items():
+            if not isinstance(options, dict) or not options.get('image'):
+                raise ValueError('service `{service}` has no image'.format(service=service))
+            try:
+                if int(options.get('replicas', 1)) < 0:
+                    raise ValueError
+            except (TypeError, ValueError):
+                raise ValueError('service `{service}` has invalid replicas'.format(service=service))
+        return spec['services']
+
+    def _spec_hash(self, options):
+        options = dict((k, v) for k, v in options.items() if k != 'replicas')
+        return hashlib.sha1(json.dumps(options, sort_keys=True).encode('utf8')).hexdigest()[:12]
+
+    def _get_inventory(self, cli):
+        """
+        Group containers created by `swarm apply` by service and replica,
+        using a single listing filtered on the service label
+        """
+        inventory = {}
+        for container in cli.containers(all=True, filters={'label': LABEL_SERVICE}):
+            labels = container.get('Labels') or {}
+            name = None
+            for names in container['Names']:
+                if names.count('/') == 2:
+                    name = names.split('/')[2]
+                    break
+            if container.get('State') is not None:
+                running = container['State'] == 'running'
+            else:
+                running = container['Status'].startswith('Up')
+            record = {
+                'Id': container['Id'],
+                'Name': name,
+                'Hash': labels.get(LABEL_HASH),
+                'Running': running
+            }
+            replicas = inventory.setdefault(labels[LABEL_SERVICE], {})
+            try:
+                replica = int(labels.get(LABEL_REPLICA))
+            except (TypeError, ValueError):
+                replica = None
+            # containers sharing a replica number are surplus, key them so they get removed
+            if replica is None or replica in replicas:
+                replica = 'dup-{id}'.format(id=container['Id'])
+            replicas[replica] = record
+        return inventory
+
+    def _plan(self, services, inventory, prune):
+        """
+        Compare desired services against the inventory
+        Return list of (action, service, replica, container) and number of unchanged containers
+        """
+        actions = []
+        unchanged = 0
+        for service in sorted(services):
+            options = services[service]
+            digest = self._spec_hash(options)
+            current = inventory.pop(service, {})
+            for replica in range(1, int(options.get('replicas', 1))+1):
+                container = current.pop(replica, None)
+                if container is None:
+                    actions.append(('create', service, replica, None))
+                elif container['Hash'] != digest:
+                    actions.append(('replace', service, replica, container))
+                elif not container['Running']:
+                    actions.append(('start', service, replica, container))
+                else:
+                    unchanged += 1
+            for replica in current:
+                actions.append(('remove', service, replica, current[replica]))
+        if prune:
+            for service in sorted(inventory):
+                for replica in inventory[service]:
+                    actions.append(('remove', service, replica, inventory[service][replica]))
+        return actions, unchanged
+
+    def _create_kwargs(self, cli, service, options):
+        """
+        Translate service options into create_container keyword arguments
+        Option values use the same format as `swarm run` flags
+        """
+        labels = options.get('labels') or {}
+        if isinstance(labels, list):
+            labels = parse_pairs(labels, 'label')
+        labels = dict((k, str(v)) for k, v in labels.items())
+        labels[LABEL_SERVICE] = service
+        labels[LABEL_HASH] = self._spec_hash(options)
+        environment = options.get('environment') or []
+        if isinstance(environment, dict):
+            environment = ['{k}={v}'.format(k=k, v=v) for k, v in sorted(environment.items())]
+        # swarm reads scheduling constraints from the environment
+        environment = list(environment) + ['constraint:{c}'.format(c=c) for c in options.get('constraint') or []]
+        links = parse_links(options['links']) if options.get('links') else None
+        ports, port_bindings = None, None
+        if options.get('ports'):
+            ports, port_bindings = parse_ports([str(port) for port in options['ports']])
+        volumes, binds = None, None
+        if options.get('volumes'):
+            volumes = parse_volumes(options['volumes'])
+            binds = [volume for volume in options['volumes'] if volume.count(':') > 0] or None
+        log_config = None
+        if options.get('log_driver'):
+            log_config = {
+                'type': options['log_driver'],
+                'config': parse_pairs(options.get('log_opt') or [], 'log-opt')
+            }
+        restart_policy = {'Name': options['restart']} if options.get('restart') else None
+        host_config = cli.create_host_config(binds=binds,
+                                             port_bindings=port_bindings,
+                                             links=links,
+                                             privileged=options.get('privileged', False),
+                                             dns=options.get('dns'),
+                                             network_mode=options.get('net'),
+                                             restart_policy=restart_policy,
+                                             log_config=log_config,
+                                             mem_limit=options.get('memory'))
+        return {
+            'image': options['image'],
+            'command': options.get('command'),
+            'hostname': options.get('hostname'),
+            'user': options.get('user'),
+            'environment': environment or None,
+            'labels': labels,
+            'ports': ports,
+            'volumes': volumes,
+            'entrypoint': options.get('entrypoint'),
+            'host_config': host_config,
+        }
+
+    def _create(self, cli, name, replica, kwargs):
+        kwargs = dict(kwargs, name=name, labels=dict(kwargs['labels']))
+        kwargs['labels'][LABEL_REPLICA] = str(replica)
+        try:
+            ret = cli.create_container(**kwargs)
+        except errors.NotFound:
+            # pull the missing image once and try again
+            cli.pull(kwargs['image'])
+            ret = cli.create_container(**kwargs)
+        cli.start(ret['Id'])
+
+    def _execute(self, cli, action, create_kwargs, timeout):
+        verb, service, replica, container = action
+        name = container['Name'] if container is not None else '{service}-{replica}'.format(service=service, replica=replica)
+        try:
+            if verb in ('replace', 'remove'):
+                if container['Running']:
+                    cli.stop(container['Id'], timeout=timeout)
+                cli.remove_container(container['Id'])
+            if verb == 'start':
+                cli.start(container['Id'])
+            if verb in ('create', 'replace'):
+                self._create(cli, '{service}-{replica}'.format(service=service, replica=replica),
+                             replica, create_kwargs[service])
+            print('{verb:<10}{name}'.format(verb=verb, name=name))
+            return True
+        except (errors.NotFound, errors.APIError, errors.DockerException) as e:
+            print('{verb:<10}{name}: {error}'.format(verb=verb, name=name, error=textformat(e.explanation)))
+            return False
+
+    def __call__(self, spec, dry_run=False, prune=False, workers=10, timeout=10):
+        """
+        :param spec(dict): Deploy spec, services mapping name to image, replicas and `swarm run` options
+        :param dry_run(bool): Only print actions which would be taken
+        :param prune(bool): Remove containers of services which are not in the spec any more
+        :param workers(int): Number of actions running concurrently
+        :param timeout(int): Seconds to wait for stop before killing a container
+        """
+        try:
+            services = self._validate(spec)
+        except ValueError as e:
+            print('Error: {error}'.format(error=e))
+            return
+        cli = self.swarm.pooled(maxsize=workers)
+        if cli is not None:
+            try:
+                try:
+                    create_kwargs = dict((service, self._create_kwargs(cli, service, services[service]))
+                                         for service in services)
+                except ValueError as e:
+                    print('Error: {error}'.format(error=e))
+                    return
+                try:
+                    inventory = self._get_inventory(cli)
+                except (errors.NotFound, errors.APIError, errors.DockerException) as e:
+                    pyprint(e.explanation)
+                    return
+                actions, unchanged = self._plan(services, inventory, prune)
+                if dry_run:
+                    for verb, service, replica, container in actions:
+                        if container is not None:
+                            name = container['Name']
+                        else:
+                            name = '{service}-{replica}'.format(service=service, replica=replica)
+                        print('{verb:<10}{name}'.format(verb=verb, name=name))
+                    ret = [True] * len(actions)
+                else:
+                    ret = concurrent_map(lambda action: self._execute(cli, action, create_kwargs, timeout),
+                                         actions, workers)
+            finally:
+                cli.release()
+            print('{changed} changed, {failed} failed, {unchanged} unchanged'.format(changed=ret.count(True),
+                                                                                      failed=ret.count(False),
+                                                                                      unchanged=unchanged))
@@ -0,0 +1,171 @@
+# -*- coding: utf8 -*-
+
+from __future__ import print_function
+import time
+import threading
+import requests
+from six.moves import BaseHTTPServer, socketserver
+from docker import errors
+from swarm.client import SwarmClient
+from swarm.snapshot import ContainerSnapshot
+from swarm.utils import parse_system_status, pyprint
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class Exporter(object):
+
+    def __init__(self):
+        self.swarm = SwarmClient()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        # latest exposition, scrapes are served from it only
+        self.metrics = b''
+        # (node, image, action) -> number of container events seen on /events
+        self.events = {}
+        self.refresh_errors = 0
+
+    def _escape(self, value):
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    def _format(self, name, help, kind, samples):
+        """
+        Render one metric family in the Prometheus text format
+        :param samples(dict): map of labels tuple ((name, value), ...) to value
+        """
+        lines = ['# HELP {name} {help}'.format(name=name, help=help),
+                 '# TYPE {name} {kind}'.format(name=name, kind=kind)]
+        for labels in sorted(samples):
+            label = ','.join(('{k}="{v}"'.format(k=k, v=self._escape(v)) for k, v in labels))
+            lines.append('{name}{{{label}}} {value}'.format(name=name, label=label, value=samples[labels])
+                         if label else '{name} {value}'.format(name=name, value=samples[labels]))
+        return '\n'.join(lines)
+
+    def _collect(self, cli):
+        start = time.time()
+        containers = cli.containers(all=True)
+        info = cli.info()
+        snapshot = ContainerSnapshot(containers)
+        states, images = {}, {}
+        for node, rows in snapshot.by_node.items():
+            for row in rows:
+                key = (('node', node), ('state', snapshot.state(row)))
+                states[key] = states.get(key, 0) + 1
+                key = (('image', snapshot.images[row]),)
+                images[key] = images.get(key, 0) + 1
+        # DriverStatus is deprecated since api v1.23
+        nodes = parse_system_status(info['SystemStatus'] if info.get('DriverStatus') is None else info['DriverStatus'])
+        healthy, cpus, reserved_cpus, memory, reserved_memory = {}, {}, {}, {}, {}
+        for node in nodes:
+            key = (('node', node['name']),)
+            healthy[key] = 1 if node.get('status') == 'Healthy' else 0
+            cpus[key] = node.get('cpus', 0)
+            reserved_cpus[key] = node.get('reserved_cpus', 0)
+            memory[key] = node.get('memory', 0)
+            reserved_memory[key] = node.get('reserved_memory', 0)
+        with self.lock:
+            events = dict(((('node', node), ('image', image), ('action', action)), count)
+                          for (node, image, action), count in self.events.items())
+            restarts = {}
+            for (node, image, action), count in self.events.items():
+                if action == 'restart':
+                    key = (('node', node),)
+                    restarts[key] = restarts.get(key, 0) + count
+        families = (
+            ('swarm_containers', 'Number of containers by node and state', 'gauge', states),
+            ('swarm_image_containers', 'Number of containers by image', 'gauge', images),
+            ('swarm_container_events_total', 'Container events seen since the exporter started', 'counter', events),
+            ('swarm_container_restarts_total', 'Container restarts seen since the exporter started', 'counter', restarts),
+            ('swarm_node_healthy', 'Whether the node is healthy', 'gauge', healthy),
+            ('swarm_node_cpus', 'Number of CPUs of the node', 'gauge', cpus),
+            ('swarm_node_reserved_cpus', 'Number of CPUs reserved by containers', 'gauge', reserved_cpus),
+            ('swarm_node_memory_bytes', 'Memory of the node', 'gauge', memory),
+            ('swarm_node_reserved_memory_bytes', 'Memory reserved by containers', 'gauge', reserved_memory),
+            ('swarm_exporter_refresh_timestamp_seconds', 'Time of the last refresh', 'gauge', {(): '{t:.3f}'.format(t=time.time())}),
+            ('swarm_exporter_refresh_duration_seconds', 'Duration of the last refresh', 'gauge',
+             {(): '{t:.6f}'.format(t=time.time()-start)}),
+            ('swarm_exporter_refresh_errors_total', 'Failed refreshes', 'counter', {(): self.refresh_errors}),
+        )
+        return ('\n'.join((self._format(*family) for family in families)) + '\n').encode('utf8')
+
+    def _refresh(self, cli, interval):
+        while True:
+            try:
+                metrics = self._collect(cli)
+                with self.lock:
+                    self.metrics = metrics
+            except (errors.APIError, errors.DockerException, requests.exceptions.RequestException) as e:
+                self.refresh_errors += 1
+                pyprint(getattr(e, 'explanation', None) or e)
+            # wait for the next interval, an event may wake it up earlier
+            self.wakeup.wait(interval)
+            self.wakeup.clear()
+            # do not refresh more than once per second during event bursts
+            time.sleep(1)
+
+    def _watch_events(self, cli):
+        while True:
+            try:
+                for event in cli.events(decode=True):
+                    if event.get('Type', 'container') != 'container':
+                        continue
+                    action = event.get('status') or event.get('Action')
+                    node = (event.get('node') or {}).get('Name', '')
+                    image = event.get('from', '')
+                    key = (node, image, action)
+                    with self.lock:
+                        self.events[key] = self.events.get(key, 0) + 1
+                    if action in ('create', 'start', 'die', 'destroy', 'restart'):
+                        self.wakeup.set()
+            except (errors.APIError, errors.DockerException, requests.exceptions.RequestException) as e:
+                pyprint(getattr(e, 'explanation', None) or e)
+                time.sleep(1)
+
+    def _handler(self):
+        exporter = self
+
+        class MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split('?')[0] == '/metrics':
+                    with exporter.lock:
+                        body = exporter.metrics
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                else:
+                    body = b'<a href="/metrics">/metrics</a>\n'
+                    self.send_response(200 if self.path == '/' else 404)
+                    self.send_header('Content-Type', 'text/html')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return MetricsHandler
+
+    def __call__(self, listen=':9323', interval=15, events=True):
+        """
+        :param listen(str): Address to serve /metrics on, [host]:port
+        :param interval(float): Seconds between two refreshes of the snapshot
+        :param events(bool): Count container events and refresh early on container changes
+        """
+        host, _, port = listen.rpartition(':')
+        cli = self.swarm.pooled(maxsize=2)
+        if cli is not None:
+            workers = [threading.Thread(target=self._refresh, args=(cli, interval))]
+            if events:
+                workers.append(threading.Thread(target=self._watch_events, args=(cli,)))
+            for worker in workers:
+                worker.daemon = True
+                worker.start()
+            server = ThreadingHTTPServer((host, int(port)), self._handler())
+            print('Serving metrics on {host}:{port}/metrics'.format(host=host or '0.0.0.0', port=port))
+            try:
+                server.serve_forever()
+            finally:
+                server.server_close()
+                cli.release()
@@ -1,11 +1,28 @@
 # -*- coding: utf8 -*-
 
 from __future__ import print_function
-from sys import stdout
+import os
+import re
+import six
+import json
+import base64
+import sys
+import time
+import zlib
+import requests
+import threading
+from six.moves import queue
 from docker import errors
+from docker import utils as docker_utils
+from requests.packages.urllib3 import exceptions as urllib3_errors
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from swarm.client import SwarmClient
-from swarm.utils import timeformat, byteformat, pyprint
+from swarm.cache import DiskCache
+from swarm.credentials import CredentialResolver
+from swarm.buildreport import BuildReport
+from swarm.utils import timeformat, byteformat, pyprint, textformat, concurrent_map, parse_system_status, iter_shared,\
+                        inherit_output, load_spec, JsonWriter
 
 
 class Images(object):
@@ -17,12 +34,13 @@ class Images(object):
         self.created_length = len('CREATED')
         self.images = set()
 
-    def _get_images(self, name=None, show_all=False, filters={}, image_list=None):
+    def _get_images(self, name=None, show_all=False, filters={}, image_list=None, writer=None):
         """
         :param name(str): Only show images belonging to the repository name
         :param show_all(bool):  Show all images (by default filter out the intermediate image layers)
         :parma filters(dict): Filters to be applied on the image list
         :param image_list(list): List of image id or name
+        :param writer(JsonWriter): Write the records of the API to writer instead of collecting rows to print
         """
         cli = self.swarm.client
         if cli is not None:
@@ -40,6 +58,9 @@ class Images(object):
                         if not image['Id'].startswith(image_list)\
                           and not image['RepoTags'].startswith(image_list):
                             continue
+                    if writer is not None:
+                        writer.write(image)
+                        continue
                     image_id = image['Id'][:12]
                     # convert created timestamp to human-readable string
                     created_delta = datetime.now() - datetime.fromtimestamp(image['Created'])
@@ -88,7 +109,16 @@ class Images(object):
             # print pretty-print string
             print('{title}\n{string}'.format(title=title,string=string.rstrip()))
 
-    def __call__(self, **kwargs):
+    def __call__(self, output=None, fields=None, **kwargs):
+        """
+        :param output(str): 'json' or 'ndjson' prints the records of the API instead of a table
+        :param fields(list): With output, only keep these fields of every record
+        """
+        if output is not None:
+            writer = JsonWriter(output, fields)
+            self._get_images(writer=writer, **kwargs)
+            writer.close()
+            return
         self._get_images(**kwargs)
         self._pretty_print()
 
@@ -174,29 +204,44 @@ class Pull(Images):
 
     def __init__(self):
         super(Pull, self).__init__()
+        self.lock = threading.Lock()
+
+    def _pull(self, cli, repo, tag, prefix, **kwargs):
+        if kwargs.get('auth_config') is None:
+            kwargs['auth_config'] = CredentialResolver.get().for_image(repo)
+        try:
+            for line in cli.pull(repo, tag=tag, stream=True, decode=True, **kwargs):
+                if line.get('id') is not None:
+                    text = '[{id}] {status}'.format(id=line['id'], status=line['status'])
+                elif line.get('error') is not None:
+                    text = line['error']
+                else:
+                    continue
+                # lines of concurrent pulls are not interleaved within a line
+                with self.lock:
+                    print('{prefix}{text}'.format(prefix=prefix, text=text))
+        except (errors.NotFound, errors.APIError, errors.DockerException) as e:
+            with self.lock:
+                pyprint(e.explanation)
 
-    def __call__(self, *args, **kwargs):
+    def __call__(self, images, insecure_registry=False, auth_config=None, workers=4):
         """
-        :param repo(str): The repository to pull
-        :param tag(str): The tag to pull
+        :param images(list): (repository, tag) of images to pull, tag None pulls the latest
         :param insecure_registry(bool): Use an insecure registry
         :param auth_config(dict):  Override the credentials that Client.login has set for this request \
-auth_config should contain the username and password keys to be valid
+auth_config should contain the username and password keys to be valid, \
+credentials of the docker config are used by default
+        :param workers(int): Number of images pulled concurrently
         """
-        cli = self.swarm.client
+        cli = self.swarm.pooled(maxsize=workers)
         if cli is not None:
             try:
-                kwargs['stream'] = True
-                kwargs['decode'] = True
-                for line in cli.pull(*args, **kwargs):
-                    if line.get('id') is not None:
-                        print('[{id}] {status}'.format(id=line['id'], status=line['status']))
-                    elif line.get('error') is not None:
-                        print(line['error'])
-            except (errors.NotFound, errors.APIError, errors.DockerException) as e:
-                pyprint(e.explanation)
+                concurrent_map(lambda image: self._pull(cli, image[0], image[1],
+                                                        '{0}: '.format(':'.join(filter(None, image))) if len(images) > 1 else '',
+                                                        insecure_registry=insecure_registry,
+                                                        auth_config=auth_config), images, workers)
             finally:
-                cli.close()
+                cli.release()
 
 
 class Push(Images):
@@ -217,7 +262,7 @@ class Push(Images):
             print('{status} {progress}'.format(status=msg['status'],progress=progress), end=endl)
         else:
             print('{status}{endl}'.format(status=msg['status'],endl=endl))
-        stdout.flush() # flush stdout otherwise display may be broken
+        sys.stdout.flush() # flush stdout otherwise display may be broken
 
     def _display_JSONMessages(self, stream):
         ids = {}  # map[string]int
@@ -247,11 +292,14 @@ class Push(Images):
         :param repo(str): The repository to push to
         :param tag(str): An optional tag to push
         :param insecure_registry(bool): Use http:// to connect to the registry
+        :param auth_config(dict): Credentials of the registry, those of the docker config by default
         """
         cli = self.swarm.client
         if cli is not None:
             kwargs['stream'] = True
             kwargs['decode'] = True
+            if kwargs.get('auth_config') is None:
+                kwargs['auth_config'] = CredentialResolver.get().for_image(args[0] if args else kwargs['repository'])
             try:
                 self._display_JSONMessages(cli.push(*args, **kwargs))
             except (errors.NotFound, errors.APIError, errors.DockerException) as e:
@@ -260,27 +308,342 @@ class Push(Images):
                 cli.close()
 
 
+class CopyImage(Images):
+
+    def __init__(self):
+        super(CopyImage, self).__init__()
+        self.lock = threading.Lock()
+
+    def _nodes(self, cli):
+        info = cli.info()
+        # DriverStatus is deprecated since api v1.23
+        return parse_system_status(info['SystemStatus'] if info.get('DriverStatus') is None else info['DriverStatus'])
+
+    def _chunks(self, pipe):
+        while True:
+            chunk = pipe.get()
+            if chunk is None:
+                return
+            if isinstance(chunk, Exception):
+                # abort the upload rather than load a truncated archive
+                raise chunk
+            yield chunk
+
+    def _load(self, node, addr, pipe, done):
+        start = time.time()
+        error = None
+        try:
+            cli = self.swarm.node(addr)
+            try:
+                cli.load_image(self._chunks(pipe))
+            finally:
+                cli.close()
+        except (errors.NotFound, errors.APIError) as e:
+            error = textformat(e.explanation)
+        except (errors.DockerException, requests.exceptions.RequestException, IOError) as e:
+            error = str(e)
+        finally:
+            # the source stops feeding a node which went away
+            done.set()
+        with self.lock:
+            if error is not None:
+                pyprint('{node}: {error}'.format(node=node, error=error))
+            else:
+                print('{node}: loaded in {duration:.2f}s'.format(node=node, duration=time.time() - start))
+        return error is None
+
+    def _broadcast(self, pipes, chunk):
+        for pipe, done in pipes:
+            while not done.is_set():
+                try:
+                    pipe.put(chunk, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+
+    def __call__(self, image, targets, source=None, compress=False, chunk_size=1 << 20, buffers=16):
+        """
+        :param image(str): Image to copy, name with optional tag or id
+        :param targets(HostMatcher): Nodes to load the image on
+        :param source(str): Node to save the image from, the node chosen by swarm by default
+        :param compress(bool): Gzip the archive on its way to the nodes, docker load decompresses it
+        :param chunk_size(int): Bytes read from the source at once
+        :param buffers(int): Chunks queued per node, a slow node holds back the others once its queue is full
+        """
+        cli = self.swarm.client
+        if cli is None:
+            return
+        try:
+            nodes = self._nodes(cli)
+            addrs = dict((node['name'], node['addr']) for node in nodes)
+            for pattern in targets.unmatched(addrs):
+                print('No node matches `{pattern}`'.format(pattern=pattern), file=sys.stderr)
+            names = sorted((name for name in addrs if name in targets and name != source))
+            if not names:
+                print('No node to copy {image} to'.format(image=image))
+                exit(1)
+            if source is not None and source not in addrs:
+                print('No such node: {source}'.format(source=source))
+                exit(1)
+            reader = self.swarm.node(addrs[source]) if source is not None else cli
+            stream = reader.get_image(image)
+        except (errors.NotFound, errors.APIError, errors.DockerException) as e:
+            pyprint(e.explanation)
+            cli.close()
+            exit(1)
+        start = time.time()
+        read, sent = 0, 0
+        pipes = [(queue.Queue(maxsize=buffers), threading.Event()) for _ in names]
+        compressor = zlib.compressobj(1, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+        with ThreadPoolExecutor(max_workers=len(names)) as executor:
+            futures = [executor.submit(inherit_output(self._load), name, addrs[name], pipe, done)
+                       for name, (pipe, done) in zip(names, pipes)]
+            try:
+                # the archive is read once and every chunk is handed to every node as it arrives
+                while not all(done.is_set() for _, done in pipes):
+                    chunk = stream.read(chunk_size)
+                    if not chunk:
+                        break
+                    read += len(chunk)
+                    if compressor is not None:
+                        chunk = compressor.compress(chunk)
+                    if chunk:
+                        sent += len(chunk)
+                        self._broadcast(pipes, chunk)
+                if compressor is not None:
+                    chunk = compressor.flush()
+                    sent += len(chunk)
+                    self._broadcast(pipes, chunk)
+                self._broadcast(pipes, None)
+            except (requests.exceptions.RequestException, urllib3_errors.HTTPError, IOError) as e:
+                pyprint('{image}: {error}'.format(image=image, error=e))
+                self._broadcast(pipes, IOError('reading {image} failed'.format(image=image)))
+            finally:
+                stream.close()
+                if reader is not cli:
+                    reader.close()
+                cli.close()
+            loaded = [future.result() for future in futures]
+        print('{image}: {read} read, {sent} sent to {count} nodes in {duration:.2f}s'.format(image=image,
+                                                                                           read=byteformat(read),
+                                                                                           sent=byteformat(sent),
+                                                                                           count=loaded.count(True),
+                                                                                           duration=time.time() - start))
+        if not all(loaded):
+            exit(1)
+
+
 class Build(Images):
 
     def __init__(self):
         super(Build, self).__init__()
+        self.lock = threading.Lock()
+        # (path, dockerfile) -> tar of the build context, shared by targets building the same context
+        self.contexts = {}
 
-    def __call__(self, **kwargs):
+    def __call__(self, build_report=None, **kwargs):
+        """
+        Print the output of the build, then the duration of its steps and how many of them were cached
+        :param build_report(str): File the steps of the build are written to as JSON
+        Other keyword arguments are passed to Client.build
+        """
         cli = self.swarm.client
         if cli is not None:
+            report = BuildReport()
             try:
                 for line in cli.build(**kwargs):
                     if line.get('stream') is not None:
-                        print(line['stream']),
+                        report.feed(line['stream'])
+                        print(line['stream'], end='')
                     elif line.get('error') is not None:
+                        report.fail(line['error'].strip())
                         print(line['error'])
-                    stdout.flush()
+                    sys.stdout.flush()
             except (errors.NotFound, errors.APIError, errors.DockerException) as e:
                 pyprint(e.explanation)
+                report.fail(textformat(e.explanation))
             except TypeError as e:
                 pyprint(e)
+                report.fail(str(e))
             finally:
                 cli.close()
+            report.finish()
+            if report.steps:
+                print()
+                report.print_report()
+            if build_report is not None:
+                self._write_report(build_report, report.to_dict())
+
+    def _write_report(self, path, data):
+        try:
+            with open(path, 'w') as fp:
+                json.dump(data, fp, indent=2, sort_keys=True)
+        except (IOError, OSError) as e:
+            print('Error: {error}'.format(error=e))
+            exit(1)
+
+    def _targets(self, spec, root):
+        """
+        Return [(name, options)] of the build matrix, paths are relative to root
+        Options of `defaults` apply to every target, build_args are merged
+        """
+        if not isinstance(spec, dict) or not isinstance(spec.get('targets'), dict) or not spec['targets']:
+            raise ValueError('matrix must contain a `targets` mapping')
+        defaults = spec.get('defaults') or {}
+        targets = []
+        for name in sorted(spec['targets']):
+            target = spec['targets'][name] or {}
+            options = dict(defaults)
+            options.update(target)
+            options['build_args'] = dict(defaults.get('build_args') or {})
+            options['build_args'].update(target.get('build_args') or {})
+            if not options.get('path'):
+                raise ValueError('target `{name}` has no path'.format(name=name))
+            if not options.get('tag'):
+                raise ValueError('target `{name}` has no tag'.format(name=name))
+            options['path'] = os.path.join(root, options['path'])
+            if not os.path.isdir(options['path']):
+                raise ValueError('target `{name}`: {path} is not a directory'.format(name=name, path=options['path']))
+            if any('=' not in constraint for constraint in self._constraints(options)):
+                raise ValueError('target `{name}`: bad constraint (expected name==value)'.format(name=name))
+            targets.append((name, options))
+        return targets
+
+    def _context(self, path, dockerfile):
+        """
+        Return the tar of the build context of path, built once per path and Dockerfile
+        """
+        key = (os.path.abspath(path), dockerfile)
+        with self.lock:
+            context = self.contexts.get(key)
+            if context is None:
+                context = self.contexts[key] = {'lock': threading.Lock(), 'file': None}
+        with context['lock']:
+            if context['file'] is None:
+                exclude = None
+                dockerignore = os.path.join(path, '.dockerignore')
+                if os.path.exists(dockerignore):
+                    with open(dockerignore, 'r') as fp:
+                        exclude = list(filter(bool, fp.read().splitlines()))
+                context['file'] = docker_utils.tar(path, exclude=exclude, dockerfile=dockerfile)
+        return context
+
+    def _constraints(self, options):
+        constraints = options.get('constraint') or []
+        return [constraints] if isinstance(constraints, six.string_types) else constraints
+
+    def _buildargs(self, options):
+        buildargs = dict((name, str(value)) for name, value in options['build_args'].items())
+        for constraint in self._constraints(options):
+            # swarm reads node filters of a build from build args, node==build01 is sent as constraint:node = =build01
+            name, value = constraint.split('=', 1)
+            buildargs['constraint:{name}'.format(name=name)] = value
+        return buildargs
+
+    def _build(self, cli, name, options, log_dir):
+        start = time.time()
+        log = os.path.join(log_dir, '{name}.log'.format(name=name))
+        report = BuildReport(start)
+        error = None
+        try:
+            context = self._context(options['path'], options.get('dockerfile'))
+            with open(log, 'w') as fp:
+                for line in cli.build(fileobj=iter_shared(context['file'], context['lock']), custom_context=True,
+                                      tag=options['tag'], dockerfile=options.get('dockerfile'),
+                                      buildargs=self._buildargs(options) or None,
+                                      nocache=options.get('no_cache', False), pull=options.get('pull', False),
+                                      rm=options.get('rm', True), forcerm=options.get('force_rm', False),
+                                      decode=True):
+                    if line.get('stream') is not None:
+                        report.feed(line['stream'])
+                        fp.write(line['stream'])
+                    elif line.get('error') is not None:
+                        fp.write(line['error'] + '\n')
+                        error = line['error'].strip()
+                report.finish()
+                if report.steps:
+                    fp.write('\n')
+                    report.print_report(fp)
+        except (errors.NotFound, errors.APIError) as e:
+            error = textformat(e.explanation)
+        except (errors.DockerException, requests.exceptions.RequestException, IOError, OSError) as e:
+            error = str(e)
+        report.error = error
+        duration = report.finish().end
+        with self.lock:
+            if error is not None:
+                pyprint('{name}: {error}'.format(name=name, error=error))
+            else:
+                print('{name}: built {tag} in {duration:.1f}s'.format(name=name, tag=options['tag'], duration=duration))
+            sys.stdout.flush()
+        return {'target': name, 'tag': options['tag'], 'error': error, 'duration': duration, 'log': log,
+                'report': report}
+
+    def _summary(self, results):
+        titles = ('TARGET', 'TAG', 'STATUS', 'DURATION', 'UPLOAD', 'CACHED', 'SLOWEST STEP', 'LOG')
+        rows = []
+        for result in sorted(results, key=lambda result: -result['duration']):
+            report = result['report']
+            slowest = report.slowest(1)
+            rows.append((result['target'], result['tag'], 'failed' if result['error'] is not None else 'built',
+                         '{duration:.1f}s'.format(duration=result['duration']),
+                         '{upload:.1f}s'.format(upload=report.upload) if report.upload is not None else '-',
+                         '{hits}/{steps}'.format(hits=report.cache_hits, steps=len(report.steps)),
+                         '{step} ({duration:.1f}s)'.format(**slowest[0]) if slowest else '-',
+                         result['log']))
+        length = [len(title) for title in titles]
+        for row in rows:
+            for i, value in enumerate(row):
+                if len(value) > length[i]:
+                    length[i] = len(value)
+        string = ''
+        for row in [titles] + rows:
+            line = ''
+            for i, value in enumerate(row):
+                line += value + ' ' * (length[i]-len(value)+4)
+            string += line.rstrip() + '\n'
+        print(string.rstrip())
+
+    def matrix(self, path, log_dir='build-logs', workers=4, build_report=None):
+        """
+        Run the builds of a matrix file concurrently
+        :param path(str): YAML or JSON file with `targets` mapping names to path, tag, dockerfile, build_args, \
+constraint, no_cache, pull, rm and force_rm, and optional `defaults` of these options
+        :param log_dir(str): Directory the output of every build is written to, as TARGET.log
+        :param workers(int): Number of builds running concurrently
+        :param build_report(str): File the steps of every build are written to as JSON
+        """
+        try:
+            targets = self._targets(load_spec(path), os.path.dirname(os.path.abspath(path)))
+            if not os.path.isdir(log_dir):
+                os.makedirs(log_dir)
+        except (IOError, OSError, ValueError) as e:
+            print('Error: {error}'.format(error=e))
+            exit(1)
+        cli = self.swarm.pooled(maxsize=workers)
+        if cli is None:
+            return
+        start = time.time()
+        try:
+            results = concurrent_map(lambda target: self._build(cli, target[0], target[1], log_dir), targets, workers)
+        finally:
+            cli.release()
+            for context in self.contexts.values():
+                if context['file'] is not None:
+                    context['file'].close()
+            self.contexts = {}
+        self._summary(results)
+        failed = [result for result in results if result['error'] is not None]
+        print('{built} built, {failed} failed in {duration:.1f}s'.format(built=len(results) - len(failed),
+                                                                        failed=len(failed),
+                                                                        duration=time.time() - start))
+        if build_report is not None:
+            targets = {}
+            for result in results:
+                targets[result['target']] = dict(result['report'].to_dict(), tag=result['tag'], log=result['log'])
+            self._write_report(build_report, {'duration': time.time() - start, 'targets': targets})
+        if failed:
+            exit(1)
 
 
 class Search(Images):
@@ -288,6 +651,7 @@ class Search(Images):
     def __init__(self):
         super(Search, self).__init__()
         self.images_filter = []
+        self.cache = DiskCache('search')
 
     def _pretty_print(self):
         if self.images_filter:
@@ -327,24 +691,172 @@ class Search(Images):
             # print pretty-print string
             print('{title}\n{string}'.format(title=title,string=string.rstrip()))
 
-    def __call__(self, term, **kwargs):
-        cli = self.swarm.client
+    def _search_hub(self, cli, term, ttl):
+        """
+        Search the Docker Hub through the swarm api, answered from cache while fresh
+        and revalidated with the ETag of the cached response once it is not
+        """
+        key = 'hub:{term}'.format(term=term)
+        entry = self.cache.get(key)
+        if self.cache.fresh(entry, ttl):
+            return entry['data']
+        headers = {'If-None-Match': entry['etag']} if entry and entry['etag'] else {}
+        response = cli._get(cli._url('/images/search'), params={'term': term}, headers=headers)
+        if response.status_code == 304:
+            data = entry['data']
+        else:
+            data = cli._result(response, True)
+        self.cache.set(key, data, response.headers.get('ETag'))
+        return data
+
+    def _tls(self, host, ca=None, insecure=False):
+        """
+        Return (verify, cert) of requests to the registry at host, read from /etc/docker/certs.d/HOST like
+        the engine does unless ca is given; insecure registries are not verified
+        """
+        certs = os.path.join('/etc/docker/certs.d', host)
+        cert = None
+        if os.path.exists(os.path.join(certs, 'client.cert')) and os.path.exists(os.path.join(certs, 'client.key')):
+            cert = (os.path.join(certs, 'client.cert'), os.path.join(certs, 'client.key'))
+        if insecure:
+            return False, cert
+        if ca is None and os.path.exists(os.path.join(certs, 'ca.crt')):
+            ca = os.path.join(certs, 'ca.crt')
+        return ca or True, cert
+
+    def _authenticate(self, response, host, verify, cert):
+        """
+        Return the Authorization header answering the challenge of a 401 of a v2 registry,
+        None if it can not be answered
+        Credentials are those of the docker config, a bearer token is requested anonymously without them
+        """
+        credentials = CredentialResolver.get().resolve(host) or {}
+        username = credentials.get('username') or credentials.get('Username')
+        password = credentials.get('password') or credentials.get('Password')
+        identity_token = credentials.get('identitytoken') or credentials.get('IdentityToken')
+        scheme, _, params = response.headers.get('WWW-Authenticate', '').partition(' ')
+        if scheme.lower() == 'basic':
+            if username is None:
+                return None
+            token = base64.b64encode('{user}:{passwd}'.format(user=username, passwd=password).encode('utf8'))
+            return 'Basic ' + token.decode('ascii')
+        challenge = dict(re.findall(r'(\w+)="([^"]*)"', params))
+        realm = challenge.pop('realm', None)
+        if scheme.lower() != 'bearer' or realm is None:
+            return None
+        if identity_token is not None:
+            ret = requests.post(realm, data=dict(challenge, grant_type='refresh_token', client_id='swarm-python',
+                                                 refresh_token=identity_token),
+                                verify=verify, cert=cert, timeout=10)
+        else:
+            ret = requests.get(realm, params=challenge, auth=(username, password) if username is not None else None,
+                               verify=verify, cert=cert, timeout=10)
+        ret.raise_for_status()
+        data = ret.json()
+        token = data.get('token') or data.get('access_token')
+        return 'Bearer ' + token if token else None
+
+    def _catalog(self, registry, ttl, ca=None, insecure=False):
+        """
+        Return the repositories of a v2 registry following the pagination of /v2/_catalog,
+        the whole catalog is cached and revalidated with the ETag of its first page
+        :param ca(str): CA bundle the registry certificate is verified with
+        :param insecure(bool): Do not verify the certificate of the registry
+        """
+        url = registry if '://' in registry else 'https://' + registry
+        host = url.split('://', 1)[1].rstrip('/')
+        key = 'catalog:{url}'.format(url=url)
+        entry = self.cache.get(key)
+        if self.cache.fresh(entry, ttl):
+            return entry['data']
+        verify, cert = self._tls(host, ca, insecure)
+        headers = {'If-None-Match': entry['etag']} if entry and entry['etag'] else {}
+        authorization = {}
+        repositories, etag = [], None
+        path = '/v2/_catalog?n=1000'
+        while path:
+            response = requests.get(url.rstrip('/') + path, headers=dict(headers, **authorization),
+                                    verify=verify, cert=cert, timeout=10)
+            if response.status_code == 401 and not authorization:
+                # answered once, the token is sent along with the following pages
+                header = self._authenticate(response, host, verify, cert)
+                if header is not None:
+                    authorization['Authorization'] = header
+                    continue
+            if response.status_code == 304:
+                repositories = entry['data']
+                break
+            response.raise_for_status()
+            if etag is None:
+                etag = response.headers.get('ETag')
+                headers = {}
+            repositories.extend(response.json().get('repositories') or [])
+            # Link: </v2/_catalog?last=repo&n=1000>; rel="next"
+            link = response.links.get('next', {}).get('url')
+            path = link[link.index('/v2/'):] if link else None
+        self.cache.set(key, repositories, etag or (entry or {}).get('etag'))
+        return repositories
+
+    def _query(self, cli, task, ttl, ca=None, insecure=False):
+        """
+        :param task(tuple): ('hub', term) or ('registry', registry)
+        Return the records found, an empty list on error
+        """
+        kind, value = task
+        try:
+            if kind == 'hub':
+                return self._search_hub(cli, value, ttl)
+            host = value.split('://', 1)[-1].rstrip('/')
+            return [{'name': '{host}/{repository}'.format(host=host, repository=repository),
+                     'description': '', 'star_count': 0, 'is_official': False, 'is_automated': False}
+                    for repository in self._catalog(value, ttl, ca=ca, insecure=insecure)]
+        except (errors.NotFound, errors.APIError, errors.DockerException) as e:
+            pyprint(e.explanation)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print('{registry}: {error}'.format(registry=value, error=e))
+        return []
+
+    def __call__(self, terms, registries=(), automated=False, no_trunc=False, stars=None, cache_ttl=300,
+                 workers=10, output=None, fields=None, registry_ca=None, insecure=False):
+        """
+        :param terms(list): Terms to search for, images matching any of them are shown once
+        :param registries(list): v2 registries whose catalog is searched as well, e.g. registry.example.com:5000
+        :param automated(bool): Only show automated builds
+        :param no_trunc(bool): Don't truncate descriptions
+        :param stars(int): Only show images with at least stars stars
+        :param cache_ttl(float): Seconds results are served from cache before being revalidated, 0 always revalidates
+        :param workers(int): Number of queries running concurrently
+        :param output(str): 'json' or 'ndjson' prints the records of the API, never truncated, instead of a table
+        :param fields(list): With output, only keep these fields of every record
+        :param registry_ca(str): CA bundle the certificates of registries are verified with, \
+/etc/docker/certs.d/HOST/ca.crt by default
+        :param insecure(bool): Do not verify the certificates of registries
+        """
+        if isinstance(terms, six.string_types):
+            terms = [terms]
+        cli = self.swarm.pooled(maxsize=workers)
         if cli is not None:
-            try:
-                response = cli.search(term)
-                for image in response:
-                    if kwargs.get('automated', False):
-                        if not image['is_automated']:
-                            continue
-                    if kwargs.get('stars', 0) > 0:
-                        if image['star_count'] < kwargs['stars']:
-                            continue
-                    if not kwargs.get('no_trunc', False):
-                        if image['description'] >= 45: 
-                            image['description'] = image['description'][:42] + '...'
-                    self.images_filter.append(image)
-                self._pretty_print()
-            except (errors.NotFound, errors.APIError, errors.DockerException) as e:
-                pyprint(e.explanation)
-            finally:
-                cli.close()
+            # one query per term on the hub, one catalog per registry matched against every term
+            tasks = [('hub', term) for term in terms] + [('registry', registry) for registry in registries]
+            ret = concurrent_map(lambda task: self._query(cli, task, cache_ttl, registry_ca, insecure), tasks, workers)
+            cli.release()
+            hub, catalogs = ret[:len(terms)], ret[len(terms):]
+            found = [image for images in hub for image in images] +\
+                    [image for images in catalogs for image in images
+                           if [term for term in terms if term in image['name']]]
+            seen = set()
+            self.images_filter = [image for image in found
+                                  if image['name'] not in seen and not seen.add(image['name'])
+                                  and (not automated or image['is_automated'])
+                                  and image['star_count'] >= (stars or 0)]
+            if output is not None:
+                writer = JsonWriter(output, fields)
+                for image in self.images_filter:
+                    writer.write(image)
+                writer.close()
+                return
+            if not no_trunc:
+                self.images_filter = [dict(image, description=image['description'][:42] + '...')
+                                      if len(image['description'] or '') >= 45 else image
+                                      for image in self.images_filter]
+            self._pretty_print()
@@ -0,0 +1,237 @@
+# -*- coding: utf8 -*-
+
+from __future__ import print_function
+import os
+import sys
+import gzip
+import json
+import time
+import hashlib
+import tempfile
+import six
+from docker import errors
+from swarm.container import ContainerBase
+from swarm.snapshot import ContainerSnapshot
+from swarm.utils import concurrent_map, project, pyprint, JsonWriter
+
+
+# bumped whenever records of a snapshot file change, older versions are still read
+SNAPSHOT_VERSION = 1
+
+
+def _hash(record):
+    return hashlib.sha1(json.dumps(record, sort_keys=True).encode('utf8')).hexdigest()[:16]
+
+
+def load_snapshot(path):
+    """
+    Read a snapshot written by `swarm snapshot save`, gzipped when path ends with .gz, '-' reads from stdin
+    Raise ValueError on files which are not snapshots
+    """
+    if path == '-':
+        data = sys.stdin.read()
+    else:
+        with (gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')) as fp:
+            data = fp.read().decode('utf8')
+    try:
+        snapshot = json.loads(data)
+    except ValueError:
+        raise ValueError('{path}: not a swarm snapshot'.format(path=path))
+    if not isinstance(snapshot, dict) or 'version' not in snapshot:
+        raise ValueError('{path}: not a swarm snapshot'.format(path=path))
+    if snapshot['version'] > SNAPSHOT_VERSION:
+        raise ValueError('{path}: snapshot version {version} is not supported, upgrade swarm-python'.format(
+            path=path, version=snapshot['version']))
+    return snapshot
+
+
+class Snapshot(ContainerBase):
+
+    def __init__(self):
+        super(Snapshot, self).__init__()
+
+    def _inspect(self, cli, cid, fields):
+        try:
+            return project(cli.inspect_container(cid), fields)
+        except (errors.NotFound, errors.APIError, errors.DockerException):
+            # removed since the listing
+            return None
+
+    def capture(self, cli, inspect=None, workers=20):
+        """
+        Return the snapshot of the cluster: containers keyed by node/name, images keyed by id,
+        every record carries the hash of its fields
+        Status is left out since it changes with the uptime of a container
+        :param inspect(list): Fields of inspect_container to keep as well, nested ones joined by dots
+        :param workers(int): Number of containers inspected concurrently
+        """
+        ret = cli.containers(all=True)
+        snapshot = ContainerSnapshot(ret)
+        containers = {}
+        for row in range(len(snapshot)):
+            container = ret[row]
+            containers['{node}/{name}'.format(node=snapshot.nodes[row], name=snapshot.names[row])] = {
+                'Id': snapshot.ids[row],
+                'Image': snapshot.images[row],
+                'ImageID': container.get('ImageID'),
+                'Command': snapshot.commands[row],
+                'Created': snapshot.created[row],
+                'State': snapshot.state(row),
+                'Labels': snapshot.labels[row],
+                'Ports': sorted(container.get('Ports') or [], key=lambda port: json.dumps(port, sort_keys=True)),
+            }
+        if inspect:
+            keys = sorted(containers)
+            details = concurrent_map(lambda key: self._inspect(cli, containers[key]['Id'], inspect), keys, workers)
+            for key, detail in zip(keys, details):
+                containers[key]['Inspect'] = detail
+        images = {}
+        for image in cli.images():
+            images[image['Id']] = {
+                'RepoTags': sorted(image.get('RepoTags') or []),
+                'Created': image.get('Created'),
+                'Size': image.get('Size'),
+            }
+        for records in (containers, images):
+            for record in records.values():
+                record['hash'] = _hash(record)
+        return {
+            'version': SNAPSHOT_VERSION,
+            'created': int(time.time()),
+            'inspect': inspect or [],
+            'containers': containers,
+            'images': images,
+        }
+
+    def _write(self, path, snapshot):
+        data = json.dumps(snapshot, sort_keys=True, separators=(',', ':')).encode('utf8')
+        if path == '-':
+            getattr(sys.stdout, 'buffer', sys.stdout).write(data + b'\n')
+            return
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(prefix='.snapshot.', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                if path.endswith('.gz'):
+                    with gzip.GzipFile(fileobj=fp, mode='wb') as gz:
+                        gz.write(data)
+                else:
+                    fp.write(data)
+            # os.rename does not overwrite on Windows
+            getattr(os, 'replace', os.rename)(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def __call__(self, path, inspect=None, workers=20):
+        """
+        :param path(str): File the snapshot is written to, gzipped if it ends with .gz, '-' writes to stdout
+        :param inspect(list): Fields of inspect_container to record as well, e.g. Config.Env
+        :param workers(int): Number of containers inspected concurrently
+        """
+        cli = self.swarm.pooled(maxsize=workers)
+        if cli is not None:
+            try:
+                snapshot = self.capture(cli, inspect=inspect, workers=workers)
+            except (errors.NotFound, errors.APIError, errors.DockerException) as e:
+                pyprint(e.explanation)
+                exit(1)
+            finally:
+                cli.release()
+            try:
+                self._write(path, snapshot)
+            except (IOError, OSError) as e:
+                print(e)
+                exit(1)
+            if path != '-':
+                print('{containers} containers, {images} images saved in {path}'.format(
+                    containers=len(snapshot['containers']), images=len(snapshot['images']), path=path))
+
+
+class Diff(Snapshot):
+
+    def __init__(self):
+        super(Diff, self).__init__()
+
+    def _compare(self, kind, old, new):
+        """
+        Return changes between two mappings of records as dicts {kind, change, key, ...}
+        Records are compared by hash, fields are only looked at for changed ones
+        """
+        changes = []
+        for key in sorted(set(old) | set(new)):
+            a, b = old.get(key), new.get(key)
+            if a is None:
+                changes.append({'kind': kind, 'change': 'added', 'key': key, 'record': b})
+            elif b is None:
+                changes.append({'kind': kind, 'change': 'removed', 'key': key, 'record': a})
+            elif a['hash'] != b['hash']:
+                fields = dict((field, [a.get(field), b.get(field)]) for field in sorted(set(a) | set(b))
+                              if field != 'hash' and a.get(field) != b.get(field))
+                changes.append({'kind': kind, 'change': 'changed', 'key': key, 'fields': fields})
+        return changes
+
+    def _value(self, field, value):
+        if field in ('Id', 'ImageID') and isinstance(value, six.string_types):
+            return value.split(':')[-1][:12]
+        return json.dumps(value, sort_keys=True) if isinstance(value, (dict, list)) else str(value)
+
+    def _print(self, changes):
+        marks = {'added': '+', 'removed': '-', 'changed': '~'}
+        for change in changes:
+            line = '{mark} {kind} {key}'.format(mark=marks[change['change']], kind=change['kind'], key=change['key'])
+            if change['change'] == 'changed':
+                line += ': ' + ', '.join(('{field} {old} -> {new}'.format(field=field,
+                                                                           old=self._value(field, old),
+                                                                           new=self._value(field, new))
+                                          for field, (old, new) in sorted(change['fields'].items())))
+            elif change['kind'] == 'container':
+                line += ' ({image}, {state})'.format(image=change['record']['Image'], state=change['record']['State'])
+            else:
+                line += ' ({tags})'.format(tags=', '.join(change['record']['RepoTags']) or '<none>')
+            print(line)
+        counts = []
+        for kind in ('container', 'image'):
+            count = dict((verb, len([c for c in changes if c['kind'] == kind and c['change'] == verb]))
+                         for verb in marks)
+            counts.append('{kind}s: {added} added, {removed} removed, {changed} changed'.format(kind=kind, **count))
+        print('; '.join(counts))
+
+    def __call__(self, old, new=None, output=None, fields=None, workers=20):
+        """
+        :param old(str): Snapshot file to compare from
+        :param new(str): Snapshot file to compare to, the live cluster if None
+        :param output(str): 'json' or 'ndjson' prints changes as JSON instead of text
+        :param fields(list): With output, only keep these fields of every change
+        :param workers(int): Number of containers inspected concurrently for a live comparison
+        Exit with 1 if the snapshots differ, like diff(1)
+        """
+        try:
+            before = load_snapshot(old)
+            after = load_snapshot(new) if new is not None else None
+        except (IOError, ValueError) as e:
+            print(e)
+            exit(2)
+        if after is None:
+            cli = self.swarm.pooled(maxsize=workers)
+            if cli is None:
+                exit(2)
+            try:
+                # inspect the same fields as the saved snapshot so that records compare
+                after = self.capture(cli, inspect=before.get('inspect'), workers=workers)
+            except (errors.NotFound, errors.APIError, errors.DockerException) as e:
+                pyprint(e.explanation)
+                exit(2)
+            finally:
+                cli.release()
+        changes = self._compare('container', before['containers'], after['containers']) +\
+                  self._compare('image', before['images'], after['images'])
+        if output is not None:
+            writer = JsonWriter(output, fields)
+            for change in changes:
+                writer.write(change)
+            writer.close()
+        else:
+            self._print(changes)
+        if changes:
+            exit(1)
@@ -5,9 +5,14 @@ from swarm.api import SwarmApi
 from swarm.daemon import Version, Info, Login
 from swarm.container import Containers, StartContainer, StopContainer, RestartContainer,\
                             RemoveContainer, CreateContainer, InspectContainer, Top, Exec,\
-                            Kill, Rename, Logs
-from swarm.image import Images, RemoveImage, Tag, InspectImage, Pull, Push, Build, Search
-from swarm.utils import base_url_found
+                            Kill, Rename, Logs, RollingRestart, ExecAll, Stats, Copy
+from swarm.image import Images, RemoveImage, Tag, InspectImage, Pull, Push, CopyImage, Build, Search
+from swarm.deploy import Apply
+from swarm.exporter import Exporter
+from swarm.batch import Batch
+from swarm.serve import Serve
+from swarm.inventory import Snapshot, Diff
+from swarm.utils import base_url_found, parse_duration
 
 
 class SwarmArgumentParser(object):
@@ -15,7 +20,16 @@ class SwarmArgumentParser(object):
     def __init__(self):
         self._config = SwarmApi().config
         self._parser = argparse.ArgumentParser()
+        self._parser.add_argument('--trace', action='store_true',
+                                             help='Print timing of every API request and of each phase to stderr')
+        self._parser.add_argument('--trace-json', type=str,
+                                                  metavar='FILE',
+                                                  help='Write timing of every API request and of each phase to FILE as JSON')
+        self._parser.add_argument('--retries', type=int,
+                                               default=3,
+                                               help='Times an idempotent request is retried on transient API failures (Default 3)')
         self._subparsers = self._parser.add_subparsers(title='Commands')
+        self._built = False
         self._usage = {
             'api': 'swarm api COMMAND ARG [ARG...]',
             'version': 'swarm version [OPTIONS]',
@@ -27,8 +41,8 @@ class SwarmArgumentParser(object):
             'restart': 'swarm restart [OPTIONS] CONTAINER [CONTAINER...]',
             'rm': 'swarm rm [OPTIONS] CONTAINER [CONTAINER...]',
             'run': 'swarm run [OPTIONS] IMAGE [COMMAND] [ARG...]',
-            'exec': 'swarm exec [OPTIONS] CONTAINER COMMAND [ARG...]',
-            'top': 'swarm top [OPTIONS] CONTAINER [ps OPTIONS]',
+            'exec': 'swarm exec [OPTIONS] CONTAINER COMMAND [ARG...]\n       swarm exec --all [OPTIONS] PATTERN -- COMMAND [ARG...]',
+            'top': 'swarm top [OPTIONS] CONTAINER [CONTAINER...] [ps OPTIONS]',
             'kill': 'docker kill [OPTIONS] CONTAINER [CONTAINER...]',
             'inspect': 'swarm inspect [OPTIONS] CONTAINER|IMAGE [CONTAINER|IMAGE...]',
             'rename': 'swarm rename OLD_NAME NEW_NAME',
@@ -36,10 +50,20 @@ class SwarmArgumentParser(object):
             'images': 'swarm images [OPTIONS] [REPOSITORY]',
             'rmi': 'swarm rmi [OPTIONS] IMAGE [IMAGE...]',
             'tag': 'swarm tag [OPTIONS] IMAGE[:TAG] [REGISTRYHOST/][USERNAME/]NAME[:TAG]',
-            'pull': 'swarm pull [OPTIONS] NAME[:TAG]',
+            'pull': 'swarm pull [OPTIONS] NAME[:TAG] [NAME[:TAG]...]',
             'push': 'swarm push [OPTIONS] NAME[:TAG]',
-            'build': 'swarm build [OPTIONS] PATH | URL | -',
-            'search': 'swarm search [OPTIONS] TERM',
+            'build': 'swarm build [OPTIONS] PATH | URL | -\n       swarm build --matrix FILE [--log-dir DIR] [-w N]',
+            'search': 'swarm search [OPTIONS] TERM [TERM...]',
+            'apply': 'swarm apply [OPTIONS] -f FILE',
+            'rolling-restart': 'swarm rolling-restart [OPTIONS] CONTAINER [CONTAINER...]',
+            'stats': 'swarm stats [OPTIONS] [CONTAINER...]',
+            'exporter': 'swarm exporter [OPTIONS]',
+            'batch': 'swarm batch [OPTIONS] [-f FILE]',
+            'serve': 'swarm serve [OPTIONS]',
+            'snapshot': 'swarm snapshot [OPTIONS] save FILE',
+            'cp': 'swarm cp [OPTIONS] CONTAINER:SRC_PATH DEST_PATH|-\n       swarm cp [OPTIONS] SRC_PATH|- CONTAINER:DEST_PATH',
+            'image': 'swarm image copy [OPTIONS] IMAGE --to NODE[,NODE...]',
+            'diff': 'swarm diff [OPTIONS] SNAPSHOT [SNAPSHOT | --live]',
         }
         self._help = {
             'api': 'Set swarm api to enable other comamnds',
@@ -53,7 +77,7 @@ class SwarmArgumentParser(object):
             'rm': 'Remove one or more containers',
             'run': 'Run a command in a new container',
             'exec': 'Run a command in a running container',
-            'top': 'Display the running processes of a container',
+            'top': 'Display the running processes of one or more containers',
             'kill': 'Kill a running container using SIGKILL or a specified signal',
             'inspect': 'Return low-level information on a container or image',
             'rename': 'Rename a container',
@@ -61,13 +85,33 @@ class SwarmArgumentParser(object):
             'images': 'List images',
             'rmi': 'Remove one or more images',
             'tag': 'Tag an image into a repository',
-            'pull': 'Pull an image or a repository from a registry',
+            'pull': 'Pull images or repositories from a registry',
             'push': 'Push an image or a repository to a registry',
             'build': 'Build a new image from the source code at PATH',
-            'search': 'Search the Docker Hub for images',
+            'search': 'Search the Docker Hub and v2 registries for images',
+            'apply': 'Create, update or remove containers to match a deploy spec',
+            'rolling-restart': 'Restart containers batch by batch, waiting for each batch to become healthy',
+            'stats': 'Display a live stream of container resource usage statistics',
+            'exporter': 'Serve cluster metrics in the Prometheus text format',
+            'batch': 'Run swarm commands read from a file, one per line, and print a JSON result per command',
+            'serve': 'Run swarm commands of other invocations over connections kept open, forwarded through a unix socket',
+            'snapshot': 'Save the containers and images of the cluster to a file',
+            'cp': 'Copy files/folders between a container and the local filesystem',
+            'image': 'Copy an image to other nodes without a registry',
+            'diff': 'Show containers and images added, removed or changed between two snapshots',
         }
 
-    def parse_args(self):
+    def parse_args(self, args=None):
+        """
+        :param args(list): Arguments to parse, sys.argv by default
+        """
+        # subparsers are added once, batch parses every line with the same parser
+        if not self._built:
+            self._build()
+        return self._parser.parse_args(args)
+
+    def _build(self):
+        self._built = True
         self._add_parser_api()
         if base_url_found(self._config):
             self._add_parser_version()
@@ -86,16 +130,40 @@ class SwarmArgumentParser(object):
             self._add_parser_kill()
             self._add_parser_rename()
             self._add_parser_logs()
+            self._add_parser_cp()
             self._add_parser_rmi()
             self._add_parser_tag()
             self._add_parser_pull()
             self._add_parser_push()
+            self._add_parser_image()
             self._add_parser_build()
             self._add_parser_search()
-        return self._parser.parse_args()
+            self._add_parser_apply()
+            self._add_parser_rolling_restart()
+            self._add_parser_stats()
+            self._add_parser_exporter()
+            self._add_parser_batch()
+            self._add_parser_serve()
+            self._add_parser_snapshot()
+            self._add_parser_diff()
+
+    def _add_output_arguments(self, parser, default=False):
+        """
+        Add --json / --ndjson and --fields to parser of a read command
+        :param default(bool): JSON is the default output of the command
+        """
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument('--json', dest='output', action='store_const', const='json',
+                                     help='Print the records of the API as JSON{default}'.format(
+                                         default=' (Default)' if default else ''))
+        group.add_argument('--ndjson', dest='output', action='store_const', const='ndjson',
+                                       help='Print the records of the API as one JSON document per line')
+        parser.add_argument('--fields', type=lambda value: value.split(','),
+                                        metavar='FIELD[,FIELD...]',
+                                        help='With --json or --ndjson, only keep these fields, nested ones joined by dots (e.g. Id,State.Status)')
 
     def _add_parser_api(self):
-        choices = ('list', 'set', 'unset', 'use', 'version', 'tls', 'tlscacert', 'tlscert',
+        choices = ('list', 'set', 'unset', 'use', 'probe', 'version', 'tls', 'tlscacert', 'tlscert',
                     'tlskey', 'tlsverify', 'tlsconfig')
         parser_api = self._subparsers.add_parser('api', description=self._help['api'],
                                                         help=self._help['api'],
@@ -111,7 +179,8 @@ format:
 list
 set [ api1=tcp://ip:port api2=tcp://ip:port ... ]
 unset [ api1 api2 ... | all ]
-use api1
+use [ api1 | auto ]
+probe [ TTL ]
 version [ x.xx | auto ]
 tlsconfig
 tls [0|1]
@@ -126,6 +195,7 @@ tlsverify [0|1]''')
         parser_version = self._subparsers.add_parser('version', description=self._help['version'],
                                                                 help=self._help['version'],
                                                                 usage=self._usage['version'])
+        self._add_output_arguments(parser_version)
         parser_version.set_defaults(func=Version())
         parser_version.set_defaults(cmd='version')
 
@@ -133,6 +203,7 @@ tlsverify [0|1]''')
         parser_info = self._subparsers.add_parser('info', description=self._help['info'],
                                                           help=self._help['info'],
                                                           usage=self._usage['info'])
+        self._add_output_arguments(parser_info)
         parser_info.set_defaults(func=Info())
         parser_info.set_defaults(cmd='info')
 
@@ -160,12 +231,25 @@ tlsverify [0|1]''')
         parser_ps.add_argument('-l', '--limit', action='append',
                                                 metavar='NODE',
                                                 help='''\
-Show containers of the specific nodes
+Show containers of the specific nodes, ranges and globs are supported
 e.g. -l web.example.com -l mail.example.com
-     -l db[01:08].example.com -l db10.example.com''')
+     -l db[01:08].example.com -l db10.example.com
+     -l node[001:500]-[a:z],web*''')
+        parser_ps.add_argument('--summary', action='store_true',
+                                            help='Show counts of all containers per state instead of the containers')
+        parser_ps.add_argument('--group-by', type=self._group_by,
+                                             default='node',
+                                             metavar='node|image|status|label:KEY',
+                                             help='Group counts of --summary by node, image, status or the value of a label (Default node)')
+        self._add_output_arguments(parser_ps)
         parser_ps.set_defaults(func=Containers())
         parser_ps.set_defaults(cmd='ps')
 
+    def _group_by(self, value):
+        if value in ('node', 'image', 'status') or (value.startswith('label:') and len(value) > len('label:')):
+            return value
+        raise argparse.ArgumentTypeError('expected node, image, status or label:KEY')
+
     def _add_parser_start(self):
         parser_start = self._subparsers.add_parser('start', description=self._help['start'],
                                                             help=self._help['start'],
@@ -250,22 +334,33 @@ e.g. -l web.example.com -l mail.example.com
         parser_exec = self._subparsers.add_parser('exec', description=self._help['exec'],
                                                           help=self._help['exec'],
                                                           usage=self._usage['exec'])
+        parser_exec.add_argument('-a', '--all', action='store_true', help='Run the command in every running container matching CONTAINER')
         parser_exec.add_argument('-d', '--detach', action='store_true', help='Detached mode: run command in the background')
         parser_exec.add_argument('-i', '--interactive', action='store_true', help='Keep STDIN open even if not attached')
         parser_exec.add_argument('-t', '--tty', action='store_true', help='Allocate a pseudo-TTY')
         parser_exec.add_argument('-u', '--user', type=str, help='Username or UID (format: <name|uid>[:<group|gid>])')
+        parser_exec.add_argument('--prefix', action='store_true', help='With --all, prefix output lines with container name instead of grouping them')
+        parser_exec.add_argument('--timeout', type=parse_duration, metavar='DURATION', help='With --all, time limit of each exec (e.g., 30s)')
+        parser_exec.add_argument('-w', '--workers', type=int, default=20, help='With --all, number of concurrent execs (Default 20)')
         parser_exec.add_argument('CONTAINER', type=str, help='Container ID')
         parser_exec.add_argument('COMMAND', type=str, help='Command to be executed')
         parser_exec.add_argument('ARG', nargs=argparse.REMAINDER, help='Command arguments')
         parser_exec.set_defaults(func=Exec())
+        parser_exec.set_defaults(exec_all=ExecAll())
         parser_exec.set_defaults(cmd='exec')
 
     def _add_parser_top(self):
         parser_top = self._subparsers.add_parser('top', description=self._help['top'],
                                                         help=self._help['top'],
                                                         usage=self._usage['top'])
-        parser_top.add_argument('CONTAINER', type=str, help='Container ID')
-        parser_top.add_argument('ps_args', nargs='?', metavar='ps OPTIONS', help='e.g., aux')
+        parser_top.add_argument('CONTAINER', nargs='+',
+                                             help='Container ID or name, wildcard is supported. '
+                                                  'A last argument which is no container is passed to ps like -o')
+        parser_top.add_argument('-o', '--ps-args', type=str, metavar='ps OPTIONS', help='Options passed to ps, e.g., aux')
+        parser_top.add_argument('-s', '--sort', type=str, metavar='COLUMN', help='Sort processes by column, e.g., %%CPU or RSS')
+        parser_top.add_argument('-n', '--top', type=int, metavar='N', help='Only show the first N processes')
+        parser_top.add_argument('-w', '--workers', type=int, default=20, help='Number of concurrent requests (Default 20)')
+        self._add_output_arguments(parser_top)
         parser_top.set_defaults(func=Top())
         parser_top.set_defaults(cmd='top')
 
@@ -287,6 +382,7 @@ e.g. -l web.example.com -l mail.example.com
         parser_inspect.add_argument('OBJECT', nargs='+',
                                               metavar='CONTAINER|IMAGE',
                                               help='id or name of container|image')
+        self._add_output_arguments(parser_inspect, default=True)
         parser_inspect.set_defaults(inspect_container=InspectContainer())
         parser_inspect.set_defaults(inspect_image=InspectImage())
         parser_inspect.set_defaults(cmd='inspect')
@@ -326,9 +422,25 @@ e.g. -l web.example.com -l mail.example.com
                                                    help='''\
 Filter output based on conditions provided
 Use \'[-f|--filter] node=<nodename>\' to show images of the specific node''')
+        self._add_output_arguments(parser_images)
         parser_images.set_defaults(func=Images())
         parser_images.set_defaults(cmd='images')
 
+    def _add_parser_cp(self):
+        parser_cp = self._subparsers.add_parser('cp', description=self._help['cp'],
+                                                      help=self._help['cp'],
+                                                      usage=self._usage['cp'],
+                                                      formatter_class=argparse.RawTextHelpFormatter)
+        parser_cp.add_argument('SRC', help='CONTAINER:SRC_PATH, local SRC_PATH, or - to read a tar from stdin')
+        parser_cp.add_argument('DST', help='''\
+CONTAINER:DEST_PATH, local DEST_PATH, or - to write a tar to stdout
+CONTAINER may be a wildcard name to copy to every matching container
+e.g. swarm cp app.conf 'web-*':/etc/app/''')
+        parser_cp.add_argument('-w', '--workers', type=int, default=10,
+                                                  help='Number of containers copied to concurrently (Default 10)')
+        parser_cp.set_defaults(func=Copy())
+        parser_cp.set_defaults(cmd='cp')
+
     def _add_parser_rmi(self):
         parser_rmi = self._subparsers.add_parser('rmi', description=self._help['rmi'],
                                                         help=self._help['rmi'],
@@ -354,8 +466,10 @@ Use \'[-f|--filter] node=<nodename>\' to show images of the specific node''')
         parser_pull.add_argument('--insecure', action='store_true', help='Use an insecure registry')
         parser_pull.add_argument('--auth', type=str,
                                            metavar='username:password',
-                                           help='Override credentials for client login')
-        parser_pull.add_argument('REPOTAG', type=str,
+                                           help='Override credentials of the docker config')
+        parser_pull.add_argument('-w', '--workers', type=int, default=4,
+                                                   help='Number of images pulled concurrently (Default 4)')
+        parser_pull.add_argument('REPOTAG', type=str, nargs='+',
                                             metavar='NAME[:TAG]',
                                             help='Image name with optional tag')
         parser_pull.set_defaults(func=Pull())
@@ -370,6 +484,27 @@ Use \'[-f|--filter] node=<nodename>\' to show images of the specific node''')
         parser_push.set_defaults(func=Push())
         parser_push.set_defaults(cmd='push')
 
+    def _add_parser_image(self):
+        parser_image = self._subparsers.add_parser('image', description=self._help['image'],
+                                                            help=self._help['image'],
+                                                            usage=self._usage['image'],
+                                                            formatter_class=argparse.RawTextHelpFormatter)
+        parser_image.add_argument('command', choices=('copy',),
+                                             metavar='COMMAND',
+                                             help='Available comamnd: copy')
+        parser_image.add_argument('IMAGE', help='Image name with optional tag, or image ID')
+        parser_image.add_argument('--to', action='append', required=True,
+                                          metavar='NODE',
+                                          help='''\
+Nodes to load the image on, ranges and globs are supported
+e.g. --to node1,node2 --to web[01:08]''')
+        parser_image.add_argument('--from', dest='source', metavar='NODE',
+                                            help='Node to save the image from (Default is any node having it)')
+        parser_image.add_argument('-z', '--compress', action='store_true',
+                                                      help='Gzip the image on its way to the nodes')
+        parser_image.set_defaults(func=CopyImage())
+        parser_image.set_defaults(cmd='image')
+
     def _add_parser_build(self):
         parser_build = self._subparsers.add_parser('build', description=self._help['build'],
                                                             help=self._help['build'],
@@ -386,7 +521,14 @@ Use \'[-f|--filter] node=<nodename>\' to show images of the specific node''')
         parser_build.add_argument('-q', '--quiet', action='store_true', help='Suppress the verbose output generated by the containers')
         parser_build.add_argument('--rm', choices=(True, False), default=True, help='Remove intermediate containers after a successful build')
         parser_build.add_argument('-t', '--tag', type=str, default='latest', help='Repository name (and optionally a tag) for the image')
-        parser_build.add_argument('PATH', type=str, metavar='PATH | URL | -')
+        parser_build.add_argument('--build-report', type=str, metavar='FILE',
+                                                    help='Write the duration and cache use of every step as JSON to FILE')
+        parser_build.add_argument('--matrix', type=str, metavar='FILE',
+                                              help='Build the targets of a YAML or JSON file concurrently')
+        parser_build.add_argument('--log-dir', type=str, default='build-logs',
+                                               help='Directory of the output of matrix builds (Default is build-logs)')
+        parser_build.add_argument('-w', '--workers', type=int, default=4, help='Number of concurrent matrix builds (Default 4)')
+        parser_build.add_argument('PATH', type=str, nargs='?', metavar='PATH | URL | -')
         parser_build.set_defaults(func=Build())
         parser_build.set_defaults(cmd='build')
 
@@ -394,9 +536,151 @@ Use \'[-f|--filter] node=<nodename>\' to show images of the specific node''')
         parser_search = self._subparsers.add_parser('search', description=self._help['search'],
                                                               help=self._help['search'],
                                                               usage=self._usage['search'])
-        parser_search.add_argument('TERM', type=str)
+        parser_search.add_argument('TERM', type=str, nargs='+', help='Images matching any of the terms are shown')
         parser_search.add_argument('--automated', action='store_true', help='Only show automated builds')
         parser_search.add_argument('--no-trunc', action='store_true', help='Don\'t truncate output')
         parser_search.add_argument('-s', '--stars', type=int, help='Only displays with at least x stars')
+        parser_search.add_argument('-r', '--registry', action='append', default=[],
+                                                       metavar='REGISTRY',
+                                                       help='Search the catalog of a v2 registry as well, e.g. registry.example.com:5000')
+        parser_search.add_argument('--registry-ca', type=str, metavar='FILE',
+                                                    help='CA the certificates of registries are verified with (Default is /etc/docker/certs.d/REGISTRY/ca.crt)')
+        parser_search.add_argument('--insecure', action='store_true', help='Do not verify the certificates of registries')
+        parser_search.add_argument('--cache-ttl', type=parse_duration, default=300,
+                                                  metavar='DURATION',
+                                                  help='Time results are reused before being revalidated, 0 always revalidates (Default 5m)')
+        parser_search.add_argument('-w', '--workers', type=int, default=10, help='Number of concurrent queries (Default 10)')
+        self._add_output_arguments(parser_search)
         parser_search.set_defaults(func=Search())
         parser_search.set_defaults(cmd='search')
+
+    def _add_parser_apply(self):
+        parser_apply = self._subparsers.add_parser('apply', description=self._help['apply'],
+                                                            help=self._help['apply'],
+                                                            usage=self._usage['apply'],
+                                                            formatter_class=argparse.RawTextHelpFormatter)
+        parser_apply.add_argument('-f', '--file', type=str, required=True,
+                                                  help='''\
+Deploy spec in YAML or JSON, '-' reads from stdin
+e.g. services:
+       web:
+         image: nginx:1.11
+         replicas: 3
+         ports: ["80"]
+         constraint: ["node==web*"]''')
+        parser_apply.add_argument('--dry-run', action='store_true', help='Only show actions which would be taken')
+        parser_apply.add_argument('--prune', action='store_true', help='Remove containers of services not in the spec')
+        parser_apply.add_argument('-t', '--time', type=int,
+                                                  default=10,
+                                                  help='Seconds to wait for stop before killing it (Default 10 seconds)')
+        parser_apply.add_argument('-w', '--workers', type=int, default=10, help='Number of concurrent actions (Default 10)')
+        parser_apply.set_defaults(func=Apply())
+        parser_apply.set_defaults(cmd='apply')
+
+    def _add_parser_rolling_restart(self):
+        parser_rolling_restart = self._subparsers.add_parser('rolling-restart', description=self._help['rolling-restart'],
+                                                                                help=self._help['rolling-restart'],
+                                                                                usage=self._usage['rolling-restart'])
+        parser_rolling_restart.add_argument('-b', '--batch', type=int, default=1,
+                                                             help='Number of containers restarted at the same time (Default 1)')
+        parser_rolling_restart.add_argument('--wait-healthy', type=parse_duration, default=0,
+                                                              metavar='DURATION',
+                                                              help='Wait up to DURATION (e.g., 30s) for each batch to become healthy')
+        parser_rolling_restart.add_argument('--interval', type=parse_duration, default=1,
+                                                          metavar='DURATION',
+                                                          help='Interval between two health checks (Default 1s)')
+        parser_rolling_restart.add_argument('--max-failure-ratio', type=float, default=0,
+                                                                   help='Abort once the ratio of failed containers exceeds it (Default 0)')
+        parser_rolling_restart.add_argument('-t', '--time', type=int,
+                                                            default=10,
+                                                            help='Seconds to wait for stop before killing it (Default 10 seconds)')
+        parser_rolling_restart.add_argument('CONTAINER', nargs='+', help='Container ID or name, wildcard is supported')
+        parser_rolling_restart.set_defaults(func=RollingRestart())
+        parser_rolling_restart.set_defaults(cmd='rolling-restart')
+
+    def _add_parser_stats(self):
+        parser_stats = self._subparsers.add_parser('stats', description=self._help['stats'],
+                                                            help=self._help['stats'],
+                                                            usage=self._usage['stats'])
+        parser_stats.add_argument('--interval', type=parse_duration, default=1,
+                                                metavar='DURATION',
+                                                help='Refresh interval (Default 1s)')
+        parser_stats.add_argument('--json', action='store_true', help='Print one JSON line per container and refresh')
+        parser_stats.add_argument('--no-stream', action='store_true', help='Disable streaming stats and only pull the first result')
+        parser_stats.add_argument('CONTAINER', nargs='*',
+                                               help='Container ID or name, wildcard is supported (Default all running containers)')
+        parser_stats.set_defaults(func=Stats())
+        parser_stats.set_defaults(cmd='stats')
+
+    def _add_parser_exporter(self):
+        parser_exporter = self._subparsers.add_parser('exporter', description=self._help['exporter'],
+                                                                  help=self._help['exporter'],
+                                                                  usage=self._usage['exporter'])
+        parser_exporter.add_argument('--interval', type=parse_duration, default=15,
+                                                   metavar='DURATION',
+                                                   help='Interval between two refreshes of the metrics (Default 15s)')
+        parser_exporter.add_argument('--listen', type=str, default=':9323',
+                                                 metavar='[HOST]:PORT',
+                                                 help='Address to serve /metrics on (Default :9323)')
+        parser_exporter.add_argument('--no-events', action='store_true',
+                                                    help='Do not watch /events, only refresh periodically')
+        parser_exporter.set_defaults(func=Exporter())
+        parser_exporter.set_defaults(cmd='exporter')
+
+    def _add_parser_batch(self):
+        parser_batch = self._subparsers.add_parser('batch', description=self._help['batch'],
+                                                            help=self._help['batch'],
+                                                            usage=self._usage['batch'])
+        parser_batch.add_argument('-f', '--file', type=str, default='-',
+                                              help='File of commands, one per line without the leading `swarm`, `wait` waits for the previous commands (Default stdin)')
+        parser_batch.add_argument('-w', '--workers', type=int, default=10,
+                                                 help='Number of commands running concurrently (Default 10)')
+        parser_batch.add_argument('--sequential', action='store_true',
+                                                  help='Run commands one by one in file order')
+        parser_batch.set_defaults(func=Batch())
+        parser_batch.set_defaults(cmd='batch')
+
+    def _add_parser_serve(self):
+        parser_serve = self._subparsers.add_parser('serve', description=self._help['serve'],
+                                                            help=self._help['serve'],
+                                                            usage=self._usage['serve'])
+        parser_serve.add_argument('--socket', type=str,
+                                              metavar='PATH',
+                                              help='Unix socket to listen on (Default $SWARM_SOCKET or ~/.swarm/sock)')
+        parser_serve.add_argument('-w', '--workers', type=int, default=20,
+                                                 help='Number of connections kept open to the swarm api (Default 20)')
+        parser_serve.add_argument('--cache-ttl', type=parse_duration, default=2,
+                                                 metavar='DURATION',
+                                                 help='Time the container listing is served from memory, 0 disables it (Default 2s)')
+        parser_serve.set_defaults(func=Serve())
+        parser_serve.set_defaults(cmd='serve')
+
+    def _add_parser_snapshot(self):
+        parser_snapshot = self._subparsers.add_parser('snapshot', description=self._help['snapshot'],
+                                                                  help=self._help['snapshot'],
+                                                                  usage=self._usage['snapshot'])
+        parser_snapshot.add_argument('command', choices=('save',),
+                                                metavar='COMMAND',
+                                                help='Available comamnd: save')
+        parser_snapshot.add_argument('FILE', help='Snapshot file, gzipped if it ends with .gz, \'-\' writes to stdout')
+        parser_snapshot.add_argument('--inspect', type=lambda value: value.split(','),
+                                                  metavar='FIELD[,FIELD...]',
+                                                  help='Record these fields of inspect as well, nested ones joined by dots (e.g. Config.Env,HostConfig.Memory)')
+        parser_snapshot.add_argument('-w', '--workers', type=int, default=20,
+                                                        help='Number of containers inspected concurrently (Default 20)')
+        parser_snapshot.set_defaults(func=Snapshot())
+        parser_snapshot.set_defaults(cmd='snapshot')
+
+    def _add_parser_diff(self):
+        parser_diff = self._subparsers.add_parser('diff', description=self._help['diff'],
+                                                          help=self._help['diff'],
+                                                          usage=self._usage['diff'],
+                                                          epilog='Exit status is 0 without differences, 1 with differences, 2 on error')
+        parser_diff.add_argument('OLD', metavar='SNAPSHOT', help='Snapshot to compare from')
+        parser_diff.add_argument('NEW', metavar='SNAPSHOT', nargs='?', help='Snapshot to compare to')
+        parser_diff.add_argument('--live', action='store_true', help='Compare to the cluster as it is now')
+        parser_diff.add_argument('-w', '--workers', type=int, default=20,
+                                                    help='Number of containers inspected concurrently with --live (Default 20)')
+        self._add_output_arguments(parser_diff)
+        parser_diff.set_defaults(func=Diff())
+        parser_diff.set_defaults(cmd='diff')
@@ -0,0 +1,154 @@
+# -*- coding: utf8 -*-
+
+from __future__ import print_function
+import re
+import time
+import random
+import threading
+import requests
+from requests.packages.urllib3.exceptions import NewConnectionError
+from six.moves.urllib.parse import urlparse
+
+
+# status codes a swarm manager answers with when it is overloaded or losing its leader
+RETRY_STATUS = (502, 503, 504)
+
+
+def is_idempotent(method, url):
+    """
+    Whether repeating the request leaves the cluster in the same state:
+    reads, and lifecycle operations which are no-op on an already transitioned container
+    `restart` and `kill` are not, they act again when repeated
+    """
+    method = method.upper()
+    if method in ('GET', 'HEAD', 'OPTIONS'):
+        return True
+    if method == 'POST':
+        path = urlparse(url).path.rstrip('/')
+        return re.match(r'^(/v[0-9.]+)?/containers/[^/]+/(start|stop|pause|unpause|wait)$', path) is not None
+    return False
+
+
+def is_unsent(error):
+    """
+    Whether the request failed before reaching the server, which makes it safe to retry whatever its method
+    """
+    if isinstance(error, (requests.exceptions.ConnectTimeout, ConnectError)):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+class ConnectError(requests.exceptions.ConnectionError):
+    """
+    The connection to the api could not be established
+    """
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    pass
+
+
+class CircuitBreaker(object):
+    """
+    Stop sending requests to an endpoint after `threshold` consecutive failures,
+    then let one request through every `reset_timeout` seconds until one succeeds
+    """
+
+    _breakers = {}
+    _lock = threading.Lock()
+
+    def __init__(self, endpoint, threshold=5, reset_timeout=30):
+        self.endpoint = endpoint
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened = None
+        self.lock = threading.Lock()
+
+    @classmethod
+    def get(cls, endpoint):
+        """
+        Return the breaker of endpoint, shared by every client of the process
+        """
+        with cls._lock:
+            if endpoint not in cls._breakers:
+                cls._breakers[endpoint] = cls(endpoint)
+            return cls._breakers[endpoint]
+
+    def allow(self):
+        with self.lock:
+            if self.opened is None:
+                return True
+            if time.time() - self.opened >= self.reset_timeout:
+                # half-open, the next trial waits for another reset_timeout unless this one succeeds
+                self.opened = time.time()
+                return True
+            return False
+
+    def check(self):
+        if not self.allow():
+            raise CircuitOpenError('Circuit open for {endpoint} after {failures} consecutive failures'.format(
+                endpoint=self.endpoint, failures=self.failures))
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened = None
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold and self.opened is None:
+                self.opened = time.time()
+
+
+class RetryPolicy(object):
+
+    def __init__(self, retries=3, backoff=0.2, max_backoff=5):
+        """
+        :param retries(int): Number of retries after the first attempt
+        :param backoff(float): Base delay in seconds, doubled at every attempt
+        :param max_backoff(float): Upper bound of the delay in seconds
+        """
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def delay(self, attempt):
+        """
+        Full jitter: a random delay between 0 and the exponential backoff of attempt
+        """
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def instrument(self, cli, endpoint):
+        """
+        Retry idempotent requests of cli on connection errors, timeouts and 502/503/504,
+        and fail fast while the circuit breaker of endpoint is open
+        """
+        policy = self
+        breaker = CircuitBreaker.get(endpoint)
+        request = cli.request
+
+        def _request(method, url, *args, **kwargs):
+            attempt = 0
+            while True:
+                breaker.check()
+                try:
+                    response = request(method, url, *args, **kwargs)
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                    breaker.failure()
+                    if attempt >= policy.retries or not (is_idempotent(method, url) or is_unsent(e)):
+                        raise
+                else:
+                    if response.status_code not in RETRY_STATUS:
+                        breaker.success()
+                        return response
+                    breaker.failure()
+                    if attempt >= policy.retries or not is_idempotent(method, url):
+                        return response
+                    response.close()
+                time.sleep(policy.delay(attempt))
+                attempt += 1
+        cli.request = _request
+        return cli
@@ -0,0 +1,265 @@
+# -*- coding: utf8 -*-
+
+from __future__ import print_function
+import os
+import sys
+import copy
+import json
+import time
+import errno
+import signal
+import socket
+import threading
+from six.moves import socketserver
+from swarm.api import SwarmApi
+from swarm.client import SwarmClient
+from swarm.utils import ThreadOutput
+
+
+# commands run by the invoking process: they read the terminal or stdin, take local paths or never return
+LOCAL_COMMANDS = ('api', 'login', 'run', 'exec', 'build', 'apply', 'batch', 'serve', 'exporter', 'snapshot', 'diff', 'cp')
+
+# commands which leave the containers of the cluster as they are, any other one run directly invalidates the daemon cache
+READ_ONLY_COMMANDS = ('api', 'login', 'version', 'info', 'ps', 'top', 'inspect', 'logs', 'images', 'search', 'stats',
+                      'exporter', 'serve', 'snapshot', 'diff')
+
+
+def socket_path():
+    """
+    Socket of `swarm serve`, $SWARM_SOCKET or $HOME/.swarm/sock, an empty $SWARM_SOCKET disables forwarding
+    """
+    path = os.environ.get('SWARM_SOCKET')
+    if path is None:
+        path = os.path.join(os.path.dirname(SwarmApi().config), 'sock')
+    return path
+
+
+def invalidate(path):
+    """
+    Tell the `swarm serve` daemon listening on path that the cluster changed under it, by touching path.stamp
+    The daemon drops its cached listing when the stamp is newer than the listing
+    """
+    if not path or not os.path.exists(path):
+        return
+    stamp = path + '.stamp'
+    try:
+        with open(stamp, 'a'):
+            os.utime(stamp, None)
+    except (IOError, OSError):
+        pass
+
+
+def _connect(path):
+    """
+    Return a socket connected to the daemon listening on path, None if there is none
+    """
+    if not path or not hasattr(socket, 'AF_UNIX') or not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except socket.error:
+        sock.close()
+        return None
+    return sock
+
+
+def forward(path, argv):
+    """
+    Run argv by the `swarm serve` daemon listening on path and relay its output
+    Return the exit code of the command, None if no daemon is listening
+    """
+    sock = _connect(path)
+    if sock is None:
+        return None
+    streams = {1: sys.stdout, 2: sys.stderr}
+    try:
+        sock.sendall(json.dumps({'argv': argv}).encode('utf8') + b'\n')
+        for line in sock.makefile('rb'):
+            frame = json.loads(line.decode('utf8'))
+            if 'exit_code' in frame:
+                return frame['exit_code']
+            stream = streams[frame['fd']]
+            stream.write(frame['data'])
+            stream.flush()
+    finally:
+        sock.close()
+    # the daemon went away in the middle of the command
+    print('Connection to swarm serve at {path} lost'.format(path=path), file=sys.stderr)
+    return 1
+
+
+class FrameWriter(object):
+    """
+    File-like object sending writes to the connection as {"fd": fd, "data": data} lines
+    """
+
+    def __init__(self, wfile, fd, lock):
+        self.wfile = wfile
+        self.fd = fd
+        self.lock = lock
+
+    def write(self, data):
+        if not data:
+            return
+        if isinstance(data, bytes):
+            data = data.decode('utf8', 'replace')
+        frame = json.dumps({'fd': self.fd, 'data': data}).encode('utf8') + b'\n'
+        with self.lock:
+            self.wfile.write(frame)
+            self.wfile.flush()
+
+    def flush(self):
+        pass
+
+
+class ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class Serve(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.config_mtime = None
+        self.stamp = None
+
+    def _stamp(self):
+        """
+        Time commands run outside of the daemon last changed the cluster, see invalidate()
+        """
+        try:
+            return os.path.getmtime(self.stamp) if self.stamp is not None else None
+        except OSError:
+            return None
+
+    def _cache_listing(self, cli, ttl):
+        """
+        Serve cli.containers() from memory for ttl seconds, any request other than GET invalidates the cache,
+        as well as commands changing the cluster from other processes
+        """
+        containers = cli.containers
+        request = cli.request
+        cache = {}
+        lock = threading.Lock()
+
+        def _containers(*args, **kwargs):
+            key = json.dumps([args, kwargs], sort_keys=True, default=str)
+            stamp = self._stamp()
+            with lock:
+                hit = cache.get(key)
+            if hit is None or time.time() - hit[0] > ttl or hit[2] != stamp:
+                hit = (time.time(), containers(*args, **kwargs), stamp)
+                with lock:
+                    cache[key] = hit
+            # commands are free to modify the listing they get
+            return copy.deepcopy(hit[1])
+
+        def _request(method, url, *args, **kwargs):
+            if method.upper() != 'GET':
+                with lock:
+                    cache.clear()
+            return request(method, url, *args, **kwargs)
+        cli.containers = _containers
+        cli.request = _request
+        return cli
+
+    def _share(self, workers, cache_ttl):
+        """
+        Connect the shared client again whenever the config changed, e.g. after `swarm api use`
+        Return False if no swarm api is accessible
+        """
+        with self.lock:
+            try:
+                mtime = os.path.getmtime(SwarmApi().config)
+            except OSError:
+                mtime = None
+            if SwarmClient.shared is not None and mtime == self.config_mtime:
+                return True
+            # commands in progress keep the client they got, it is left to the garbage collector
+            SwarmClient.shared = None
+            cli = SwarmClient.share(maxsize=workers)
+            if cli is None:
+                return False
+            if cache_ttl:
+                self._cache_listing(cli, cache_ttl)
+            self.config_mtime = mtime
+            return True
+
+    def _handler(self, parser, command_class, workers, cache_ttl):
+        serve = self
+
+        class CommandHandler(socketserver.StreamRequestHandler):
+
+            def handle(self):
+                lock = threading.Lock()
+                stdout, stderr = FrameWriter(self.wfile, 1, lock), FrameWriter(self.wfile, 2, lock)
+                exit_code = 0
+                line = self.rfile.readline()
+                if not line:
+                    # connection only checking the daemon is alive
+                    return
+                sys.stdout.capture(stdout)
+                sys.stderr.capture(stderr)
+                try:
+                    request = json.loads(line.decode('utf8'))
+                    if not serve._share(workers, cache_ttl):
+                        exit(1)
+                    command = command_class(parser, request['argv'])
+                    if command.cmd in LOCAL_COMMANDS:
+                        print('`swarm {cmd}` can not be run by swarm serve'.format(cmd=command.cmd), file=sys.stderr)
+                        exit(2)
+                    command()
+                except SystemExit as e:
+                    exit_code = e.code if isinstance(e.code, int) else int(e.code is not None)
+                except Exception as e:
+                    if isinstance(e, socket.error) and e.errno in (errno.EPIPE, errno.ECONNRESET):
+                        # the client went away, e.g. interrupted by Ctrl-C
+                        return
+                    print('{name}: {error}'.format(name=type(e).__name__, error=e), file=sys.stderr)
+                    exit_code = 1
+                finally:
+                    sys.stdout.release()
+                    sys.stderr.release()
+                try:
+                    with lock:
+                        self.wfile.write(json.dumps({'exit_code': exit_code}).encode('utf8') + b'\n')
+                except socket.error:
+                    pass
+
+        return CommandHandler
+
+    def __call__(self, parser, command_class, path=None, workers=20, cache_ttl=2):
+        """
+        :param parser(SwarmArgumentParser): Parser of the forwarded command lines
+        :param command_class(type): SwarmCommand
+        :param path(str): Unix socket to listen on, $HOME/.swarm/sock by default
+        :param workers(int): Number of connections kept alive to the swarm api
+        :param cache_ttl(float): Seconds the container listing is served from memory, 0 disables the cache
+        """
+        path = os.path.expanduser(path or socket_path())
+        if os.path.exists(path):
+            sock = _connect(path)
+            if sock is not None:
+                sock.close()
+                print('swarm serve is already listening on {path}'.format(path=path))
+                exit(1)
+            # left behind by a daemon which did not shut down cleanly
+            os.unlink(path)
+        if not self._share(workers, cache_ttl):
+            return
+        self.stamp = path + '.stamp'
+        server = ThreadingUnixServer(path, self._handler(parser, command_class, workers, cache_ttl))
+        os.chmod(path, 0o600)
+        sys.stdout, sys.stderr = ThreadOutput(sys.stdout), ThreadOutput(sys.stderr)
+        print('Serving swarm commands on {path}'.format(path=path))
+        sys.stdout.flush()
+        # clean up the socket when stopped by kill as well
+        signal.signal(signal.SIGTERM, lambda signum, frame: exit(0))
+        try:
+            server.serve_forever()
+        finally:
+            sys.stdout, sys.stderr = sys.stdout.stream, sys.stderr.stream
+            server.server_close()
+            os.unlink(path)
+            SwarmClient.unshare()
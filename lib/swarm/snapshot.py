@@ -0,0 +1,151 @@
+# -*- coding: utf8 -*-
+
+from __future__ import print_function
+import re
+from array import array
+from fnmatch import translate
+from six.moves import intern
+
+
+# states of a container in the order summary columns are printed, stored by index in a snapshot
+CONTAINER_STATES = ('running', 'paused', 'restarting', 'created', 'exited', 'dead')
+
+# labels of containers which have none, never modified
+_NO_LABELS = {}
+
+
+def _intern(value):
+    # intern() only takes byte strings on Python 2, unicode values are kept as they are
+    try:
+        return intern(value)
+    except TypeError:
+        return value
+
+
+def container_state(container):
+    """
+    Return the state of a container of a listing, derived from Status before api v1.23
+    """
+    state = container.get('State')
+    if state:
+        return state
+    status = container.get('Status') or ''
+    if status.startswith('Up'):
+        return 'paused' if status.endswith('(Paused)') else 'running'
+    if status.startswith('Restarting'):
+        return 'restarting'
+    if status.startswith('Exited'):
+        return 'exited'
+    if status == 'Dead':
+        return 'dead'
+    return 'created'
+
+
+class ContainerSnapshot(object):
+    """
+    Column-oriented copy of a container listing, a container is a row number shared by every column
+    Node, image and status strings are interned since thousands of containers share them,
+    created timestamps and states are kept in arrays, names and nodes are indexed
+    States are indexes of state_names, which starts with CONTAINER_STATES and grows with unknown ones, e.g. removing
+    """
+
+    __slots__ = ('ids', 'names', 'nodes', 'images', 'commands', 'statuses', 'labels',
+                 'created', 'states', 'state_names', 'by_name', 'by_node', '_state_index', '_patterns')
+
+    def __init__(self, containers=()):
+        """
+        :param containers(list): Records of cli.containers(), a row is the position of its record
+        """
+        self.ids, self.names, self.nodes, self.images = [], [], [], []
+        self.commands, self.statuses, self.labels = [], [], []
+        self.created = array('l')
+        self.states = array('B')
+        self.state_names = list(CONTAINER_STATES)
+        self._state_index = dict((state, i) for i, state in enumerate(CONTAINER_STATES))
+        self.by_name = {}
+        self.by_node = {}
+        self._patterns = {}
+        for container in containers:
+            self.append(container)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def append(self, container):
+        row = len(self.ids)
+        # 'Names' includes self container name as well as names of linked containers
+        # which are /node/name/alias, the own name is the one with two slashes
+        node = _intern(container['Names'][0].split('/', 2)[1])
+        name = container['Names'][0].split('/')[-1]
+        for names in container['Names']:
+            if names.count('/') == 2:
+                name = names.split('/')[2]
+                break
+        state_name = container_state(container)
+        state = self._state_index.get(state_name)
+        if state is None:
+            state = self._state_index[state_name] = len(self.state_names)
+            self.state_names.append(state_name)
+        self.ids.append(container['Id'])
+        self.names.append(name)
+        self.nodes.append(node)
+        self.images.append(_intern(container['Image']))
+        self.commands.append(container.get('Command') or '')
+        self.statuses.append(_intern(container.get('Status') or ''))
+        # containers without labels share one empty dict
+        self.labels.append(container.get('Labels') or _NO_LABELS)
+        self.created.append(int(container.get('Created') or 0))
+        self.states.append(state)
+        self.by_name[name] = row
+        rows = self.by_node.get(node)
+        if rows is None:
+            rows = self.by_node[node] = array('l')
+        rows.append(row)
+        return row
+
+    def state(self, row):
+        return self.state_names[self.states[row]]
+
+    def rows(self, limit=None):
+        """
+        Return rows ordered by node name
+        :param limit(HostMatcher): Only keep containers of the matching nodes, all by default
+        """
+        rows = []
+        for node in sorted(self.by_node):
+            if limit is None or node in limit:
+                rows.extend(self.by_node[node])
+        return rows
+
+    def find(self, container):
+        """
+        Return the row of a container by name, full id or id prefix, None if there is none
+        """
+        row = self.by_name.get(container)
+        if row is not None:
+            return row
+        for row, cid in enumerate(self.ids):
+            if cid.startswith(container):
+                return row
+        return None
+
+    def match(self, pattern):
+        """
+        Return rows whose name matches the wildcard pattern, in listing order
+        """
+        regex = self._patterns.get(pattern)
+        if regex is None:
+            regex = self._patterns[pattern] = re.compile(translate(pattern))
+        return [row for row, name in enumerate(self.names) if regex.match(name)]
+
+    def resolve(self, container_list):
+        """
+        Expand wildcard names of container_list into names of the snapshot, other items are kept as they are
+        """
+        names = []
+        for container in container_list:
+            if container.count('*') > 0: # wildcard name
+                names.extend((self.names[row] for row in self.match(container)))
+            else:
+                names.append(container)
+        return names
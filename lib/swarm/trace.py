@@ -0,0 +1,160 @@
+# -*- coding: utf8 -*-
+
+from __future__ import print_function
+import re
+import sys
+import json
+import time
+import threading
+from six.moves.urllib.parse import urlparse
+
+
+class Tracer(object):
+
+    def __init__(self):
+        self.requests = []
+        self.phases = []
+        self.lock = threading.Lock()
+        # connect time of the connection opened by the current thread
+        self._local = threading.local()
+
+    def phase(self, name, start, end):
+        with self.lock:
+            self.phases.append({'name': name, 'start': start, 'end': end})
+
+    def record(self, method, url, start, status=None, size=None, stream=False, first_byte=None, connect=None,
+               error=None):
+        end = time.time()
+        record = {
+            'method': method,
+            # drop the /vX.XX prefix so that paths are comparable across api versions
+            'path': re.sub(r'^/v[0-9.]+/', '/', urlparse(url).path),
+            'status': status,
+            'bytes': size,
+            'stream': stream,
+            'connect': connect,
+            'first_byte': first_byte,
+            'total': end - start,
+            'start': start,
+            'end': end,
+            'error': error,
+        }
+        with self.lock:
+            self.requests.append(record)
+
+    def _record(self, method, url, start, response=None, error=None):
+        connect = getattr(self._local, 'connect', None)
+        if response is None:
+            return self.record(method, url, start, connect=connect, error=error)
+        # elapsed covers sending the request until the headers are parsed
+        first_byte = response.elapsed.total_seconds()
+        # the body of a streamed response is not read yet
+        if response._content is False:
+            length = response.headers.get('Content-Length')
+            return self.record(method, url, start, status=response.status_code,
+                               size=int(length) if length is not None else None, stream=True,
+                               first_byte=first_byte, connect=connect)
+        self.record(method, url, start, status=response.status_code, size=len(response.content or b''),
+                    first_byte=first_byte, connect=connect)
+
+    def _instrument_pool(self, pool):
+        """
+        Time the connect (TCP and TLS handshake) of every connection created by pool
+        """
+        tracer = self
+        new_conn = pool._new_conn
+
+        def _new_conn():
+            conn = new_conn()
+            connect = conn.connect
+
+            def _connect():
+                start = time.time()
+                connect()
+                tracer._local.connect = time.time() - start
+            conn.connect = _connect
+            return conn
+        pool._new_conn = _new_conn
+
+    def _wrap_new_pool(self, new_pool):
+        tracer = self
+
+        def _new_pool(*args, **kwargs):
+            pool = new_pool(*args, **kwargs)
+            tracer._instrument_pool(pool)
+            return pool
+        return _new_pool
+
+    def instrument(self, cli):
+        """
+        Record method, path, status, bytes and latency of every request sent by cli
+        """
+        tracer = self
+        for adapter in cli.adapters.values():
+            poolmanager = getattr(adapter, 'poolmanager', None)
+            if poolmanager is None:
+                continue
+            poolmanager._new_pool = self._wrap_new_pool(poolmanager._new_pool)
+        request = cli.request
+
+        def _request(method, url, *args, **kwargs):
+            tracer._local.connect = None
+            start = time.time()
+            try:
+                response = request(method, url, *args, **kwargs)
+            except Exception as e:
+                tracer._record(method, url, start, error=str(e))
+                raise
+            tracer._record(method, url, start, response=response)
+            return response
+        cli.request = _request
+        return cli
+
+    def _fetch_time(self):
+        """
+        Wall time during which at least one request was in flight
+        """
+        total, end = 0, 0
+        for record in sorted(self.requests, key=lambda record: record['start']):
+            if record['end'] > end:
+                total += record['end'] - max(record['start'], end)
+                end = record['end']
+        return total
+
+    def report(self):
+        phases = dict(((phase['name'], phase['end']-phase['start']) for phase in self.phases))
+        if 'command' in phases:
+            phases['fetch'] = self._fetch_time()
+            phases['render'] = max(phases['command'] - phases['fetch'], 0)
+        return {'phases': phases, 'requests': self.requests}
+
+    def summary(self, out=sys.stderr):
+        ms = lambda seconds: '-' if seconds is None else '{ms:.1f}ms'.format(ms=seconds*1000)
+        titles = ('METHOD', 'PATH', 'STATUS', 'BYTES', 'CONNECT', 'FIRST BYTE', 'TOTAL')
+        rows = []
+        for record in self.requests:
+            status = str(record['status']) if record['status'] is not None else 'error'
+            size = str(record['bytes']) if record['bytes'] is not None else '-'
+            if record['stream']:
+                size += ' (stream)'
+            rows.append((record['method'], record['path'], status, size, ms(record['connect']),
+                         ms(record['first_byte']), ms(record['total'])))
+        length = [len(title) for title in titles]
+        for row in rows:
+            for i, value in enumerate(row):
+                if len(value) > length[i]:
+                    length[i] = len(value)
+        string = ''
+        for row in [titles] + rows:
+            line = ''
+            for i, value in enumerate(row):
+                line += value + ' ' * (length[i]-len(value)+4)
+            string += line.rstrip() + '\n'
+        phases = self.report()['phases']
+        string += ', '.join(('{name} {time}'.format(name=name, time=ms(phases[name]))
+                             for name in ('parse', 'fetch', 'render', 'command') if name in phases))
+        print(string, file=out)
+
+    def dump(self, path):
+        with open(path, 'w') as fp:
+            fp.write(json.dumps(self.report(), indent=4))
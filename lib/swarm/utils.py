@@ -1,9 +1,14 @@
 # -*- coding: utf8 -*-
 
 from __future__ import print_function
+import re
+import sys
 import six
 import json
 import string
+import yaml
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 
 def pyprint(data, decode='utf8', **kwargs):
@@ -14,6 +19,15 @@ def pyprint(data, decode='utf8', **kwargs):
     print(data, **kwargs)
 
 
+def textformat(data, decode='utf8'):
+    """
+    Decode bytes such as error explanation into text
+    """
+    if isinstance(data, bytes):
+        return data.decode(decode)
+    return data
+
+
 def byteformat(size, base=1024, unit='B'):
     """
     Convert byte to KiB / MiB / GiB / TiB if possible
@@ -24,6 +38,43 @@ def byteformat(size, base=1024, unit='B'):
     return byteformat(size/float(base), base, units[units.index(unit)+1])
 
 
+def parse_size(value):
+    """
+    Convert size such as '512 MiB' / '1.5 GB' / '10 B' into bytes
+    """
+    units = {'B': 1, 'KB': 1000, 'MB': 1000**2, 'GB': 1000**3, 'TB': 1000**4,
+             'KIB': 1024, 'MIB': 1024**2, 'GIB': 1024**3, 'TIB': 1024**4}
+    number, _, unit = value.strip().partition(' ')
+    return int(float(number) * units.get(unit.strip().upper() or 'B', 1))
+
+
+def parse_system_status(systemstatus):
+    """
+    Extract nodes from SystemStatus (DriverStatus before api v1.23) of swarm info
+    Return a list of dict with name, addr, status, containers, reserved/total cpus and memory
+    """
+    nodes = []
+    for key, value in systemstatus or []:
+        if key.startswith(' ') and not key.strip().startswith(u'\u2514'):
+            # node line: [' node1', '192.168.1.1:2375']
+            nodes.append({'name': key.strip(), 'addr': value})
+        elif nodes and key.strip().startswith(u'\u2514'):
+            # detail line of the last node: ['  \u2514 Reserved CPUs', '0 / 4']
+            name = key.strip()[1:].strip()
+            node = nodes[-1]
+            if name == 'Status':
+                node['status'] = value
+            elif name == 'Containers':
+                node['containers'] = int(value.split()[0])
+            elif name == 'Reserved CPUs':
+                reserved, total = value.split('/')
+                node['reserved_cpus'], node['cpus'] = int(reserved), int(total)
+            elif name == 'Reserved Memory':
+                reserved, total = value.split('/')
+                node['reserved_memory'], node['memory'] = parse_size(reserved), parse_size(total)
+    return nodes
+
+
 def timeformat(time, unit='second'):
     """
     Convert second to minute / hour if possible
@@ -35,11 +86,137 @@ def timeformat(time, unit='second'):
     return timeformat(time/60, units[units.index(unit)+1])
 
 
+def parse_duration(value):
+    """
+    Convert duration such as 500ms / 30s / 5m / 1h into seconds, plain number is second
+    """
+    units = (('ms', 0.001), ('s', 1), ('m', 60), ('h', 3600))
+    for suffix, factor in units:
+        if value.endswith(suffix):
+            return float(value[:-len(suffix)]) * factor
+    return float(value)
+
+
+def concurrent_map(func, items, workers=10):
+    """
+    Call func on every item with a pool of threads, return results in the order of items
+    """
+    items = list(items)
+    if not items:
+        return []
+    with ThreadPoolExecutor(max_workers=min(workers, len(items))) as executor:
+        return list(executor.map(inherit_output(func), items))
+
+
+def iter_shared(fp, lock, chunk_size=1 << 20):
+    """
+    Yield the content of fp in chunks, so that one file can be streamed to several requests at once
+    Readers of fp share lock and each of them keeps its own offset
+    """
+    offset = 0
+    while True:
+        with lock:
+            fp.seek(offset)
+            chunk = fp.read(chunk_size)
+        if not chunk:
+            return
+        offset += len(chunk)
+        yield chunk
+
+
+def load_spec(path):
+    """
+    Load a YAML or JSON spec file, '-' reads from stdin
+    """
+    try:
+        if path == '-':
+            return yaml.safe_load(sys.stdin)
+        with open(path, 'r') as fp:
+            # JSON is a subset of YAML so both formats are accepted
+            return yaml.safe_load(fp)
+    except yaml.YAMLError as e:
+        raise ValueError(e)
+
+
+def parse_pairs(items, name, sep='='):
+    """
+    Convert ['key=value', ...] into {'key': 'value', ...}
+    """
+    pairs = {}
+    for item in items:
+        if item.count(sep) != 1:
+            raise ValueError('bad format for {name} (expected name{sep}value)'.format(name=name, sep=sep))
+        key, value = item.split(sep)
+        pairs[key] = value
+    return pairs
+
+
+def parse_links(items):
+    """
+    Convert ['name:alias', 'name', ...] into {'name': 'alias', ...}
+    """
+    links = {}
+    for item in items:
+        if item.count(':') == 0:
+            name = alias = item
+        elif item.count(':') == 1:
+            name, alias = item.split(':')
+        else:
+            raise ValueError('bad format for link (expected name:alias)')
+        links[name] = alias
+    return links
+
+
+def parse_ports(items):
+    """
+    Convert published ports into (ports, port_bindings) accepted by create_container/create_host_config
+    expected format: ip:hostPort:containerPort | ip::containerPort | hostPort:containerPort | containerPort
+    """
+    ports = []
+    port_bindings = {}
+    for item in items:
+        if item.count(':') == 0:
+            containerPort = item
+            port_bindings[containerPort] = None
+        elif item.count(':') == 1:
+            hostPort, containerPort = item.split(':')
+            port_bindings[containerPort] = hostPort
+        elif item.count(':') == 2:
+            hostIp, hostPort, containerPort = item.split(':')
+            port_bindings[containerPort] = (hostIp, hostPort) if hostPort else (hostIp,)
+        else:
+            raise ValueError('bad format for publish (expected ip:hostPort:containerPort | ip::containerPort | hostPort:containerPort | containerPort)')
+        if containerPort.find('/udp') > 0:
+            containerPort, protocol = containerPort.split('/')
+            ports.append((containerPort, protocol))
+        else:
+            ports.append(containerPort)
+    return ports, port_bindings
+
+
+def parse_volumes(items):
+    """
+    Return container paths of the volumes
+    expected format: containerPath | hostPath:containerPath | hostPath:containerPath:[ro|rw]
+    """
+    volumes = []
+    for item in items:
+        if item.count(':') == 0:
+            volumes.append(item)
+        elif item.count(':') in (1, 2):
+            volumes.append(item.split(':')[1])
+        else:
+            raise ValueError('bad format of volume (expected containerPath | hostPath:containerPath | hostPath:containerPath:[ro|rw])')
+    return volumes
+
+
 def base_url_found(config):
     try:
         with open(config, 'r') as fp:
             data = json.load(fp)
         try:
+            if data['current'] == 'auto' and data['apis']:
+                return True
             if data['apis'][data['current']]:
                 return True
         except KeyError:
@@ -144,3 +321,213 @@ def expand_hostname_range(line = None):
                 all_hosts.append(hname)
 
         return all_hosts
+
+
+def split_hosts(expression):
+    """
+    Split a comma separated list of host patterns, commas inside [] are kept
+    """
+    patterns, depth, start = [], 0, 0
+    for i, char in enumerate(expression):
+        if char == '[':
+            depth += 1
+        elif char == ']':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            patterns.append(expression[start:i])
+            start = i + 1
+    patterns.append(expression[start:])
+    return [pattern.strip() for pattern in patterns if pattern.strip()]
+
+
+class HostMatcher(object):
+    """
+    Match host names against patterns without expanding them: ranges such as node[001:500:2]-[a:z]
+    as expand_hostname_range() understands them, globs such as web* and comma separated lists of both.
+    Every pattern is compiled into one regular expression plus a bound check per range.
+    """
+
+    def __init__(self, expressions):
+        """
+        :param expressions(list): Host patterns, each one may be a comma separated list
+        Raise ValueError on a malformed range
+        """
+        self.patterns = []
+        for expression in expressions:
+            for pattern in split_hosts(expression):
+                self.patterns.append((pattern,) + self._compile(pattern))
+        # host name -> matched, a cluster has far less nodes than containers
+        self._cache = {}
+
+    def _compile_range(self, nrange, after_glob=False):
+        bounds = nrange.split(':')
+        if len(bounds) != 2 and len(bounds) != 3:
+            raise ValueError("host range must be begin:end or begin:end:step")
+        beg, end = bounds[0] or '0', bounds[1]
+        step = int(bounds[2]) if len(bounds) == 3 else 1
+        if not end:
+            raise ValueError("host range must specify end value")
+        if len(beg) == 1 and beg in string.ascii_letters and len(end) == 1 and end in string.ascii_letters:
+            i_beg, i_end = string.ascii_letters.index(beg), string.ascii_letters.index(end)
+            if i_beg > i_end:
+                raise ValueError("host range must have begin <= end")
+            return '([a-zA-Z])', (string.ascii_letters.index, i_beg, i_end, step)
+        if beg[0] == '0' and len(beg) > 1:
+            if len(beg) != len(end):
+                raise ValueError("host range must specify equal-length begin and end formats")
+            regex = '([0-9]{{{length}}})'.format(length=len(beg))
+        else:
+            # a glob right before must not take leading digits of the number, node*[1:3] does not match node12
+            regex = '(?<![0-9])(0|[1-9][0-9]*)' if after_glob else '(0|[1-9][0-9]*)'
+        return regex, (int, int(beg), int(end), step)
+
+    def _compile(self, pattern):
+        regex, bounds = '', []
+        # odd items are the contents of [...]
+        parts = re.split(r'\[([^\]]*)\]', pattern)
+        for i, part in enumerate(parts):
+            if i % 2:
+                part_regex, bound = self._compile_range(part, after_glob=parts[i-1][-1:] in ('*', '?'))
+                regex += part_regex
+                bounds.append(bound)
+            else:
+                regex += ''.join(('.*' if char == '*' else '.' if char == '?' else re.escape(char) for char in part))
+        return re.compile(regex + '$'), tuple(bounds)
+
+    def _match(self, regex, bounds, host):
+        match = regex.match(host)
+        if match is None:
+            return False
+        for value, (convert, beg, end, step) in zip(match.groups(), bounds):
+            value = convert(value)
+            if not beg <= value <= end or (value - beg) % step:
+                return False
+        return True
+
+    def match(self, host):
+        matched = self._cache.get(host)
+        if matched is None:
+            matched = any((self._match(regex, bounds, host) for _, regex, bounds in self.patterns))
+            self._cache[host] = matched
+        return matched
+
+    def __contains__(self, host):
+        return self.match(host)
+
+    def unmatched(self, hosts):
+        """
+        Return the patterns matching none of hosts, in a single pass over hosts
+        """
+        remaining = list(self.patterns)
+        for host in hosts:
+            if not remaining:
+                break
+            remaining = [item for item in remaining if not self._match(item[1], item[2], host)]
+        return [item[0] for item in remaining]
+
+
+class ThreadOutput(object):
+    """
+    File-like object writing to the buffer of the current thread if it has one, to stream otherwise
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def capture(self, buffer=None):
+        """
+        :param buffer(file): File-like object receiving writes of the current thread, a new StringIO by default
+        """
+        self.local.buffer = buffer if buffer is not None else six.StringIO()
+
+    def release(self):
+        buffer, self.local.buffer = self.local.buffer, None
+        return buffer.getvalue() if hasattr(buffer, 'getvalue') else None
+
+    def write(self, data):
+        buffer = getattr(self.local, 'buffer', None)
+        (buffer if buffer is not None else self.stream).write(data)
+
+    def flush(self):
+        if getattr(self.local, 'buffer', None) is None:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def inherit_output(func):
+    """
+    Wrap func run by worker threads so that it writes to the buffers sys.stdout and sys.stderr
+    capture for the calling thread, e.g. the connection of a command forwarded to `swarm serve`
+    """
+    buffers = [(stream, stream.local.buffer) for stream in (sys.stdout, sys.stderr)
+               if isinstance(stream, ThreadOutput) and getattr(stream.local, 'buffer', None) is not None]
+    if not buffers:
+        return func
+
+    def _func(*args, **kwargs):
+        for stream, buffer in buffers:
+            stream.capture(buffer)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            for stream, _ in buffers:
+                stream.local.buffer = None
+    return _func
+
+
+def project(record, fields):
+    """
+    Keep only fields of record, keys of nested objects are joined by dots, e.g. State.Status
+    """
+    ret = {}
+    for field in fields:
+        value = record
+        for key in field.split('.'):
+            value = value.get(key) if isinstance(value, dict) else None
+        ret[field] = value
+    return ret
+
+
+class JsonWriter(object):
+    """
+    Serialize records to stdout as they are produced, either as a single JSON array (json)
+    or as one JSON document per line (ndjson)
+    """
+
+    def __init__(self, output='json', fields=None, indent=None):
+        """
+        :param output(str): 'json' or 'ndjson'
+        :param fields(list): Only keep these fields of every record, see project()
+        :param indent(int): Indent records of a JSON array, ndjson records always take one line
+        """
+        self.output = output
+        self.fields = fields
+        self.indent = indent if output == 'json' else None
+        self.count = 0
+
+    def write(self, record):
+        if self.fields:
+            record = project(record, self.fields)
+        data = json.dumps(record, sort_keys=True, indent=self.indent)
+        if self.output == 'ndjson':
+            sys.stdout.write(data + '\n')
+        else:
+            sys.stdout.write(('[\n' if self.count == 0 else ',\n') + data)
+        self.count += 1
+
+    def close(self):
+        if self.output == 'json':
+            sys.stdout.write('\n]\n' if self.count else '[]\n')
+        sys.stdout.flush()
+
+
+def print_json(record, output='json', fields=None):
+    """
+    Print a single record, indented (json) or on one line (ndjson)
+    """
+    if fields:
+        record = project(record, fields)
+    print(json.dumps(record, sort_keys=True, indent=4 if output == 'json' else None))
@@ -0,0 +1,39 @@
+# -*- coding: utf8 -*-
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lib'))
+
+from swarm.batch import Batch
+
+
+class ChainsTest(unittest.TestCase):
+
+    def chains(self, *lines):
+        stage = list(enumerate(lines, 1))
+        return [[lineno for lineno, line in chain] for chain in Batch()._chains(stage)]
+
+    def test_distinct_containers_run_concurrently(self):
+        self.assertEqual(self.chains('stop web-1', 'stop web-2', 'ps -a'), [[1], [2], [3]])
+
+    def test_same_container_runs_in_file_order(self):
+        self.assertEqual(self.chains('stop web-1', 'stop web-2', 'rm web-1', 'start web-2'), [[1, 3], [2, 4]])
+
+    def test_patterns(self):
+        self.assertEqual(self.chains('stop web-1', 'stop db-1', 'start web-*'), [[2], [1, 3]])
+        self.assertEqual(self.chains('stop web-*', 'start web-1'), [[1, 2]])
+
+    def test_chains_are_merged(self):
+        self.assertEqual(self.chains('stop a', 'stop b', 'rm a b', 'ps -a'), [[1, 2, 3], [4]])
+
+    def test_options_are_no_names(self):
+        self.assertEqual(self.chains('ps -a', 'images -a'), [[1], [2]])
+
+    def test_unparsable_line(self):
+        self.assertEqual(self.chains('stop "web-1', 'stop web-1'), [[1], [2]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+# -*- coding: utf8 -*-
+
+import io
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lib'))
+
+from swarm.buildreport import BuildReport
+
+
+class BuildReportTest(unittest.TestCase):
+
+    def feed(self, report, *chunks):
+        # chunk i arrives at second i + 1
+        for i, chunk in enumerate(chunks):
+            report.feed(chunk, now=i + 1)
+
+    def test_steps(self):
+        report = BuildReport(start=0)
+        self.feed(report,
+                  'Step 1/3 : FROM busybox\n ---> 2b8fd9751c4c\n',
+                  'Step 2/3 : COPY . /app\n ---> Using cache\n ---> 0a3e5c1f6d2b\n',
+                  'Step 3/3 : RUN make\n ---> Running in 5a1875a2c143\n',
+                  ' ---> f4a090c0516c\nRemoving intermediate container 5a1875a2c143\n',
+                  'Successfully built f4a090c0516c\n')
+        report.finish(now=6)
+        self.assertEqual([step['instruction'] for step in report.steps], ['FROM busybox', 'COPY . /app', 'RUN make'])
+        self.assertEqual([step['total'] for step in report.steps], [3, 3, 3])
+        self.assertEqual([step['layer'] for step in report.steps], ['2b8fd9751c4c', '0a3e5c1f6d2b', 'f4a090c0516c'])
+        self.assertEqual(report.steps[2]['container'], '5a1875a2c143')
+        self.assertEqual([step['duration'] for step in report.steps], [1, 1, 3])
+        self.assertEqual(report.image, 'f4a090c0516c')
+        self.assertEqual(report.upload, 1)
+        self.assertEqual(report.end, 6)
+
+    def test_lines_split_across_chunks(self):
+        report = BuildReport(start=0)
+        self.feed(report, 'Step 1/2 : FROM bu', 'sybox\n --', '-> 2b8fd9751c4c\nStep 2/2 : RUN make', '\n')
+        report.finish(now=5)
+        self.assertEqual([step['instruction'] for step in report.steps], ['FROM busybox', 'RUN make'])
+        self.assertEqual(report.steps[0]['layer'], '2b8fd9751c4c')
+
+    def test_unterminated_last_line(self):
+        report = BuildReport(start=0)
+        self.feed(report, 'Step 1/1 : FROM busybox\n ---> 2b8fd9751c4c\nSuccessfully built 2b8fd9751c4c')
+        report.finish(now=2)
+        self.assertEqual(report.image, '2b8fd9751c4c')
+
+    def test_steps_before_engine_1_13(self):
+        report = BuildReport(start=0)
+        self.feed(report, 'Step 1 : FROM busybox\n ---> 2b8fd9751c4c\n', 'Step 2 : RUN make\n')
+        report.finish(now=3)
+        self.assertEqual([(step['step'], step['total']) for step in report.steps], [(1, None), (2, None)])
+        self.assertEqual(report.steps[1]['instruction'], 'RUN make')
+
+    def test_cache_hits_and_slowest(self):
+        report = BuildReport(start=0)
+        self.feed(report,
+                  'Step 1/4 : FROM busybox\n ---> Using cache\n',
+                  'Step 2/4 : RUN a\n ---> Using cache\n',
+                  'Step 3/4 : RUN b\n',
+                  'Step 4/4 : RUN c\n')
+        report.finish(now=10)
+        self.assertEqual(report.cache_hits, 2)
+        self.assertEqual(report.cache_ratio, 0.5)
+        # cached steps are never the slowest ones
+        self.assertEqual([step['step'] for step in report.slowest()], [4, 3])
+        self.assertEqual(report.to_dict()['slowest'], [4, 3])
+
+    def test_failure(self):
+        report = BuildReport(start=0)
+        self.feed(report, 'Step 1/2 : RUN false\n ---> Running in 5a1875a2c143\n')
+        report.fail('returned a non-zero code: 1', now=4)
+        self.assertEqual(report.error, 'returned a non-zero code: 1')
+        self.assertEqual(report.steps[0]['duration'], 3)
+        self.assertIsNone(report.steps[0]['layer'])
+
+    def test_print_report(self):
+        report = BuildReport(start=0)
+        self.feed(report, 'Step 1/2 : FROM busybox\n ---> Using cache\n ---> 2b8fd9751c4c\n', 'Step 2/2 : RUN make\n')
+        report.finish(now=4)
+        fp = io.StringIO() if sys.version_info[0] > 2 else io.BytesIO()
+        report.print_report(fp)
+        lines = fp.getvalue().splitlines()
+        self.assertEqual(lines[0].split(), ['STEP', 'INSTRUCTION', 'CACHE', 'LAYER', 'DURATION'])
+        self.assertEqual(lines[1].split(), ['1/2', 'FROM', 'busybox', 'yes', '2b8fd9751c4c', '1.0s'])
+        self.assertEqual(lines[3], 'Context upload: 1.0s, cache hits: 1/2 (50%), total: 4.0s')
+        self.assertEqual(lines[4], 'Slowest steps: 2 (2.0s)')
+
+
+if __name__ == '__main__':
+    unittest.main()
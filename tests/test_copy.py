@@ -0,0 +1,84 @@
+# -*- coding: utf8 -*-
+
+import io
+import os
+import sys
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lib'))
+
+from swarm.container import Copy
+
+
+def archive(*members):
+    """
+    Tar of (name, type, content or link target) members, type is one of file, dir, sym, lnk
+    """
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode='w') as tar:
+        for name, kind, value in members:
+            info = tarfile.TarInfo(name)
+            if kind == 'file':
+                info.size = len(value)
+                tar.addfile(info, io.BytesIO(value))
+                continue
+            info.type = {'dir': tarfile.DIRTYPE, 'sym': tarfile.SYMTYPE, 'lnk': tarfile.LNKTYPE}[kind]
+            info.mode = 0o755 if kind == 'dir' else 0o777
+            if kind in ('sym', 'lnk'):
+                info.linkname = value
+            tar.addfile(info)
+    buf.seek(0)
+    return buf
+
+
+class ExtractTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.home = os.environ.get('HOME')
+        os.environ['HOME'] = self.tmp
+        self.outside = os.path.join(self.tmp, 'outside')
+        os.mkdir(self.outside)
+        self.dst = os.path.join(self.tmp, 'dst')
+        self.copy = Copy()
+        self.stderr, sys.stderr = sys.stderr, io.StringIO() if sys.version_info[0] > 2 else io.BytesIO()
+
+    def tearDown(self):
+        sys.stderr = self.stderr
+        if self.home is not None:
+            os.environ['HOME'] = self.home
+        shutil.rmtree(self.tmp)
+
+    def test_renames_root(self):
+        self.copy._extract(archive(('src', 'dir', None), ('src/a.txt', 'file', b'a\n'), ('src/link', 'sym', 'a.txt')),
+                           'src', self.dst)
+        with open(os.path.join(self.dst, 'a.txt'), 'rb') as fp:
+            self.assertEqual(fp.read(), b'a\n')
+        self.assertEqual(os.readlink(os.path.join(self.dst, 'link')), 'a.txt')
+
+    def test_symlink_out_of_dst_is_skipped(self):
+        self.copy._extract(archive(('src', 'dir', None), ('src/link', 'sym', self.outside),
+                                   ('src/link/evil', 'file', b'evil\n')), 'src', self.dst)
+        self.assertEqual(os.listdir(self.outside), [])
+        self.assertFalse(os.path.islink(os.path.join(self.dst, 'link')))
+
+    def test_relative_symlink_out_of_dst_is_skipped(self):
+        self.copy._extract(archive(('src', 'dir', None), ('src/sub', 'dir', None), ('src/sub/up', 'sym', '../../outside'),
+                                   ('src/sub/up/evil', 'file', b'evil\n')), 'src', self.dst)
+        self.assertEqual(os.listdir(self.outside), [])
+        self.assertFalse(os.path.islink(os.path.join(self.dst, 'sub', 'up')))
+
+    def test_paths_out_of_dst_are_skipped(self):
+        self.copy._extract(archive(('src', 'dir', None), ('src/../outside/evil', 'file', b'evil\n'),
+                                   ('other/evil', 'file', b'evil\n'), ('src/lnk', 'lnk', 'other/evil')),
+                           'src', self.dst)
+        self.assertEqual(os.listdir(self.outside), [])
+        self.assertFalse(os.path.exists(os.path.join(self.tmp, 'other')))
+        self.assertEqual(os.listdir(self.dst), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
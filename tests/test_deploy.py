@@ -0,0 +1,52 @@
+# -*- coding: utf8 -*-
+
+import io
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lib'))
+
+from swarm.deploy import Apply
+
+
+class ValidateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.home = os.environ.get('HOME')
+        os.environ['HOME'] = self.tmp
+        self.apply = Apply()
+
+    def tearDown(self):
+        if self.home is not None:
+            os.environ['HOME'] = self.home
+        shutil.rmtree(self.tmp)
+
+    def test_valid_spec(self):
+        services = {'web': {'image': 'nginx', 'replicas': '2'}, 'db': {'image': 'postgres'}}
+        self.assertEqual(self.apply._validate({'services': services}), services)
+
+    def test_invalid_specs(self):
+        for spec in (None, [], {}, {'services': []}, {'services': {'web': None}}, {'services': {'web': {}}},
+                     {'services': {'web': {'image': 'nginx', 'replicas': -1}}},
+                     {'services': {'web': {'image': 'nginx', 'replicas': 'two'}}},
+                     {'services': {'web': {'image': 'nginx', 'replicas': None}}},
+                     {'services': {'web': {'image': 'nginx', 'replicas': [2]}}}):
+            self.assertRaises(ValueError, self.apply._validate, spec)
+
+    def test_invalid_spec_is_reported(self):
+        # the spec is rejected before any request, so no swarm is needed
+        stdout, sys.stdout = sys.stdout, io.StringIO() if sys.version_info[0] > 2 else io.BytesIO()
+        try:
+            self.apply({'services': {'web': {'image': 'nginx', 'replicas': None}}})
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(output, 'Error: service `web` has invalid replicas\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
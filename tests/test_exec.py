@@ -0,0 +1,68 @@
+# -*- coding: utf8 -*-
+
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root, 'lib'))
+sys.path.insert(0, os.path.join(root, 'bench'))
+
+from docker import Client
+from fakeswarm import Cluster, FakeSwarmServer
+from swarm.container import ExecAll
+
+
+class ExecAllTest(unittest.TestCase):
+    """
+    The fake server answers `101 UPGRADED` and sends the first frame together with the headers
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeSwarmServer(('127.0.0.1', 0), Cluster(containers=4, images=1))
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.home = os.environ.get('HOME')
+        os.environ['HOME'] = self.tmp
+        self.exec_all = ExecAll()
+        self.cli = Client(base_url='tcp://127.0.0.1:{port}'.format(port=self.server.server_address[1]))
+
+    def tearDown(self):
+        self.cli.close()
+        if self.home is not None:
+            os.environ['HOME'] = self.home
+        shutil.rmtree(self.tmp)
+
+    def test_output_is_demultiplexed(self):
+        ret = self.exec_all._exec(self.cli, 'svc0-0', ['echo', 'hi'], None, 10)
+        self.assertIsNone(ret['error'])
+        self.assertEqual(ret['stdout'], b'/node0000/svc0-0: echo hi\n')
+        self.assertEqual(ret['stderr'], b'done\n')
+        self.assertEqual(ret['exit_code'], 0)
+
+    def test_without_timeout(self):
+        ret = self.exec_all._exec(self.cli, 'svc1-1', ['false'], None, None)
+        self.assertEqual(ret['stdout'], b'/node0000/svc1-1: false\n')
+        self.assertEqual(ret['exit_code'], 1)
+
+    def test_unknown_container(self):
+        ret = self.exec_all._exec(self.cli, 'nosuch', ['true'], None, 10)
+        self.assertIsNone(ret['exit_code'])
+        self.assertIn('No such container', ret['error'])
+
+
+if __name__ == '__main__':
+    unittest.main()
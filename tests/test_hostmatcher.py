@@ -0,0 +1,64 @@
+# -*- coding: utf8 -*-
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lib'))
+
+from swarm.utils import HostMatcher, split_hosts
+
+
+class HostMatcherTest(unittest.TestCase):
+
+    def test_split_keeps_commas_of_ranges(self):
+        self.assertEqual(split_hosts('web[1,2], db*,node1'), ['web[1,2]', 'db*', 'node1'])
+
+    def test_padded_range(self):
+        matcher = HostMatcher(['node[001:100:2]'])
+        self.assertIn('node001', matcher)
+        self.assertIn('node099', matcher)
+        self.assertNotIn('node002', matcher)
+        self.assertNotIn('node101', matcher)
+        self.assertNotIn('node1', matcher)
+
+    def test_numeric_range(self):
+        matcher = HostMatcher(['web[1:12]'])
+        self.assertIn('web1', matcher)
+        self.assertIn('web12', matcher)
+        self.assertNotIn('web13', matcher)
+        self.assertNotIn('web01', matcher)
+
+    def test_letter_range(self):
+        matcher = HostMatcher(['rack[b:d]-node[1:2]'])
+        self.assertIn('rackc-node2', matcher)
+        self.assertNotIn('racka-node1', matcher)
+        self.assertNotIn('rackd-node3', matcher)
+
+    def test_letter_range_takes_single_letters(self):
+        self.assertRaises(ValueError, HostMatcher, ['node[ab:c]'])
+
+    def test_malformed_range(self):
+        self.assertRaises(ValueError, HostMatcher, ['node[1]'])
+        self.assertRaises(ValueError, HostMatcher, ['node[01:100]'])
+        self.assertRaises(ValueError, HostMatcher, ['node[5:]'])
+
+    def test_glob_before_numeric_range(self):
+        matcher = HostMatcher(['node*[1:3]'])
+        self.assertIn('node-3', matcher)
+        self.assertIn('node2', matcher)
+        # 12 is out of the range, the glob must not take the 1
+        self.assertNotIn('node12', matcher)
+        self.assertNotIn('node-12', matcher)
+
+    def test_globs_and_lists(self):
+        matcher = HostMatcher(['web*', 'db?,cache[1:2]'])
+        self.assertIn('web-eu-1', matcher)
+        self.assertIn('db1', matcher)
+        self.assertIn('cache2', matcher)
+        self.assertNotIn('db10', matcher)
+        self.assertEqual(matcher.unmatched(['web1', 'db1']), ['cache[1:2]'])
+
+
+if __name__ == '__main__':
+    unittest.main()
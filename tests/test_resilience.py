@@ -0,0 +1,107 @@
+# -*- coding: utf8 -*-
+
+import os
+import sys
+import unittest
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lib'))
+
+from swarm.resilience import CircuitBreaker, CircuitOpenError, ConnectError, RetryPolicy, is_idempotent
+
+
+class Response(object):
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class Client(object):
+    """
+    Answers requests with the given outcomes in order, exceptions are raised
+    """
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+
+    def request(self, method, url, *args, **kwargs):
+        self.calls.append((method, url))
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return Response(outcome)
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def test_opens_after_threshold(self):
+        breaker = CircuitBreaker('test', threshold=2, reset_timeout=60)
+        breaker.failure()
+        self.assertTrue(breaker.allow())
+        breaker.failure()
+        self.assertFalse(breaker.allow())
+        self.assertRaises(CircuitOpenError, breaker.check)
+
+    def test_half_open_lets_one_trial_through(self):
+        breaker = CircuitBreaker('test', threshold=1, reset_timeout=60)
+        breaker.failure()
+        breaker.opened -= 60
+        self.assertTrue(breaker.allow())
+        # the trial restarts the timeout
+        self.assertFalse(breaker.allow())
+
+    def test_success_closes(self):
+        breaker = CircuitBreaker('test', threshold=1, reset_timeout=60)
+        breaker.failure()
+        breaker.success()
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.failures, 0)
+
+
+class RetryPolicyTest(unittest.TestCase):
+
+    def setUp(self):
+        CircuitBreaker._breakers.clear()
+        self.policy = RetryPolicy(retries=2, backoff=0)
+
+    def test_idempotent(self):
+        self.assertTrue(is_idempotent('GET', 'http://h/v1.22/containers/json'))
+        self.assertTrue(is_idempotent('POST', 'http://h/v1.22/containers/web/stop'))
+        self.assertFalse(is_idempotent('POST', 'http://h/v1.22/containers/web/restart'))
+        self.assertFalse(is_idempotent('DELETE', 'http://h/v1.22/containers/web'))
+
+    def test_retries_unavailable_reads(self):
+        cli = self.policy.instrument(Client(503, 502, 200), 'retry-reads')
+        self.assertEqual(cli.request('GET', 'http://h/info').status_code, 200)
+        self.assertEqual(len(cli.calls), 3)
+
+    def test_gives_up_after_retries(self):
+        cli = self.policy.instrument(Client(503, 503, 503, 200), 'retry-give-up')
+        self.assertEqual(cli.request('GET', 'http://h/info').status_code, 503)
+        self.assertEqual(len(cli.calls), 3)
+
+    def test_does_not_repeat_sent_writes(self):
+        cli = self.policy.instrument(Client(requests.exceptions.ReadTimeout(), 200), 'retry-writes')
+        self.assertRaises(requests.exceptions.ReadTimeout, cli.request, 'POST', 'http://h/containers/web/restart')
+        self.assertEqual(len(cli.calls), 1)
+
+    def test_repeats_unsent_writes(self):
+        cli = self.policy.instrument(Client(ConnectError(), 204), 'retry-unsent')
+        self.assertEqual(cli.request('POST', 'http://h/containers/web/restart').status_code, 204)
+
+    def test_fails_fast_while_open(self):
+        CircuitBreaker._breakers['retry-open'] = CircuitBreaker('retry-open', threshold=2, reset_timeout=60)
+        cli = self.policy.instrument(Client(503, 503, 503), 'retry-open')
+        # the breaker opens between two retries
+        self.assertRaises(CircuitOpenError, cli.request, 'GET', 'http://h/info')
+        self.assertRaises(CircuitOpenError, cli.request, 'GET', 'http://h/info')
+        self.assertEqual(len(cli.calls), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+# -*- coding: utf8 -*-
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lib'))
+
+from swarm.snapshot import ContainerSnapshot, CONTAINER_STATES, container_state
+
+
+def container(cid, node, name, state=None, status='Up 2 days', labels=None, links=()):
+    record = {'Id': cid, 'Names': ['/{node}/{name}'.format(node=node, name=name)] + list(links),
+              'Image': 'app:1', 'Command': 'run', 'Status': status, 'Created': 1500000000, 'Labels': labels}
+    if state is not None:
+        record['State'] = state
+    return record
+
+
+class ContainerStateTest(unittest.TestCase):
+
+    def test_state_of_listing(self):
+        self.assertEqual(container_state({'State': 'removing'}), 'removing')
+
+    def test_state_from_status(self):
+        self.assertEqual(container_state({'Status': 'Up 2 days'}), 'running')
+        self.assertEqual(container_state({'Status': 'Up 2 days (Paused)'}), 'paused')
+        self.assertEqual(container_state({'Status': 'Exited (0) 1 hour ago'}), 'exited')
+        self.assertEqual(container_state({'Status': 'Restarting (1) 2 seconds ago'}), 'restarting')
+        self.assertEqual(container_state({'Status': ''}), 'created')
+
+
+class ContainerSnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.snapshot = ContainerSnapshot([
+            container('aaa111', 'node2', 'web-1', state='running', labels={'service': 'web'},
+                      links=['/node2/db-1/web-1/db']),
+            container('bbb222', 'node1', 'db-1', state='exited'),
+            container('ccc333', 'node1', 'web-2', state='removing'),
+            container('ddd444', 'node2', 'web-3', state='migrating'),
+            container('eee555', 'node1', 'web-4', state='removing'),
+        ])
+
+    def test_unknown_states_are_kept(self):
+        self.assertEqual([self.snapshot.state(row) for row in range(len(self.snapshot))],
+                         ['running', 'exited', 'removing', 'migrating', 'removing'])
+        self.assertEqual(self.snapshot.state_names[:len(CONTAINER_STATES)], list(CONTAINER_STATES))
+        self.assertEqual(self.snapshot.state_names[len(CONTAINER_STATES):], ['removing', 'migrating'])
+
+    def test_unknown_states_are_not_shared(self):
+        snapshot = ContainerSnapshot([container('fff666', 'node1', 'web-5', state='dead')])
+        self.assertEqual(snapshot.state_names, list(CONTAINER_STATES))
+
+    def test_labels(self):
+        self.assertEqual(self.snapshot.labels[0], {'service': 'web'})
+        self.assertEqual(self.snapshot.labels[1], {})
+        self.assertIs(self.snapshot.labels[1], self.snapshot.labels[2])
+
+    def test_own_name_among_links(self):
+        self.assertEqual(self.snapshot.names[0], 'web-1')
+        self.assertEqual(self.snapshot.nodes[0], 'node2')
+
+    def test_find(self):
+        self.assertEqual(self.snapshot.find('db-1'), 1)
+        self.assertEqual(self.snapshot.find('ccc'), 2)
+        self.assertIsNone(self.snapshot.find('zzz'))
+
+    def test_match_and_resolve(self):
+        self.assertEqual(self.snapshot.match('web-*'), [0, 2, 3, 4])
+        self.assertEqual(self.snapshot.resolve(['db-1', '*-2', 'nosuch']), ['db-1', 'web-2', 'nosuch'])
+
+    def test_rows_by_node(self):
+        self.assertEqual(self.snapshot.rows(), [1, 2, 4, 0, 3])
+        self.assertEqual(self.snapshot.rows(limit=('node2',)), [0, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()